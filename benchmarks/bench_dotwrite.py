@@ -0,0 +1,64 @@
+"""Benchmark writing the DOT file
+
+Run with `python benchmarks/bench_dotwrite.py`.
+
+Compares the per-line awaited writes (`for line in graph: await f.write()`)
+with serializing the source once and writing it with a single call, on a
+graph with 50k edges.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import tempfile
+import time
+
+from graphviz import Digraph
+from panpath import PanPath
+
+NNODES = 10_000
+NEDGES = 50_000
+
+
+def make_graph() -> Digraph:
+    graph = Digraph("bench")
+    for i in range(NNODES):
+        graph.node(f"P{i}", tooltip=f"Process {i}")
+    for i in range(NEDGES):
+        graph.edge(f"P{i % NNODES}", f"P{(i * 7 + 1) % NNODES}")
+    return graph
+
+
+async def per_line(graph: Digraph, dotfile: PanPath) -> None:
+    async with dotfile.a_open("w") as f:
+        for uline in graph:
+            await f.write(uline)
+    # the old path serialized the source again for rendering
+    graph.source
+
+
+async def bulk(graph: Digraph, dotfile: PanPath) -> None:
+    source = graph.source
+    await dotfile.a_write_text(source)
+
+
+def bench(label: str, func, graph: Digraph, dotfile: PanPath) -> float:
+    elapsed = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        asyncio.run(func(graph, dotfile))
+        elapsed = min(elapsed, time.perf_counter() - start)
+    print(f"{label:<10} {elapsed * 1000:9.2f}ms")
+    return elapsed
+
+
+if __name__ == "__main__":
+    graph = make_graph()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dotfile = PanPath(tmpdir) / "diagram.dot"
+        slow = bench("per-line", per_line, graph, dotfile)
+        expected = dotfile.read_text()
+        fast = bench("bulk", bulk, graph, dotfile)
+        assert dotfile.read_text() == expected
+
+    print(f"speedup    {slow / fast:9.2f}x")
@@ -0,0 +1,97 @@
+"""Benchmark the traversal of the hidden processes
+
+Run with `python benchmarks/bench_traversal.py`.
+
+The DAGs are synthetic: each visible process is followed by a chain of
+hidden processes, and the hidden processes between two visible ones can be
+stacked diamonds, where the number of paths doubles with each diamond.
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+from typing import Iterable, List, Tuple
+
+from pipen_diagram.entry import _get_mates
+from synthetic import FakeProc
+
+
+def _get_mate_recursive(proc: FakeProc) -> Iterable[Tuple[FakeProc, bool]]:
+    """The recursive traversal that _get_mates replaced"""
+    for nproc in proc.nexts:
+        if nproc.plugin_opts.get("diagram_hide", False):
+            for nnproc, _ in _get_mate_recursive(nproc):
+                yield (nnproc, True)
+        else:
+            yield (nproc, False)
+
+
+def chain(n: int, hidden_len: int) -> List[FakeProc]:
+    """A chain of visible processes with `hidden_len` hidden ones between
+    each two of them"""
+    procs = []
+    prev = None
+    for i in range(n):
+        proc = FakeProc(f"P{i}", hidden=i % (hidden_len + 1) != 0)
+        if prev is not None:
+            prev.nexts.append(proc)
+        procs.append(proc)
+        prev = proc
+    # the end process must be visible
+    procs[-1].plugin_opts["diagram_hide"] = False
+    return procs
+
+
+def diamonds(n: int, depth: int) -> List[FakeProc]:
+    """Visible processes connected by `depth` stacked hidden diamonds"""
+    procs = []
+    prev = FakeProc("V0")
+    procs.append(prev)
+    while len(procs) < n:
+        for d in range(depth):
+            left = FakeProc(f"L{len(procs)}", hidden=True)
+            right = FakeProc(f"R{len(procs)}", hidden=True)
+            join = FakeProc(f"J{len(procs)}", hidden=True)
+            prev.nexts.extend([left, right])
+            left.nexts.append(join)
+            right.nexts.append(join)
+            procs.extend([left, right, join])
+            prev = join
+        visible = FakeProc(f"V{len(procs)}")
+        prev.nexts.append(visible)
+        procs.append(visible)
+        prev = visible
+    return procs
+
+
+def bench(label: str, procs: List[FakeProc], recursive: bool) -> None:
+    elapsed = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        mates = _get_mates(procs)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    nedges = sum(len(m) for m in mates.values())
+    line = f"{label:<36} procs={len(procs):>6} edges={nedges:>6} "
+    line += f"_get_mates={elapsed * 1000:9.2f}ms"
+    if recursive:
+        start = time.perf_counter()
+        paths = sum(
+            len(list(_get_mate_recursive(proc)))
+            for proc in procs
+            if not proc.plugin_opts["diagram_hide"]
+        )
+        elapsed = time.perf_counter() - start
+        line += f"  recursive={elapsed * 1000:9.2f}ms (paths={paths})"
+    print(line)
+
+
+if __name__ == "__main__":
+    sys.setrecursionlimit(100_000)
+    bench("chain, no hidden", chain(10_000, 0), True)
+    bench("chain, hidden chains of 9", chain(10_000, 9), True)
+    bench("chain, hidden chains of 999", chain(10_000, 999), True)
+    bench("chain, one hidden chain of 9999", chain(10_000, 9_998), False)
+    bench("diamonds, depth 4", diamonds(10_000, 4), True)
+    bench("diamonds, depth 12", diamonds(10_000, 12), True)
+    bench("diamonds, depth 100", diamonds(10_000, 100), False)
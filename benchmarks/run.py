@@ -0,0 +1,186 @@
+"""Benchmark suite of building and rendering the diagrams
+
+Run with `python benchmarks/run.py [options]`, see `--help` for the options.
+
+For each shape of the synthetic pipelines (see `synthetic.py`) and each size,
+the phases of `PipenDiagram.on_start` are timed separately:
+
+- `mates`: the traversal of the hidden processes (`_get_mates`)
+- `add`: adding the nodes and edges to the diagram (`_add_procs`)
+- `build`: `Diagram.build()`
+- `serialize`: serializing the DOT source (`Diagram.graph.source`)
+- `save`: `Diagram.save()`, without the render cache
+
+The results are written to a JSON file, so that they can be compared
+between releases.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+import graphviz
+from panpath import PanPath
+
+import pipen_diagram
+from pipen_diagram.diagram import Diagram
+from pipen_diagram.entry import _add_procs, _get_mates
+from synthetic import SHAPES, pipeline
+
+SIZES = [10, 100, 1_000, 5_000, 20_000]
+
+
+def _timeit(func: Callable[[], Any], repeat: int) -> float:
+    """Run func `repeat` times and return the best time in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench(
+    shape: str,
+    size: int,
+    engine: str,
+    save: bool,
+    repeat: int,
+) -> Dict[str, Any]:
+    """Benchmark a synthetic pipeline
+
+    Args:
+        shape: The shape of the pipeline
+        size: The number of processes
+        engine: The engine to render the diagram
+        save: Whether to benchmark `Diagram.save()`
+        repeat: Number of repeats for each phase, the best time is reported
+
+    Returns:
+        The record of the results
+    """
+    procs, starts = pipeline(shape, size)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        outprefix = PanPath(tmpdir) / "diagram"
+
+        def _new_diagram() -> Diagram:
+            return Diagram(shape, outprefix, savedot=False, engine=engine)
+
+        timings = {"mates": _timeit(lambda: _get_mates(procs), repeat)}
+        mates = _get_mates(procs)
+
+        def _add() -> Diagram:
+            diagram = _new_diagram()
+            _add_procs(diagram, procs, starts, mates)
+            return diagram
+
+        timings["add"] = _timeit(_add, repeat)
+        timings["build"] = _timeit(lambda: _add().build(), repeat) - timings["add"]
+        diagram = _add()
+        diagram.build()
+        timings["serialize"] = _timeit(lambda: diagram.graph.source, repeat)
+        if save:
+            timings["save"] = _timeit(lambda: asyncio.run(diagram.save()), 1)
+
+    return {
+        "shape": shape,
+        "size": size,
+        "nodes": len(diagram.records),
+        "edges": len(diagram.edges)
+        + sum(len(group.edges) for group in diagram.groups.values()),
+        "groups": len(diagram.groups),
+        "hidden": size - len(diagram.records),
+        "timings": timings,
+    }
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--shapes",
+        nargs="+",
+        choices=list(SHAPES),
+        default=list(SHAPES),
+        help="The shapes of the synthetic pipelines",
+    )
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=int,
+        default=SIZES,
+        help="The numbers of processes of the synthetic pipelines",
+    )
+    parser.add_argument(
+        "--engine",
+        default="dot",
+        help="The engine to render the diagrams (a graphviz engine or builtin)",
+    )
+    parser.add_argument(
+        "--save-max",
+        type=int,
+        default=1_000,
+        help=(
+            "Only benchmark Diagram.save() for pipelines up to this size, "
+            "since the layout by `dot` is superlinear"
+        ),
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of repeats for each phase, the best time is reported",
+    )
+    parser.add_argument(
+        "--output",
+        default="benchmark-results.json",
+        help="The JSON file to write the results to",
+    )
+    args = parser.parse_args(argv)
+
+    results = []
+    for shape in args.shapes:
+        for size in args.sizes:
+            record = bench(
+                shape,
+                size,
+                args.engine,
+                save=size <= args.save_max,
+                repeat=args.repeat,
+            )
+            results.append(record)
+            print(
+                f"{shape:<9} {size:>6} "
+                + " ".join(
+                    f"{phase}={elapsed * 1000:.2f}ms"
+                    for phase, elapsed in record["timings"].items()
+                ),
+                file=sys.stderr,
+            )
+
+    with open(args.output, "w") as fout:
+        json.dump(
+            {
+                "meta": {
+                    "pipen_diagram": pipen_diagram.__version__,
+                    "graphviz": graphviz.__version__,
+                    "engine": args.engine,
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                },
+                "results": results,
+            },
+            fout,
+            indent=2,
+        )
+
+
+if __name__ == "__main__":
+    main()
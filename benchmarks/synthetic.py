@@ -0,0 +1,125 @@
+"""Synthetic pipelines for the benchmarks
+
+The processes are lightweight stand-ins with the attributes that the plugin
+reads from pipen processes, so that the benchmarks measure the plugin
+rather than the creation of thousands of `Proc` classes.
+"""
+
+from __future__ import annotations
+
+from typing import Callable, Dict, List, Tuple
+
+
+class FakeGroup:
+    """A stand-in of a process group"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+
+class FakeProc:
+    """A stand-in of a process"""
+
+    def __init__(
+        self,
+        name: str,
+        hidden: bool = False,
+        group: FakeGroup | None = None,
+    ) -> None:
+        self.name = name
+        self.desc = f"Process {name}"
+        self.requires: List[FakeProc] = []
+        self.nexts: List[FakeProc] = []
+        self.plugin_opts = {"diagram_hide": hidden}
+        self.__meta__ = {"procgroup": group}
+
+    def __repr__(self) -> str:
+        return f"<FakeProc:{self.name}>"
+
+
+def link(proc1: FakeProc, proc2: FakeProc) -> None:
+    """Make proc2 depend on proc1"""
+    proc1.nexts.append(proc2)
+    proc2.requires.append(proc1)
+
+
+def chain(n: int) -> List[FakeProc]:
+    """A single chain of processes"""
+    procs = [FakeProc(f"P{i}") for i in range(n)]
+    for proc1, proc2 in zip(procs, procs[1:]):
+        link(proc1, proc2)
+    return procs
+
+
+def fanout(n: int) -> List[FakeProc]:
+    """One start process with all the others depending on it"""
+    procs = [FakeProc(f"P{i}") for i in range(n)]
+    for proc in procs[1:]:
+        link(procs[0], proc)
+    return procs
+
+
+def diamonds(n: int) -> List[FakeProc]:
+    """Stacked diamonds: a -> (b, c) -> d -> (e, f) -> g ..."""
+    procs = [FakeProc("P0")]
+    while len(procs) + 3 <= n:
+        top = procs[-1]
+        left = FakeProc(f"P{len(procs)}")
+        right = FakeProc(f"P{len(procs) + 1}")
+        bottom = FakeProc(f"P{len(procs) + 2}")
+        link(top, left)
+        link(top, right)
+        link(left, bottom)
+        link(right, bottom)
+        procs.extend([left, right, bottom])
+    return procs
+
+
+def groups(n: int, size: int = 20) -> List[FakeProc]:
+    """Process groups of chains, with the first processes of the groups
+    depending on the last processes of the previous groups"""
+    procs: List[FakeProc] = []
+    prev = None
+    for i in range(n):
+        if i % size == 0:
+            group = FakeGroup(f"G{i // size}")
+        proc = FakeProc(f"P{i}", group=group)
+        if prev is not None:
+            link(prev, proc)
+        procs.append(proc)
+        prev = proc
+    return procs
+
+
+def hidden(n: int, every: int = 100) -> List[FakeProc]:
+    """A chain with only every `every`-th process (and the last one) visible"""
+    procs = [
+        FakeProc(f"P{i}", hidden=(i % every != 0 and i != n - 1))
+        for i in range(n)
+    ]
+    for proc1, proc2 in zip(procs, procs[1:]):
+        link(proc1, proc2)
+    return procs
+
+
+SHAPES: Dict[str, Callable[[int], List[FakeProc]]] = {
+    "chain": chain,
+    "fanout": fanout,
+    "diamonds": diamonds,
+    "groups": groups,
+    "hidden": hidden,
+}
+
+
+def pipeline(shape: str, n: int) -> Tuple[List[FakeProc], List[FakeProc]]:
+    """Generate a synthetic pipeline
+
+    Args:
+        shape: The shape of the pipeline, one of SHAPES
+        n: The number of processes
+
+    Returns:
+        The processes and the start processes
+    """
+    procs = SHAPES[shape](n)
+    return procs, [proc for proc in procs if not proc.requires]
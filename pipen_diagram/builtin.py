@@ -0,0 +1,550 @@
+"""A pure-python layered (Sugiyama-style) layout engine and SVG writer,
+used with `diagram_engine = "builtin"` so that the graphviz `dot` executable
+is not needed"""
+
+from __future__ import annotations
+
+from collections import deque
+from itertools import chain
+from typing import TYPE_CHECKING, Dict, List, Mapping, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+from .model import by_name, edges_by_name
+from .status import node_id
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .diagram import Diagram
+
+# The geometry of the layout, in points, as graphviz uses
+NODE_HEIGHT = 36.0
+NODE_PADDING = 16.0
+NODE_MINWIDTH = 54.0
+DUMMY_WIDTH = 4.0
+NODE_SEP = 18.0
+RANK_SEP = 40.0
+MARGIN = 12.0
+GROUP_PADDING = 8.0
+# The width of a character relative to the font size (Helvetica)
+CHAR_WIDTH = 0.6
+# The height of a line of the labels relative to the font size
+LINE_HEIGHT = 1.2
+# Number of the barycenter sweeps to reduce the crossings
+SWEEPS = 4
+
+
+class Layout:
+    """The positions of the nodes, edges and groups of a diagram
+
+    The vertices include the nodes and the dummy vertices on the edges that
+    span multiple layers, so that the edges can be routed around the nodes.
+    """
+
+    def __init__(self) -> None:
+        """Constructor"""
+        self.names: List[str | None] = []  # None for dummy vertices
+        self.groups: List[str | None] = []
+        self.widths: List[float] = []
+        self.heights: List[float] = []
+        self.layers: List[int] = []
+        self.xs: List[float] = []
+        self.ys: List[float] = []
+        # vertex ids of the nodes
+        self.ids: Dict[str, int] = {}
+        # edges: vertex ids along the edge, whether it has hidden procs
+        # and the group it belongs to
+        self.edges: List[Tuple[List[int], bool, str | None]] = []
+        # groups: name => (x0, y0, x1, y1)
+        self.boxes: Dict[str, Tuple[float, float, float, float]] = {}
+        self.width = 0.0
+        self.height = 0.0
+
+    def add_vertex(
+        self,
+        name: str | None,
+        group: str | None,
+        width: float,
+        height: float,
+    ) -> int:
+        """Add a vertex and return its id"""
+        self.names.append(name)
+        self.groups.append(group)
+        self.widths.append(width)
+        self.heights.append(height)
+        self.layers.append(0)
+        self.xs.append(0.0)
+        self.ys.append(0.0)
+        return len(self.names) - 1
+
+
+def _node_size(
+    label: str,
+    attrs: Mapping[str, str],
+) -> Tuple[float, float]:
+    """Estimate the size of a node from its (multi-line) label and attributes"""
+    fontsize = float(attrs.get("fontsize", 14))
+    lines = label.split("\n")
+    width = max(
+        max(map(len, lines)) * fontsize * CHAR_WIDTH + NODE_PADDING,
+        NODE_MINWIDTH,
+    )
+    height = max(NODE_HEIGHT, len(lines) * fontsize * LINE_HEIGHT + NODE_PADDING)
+    if attrs.get("shape") == "diamond":
+        width, height = width * 1.6, height * 1.4
+    return width, height
+
+
+def layout(diagram: Diagram) -> Layout:
+    """Compute the layered layout of a diagram
+
+    The nodes are assigned to layers by the longest path from the start
+    nodes, the crossings are reduced by a few barycenter sweeps (keeping the
+    nodes of a group next to each other) and the nodes are then placed
+    towards the barycenters of their neighbors. All the steps are linear or
+    (for sorting the layers) near-linear in the size of the graph.
+
+    Args:
+        diagram: The diagram, with the nodes and edges added
+
+    Returns:
+        The layout
+    """
+    theme = diagram.theme
+    out = Layout()
+    for record in diagram.records.values():
+        attrs = dict(theme.node)
+        if record.group:
+            attrs.update(theme.group_node)
+        attrs.update(theme.roles[record.role])
+        width, height = _node_size(record.label or record.name, attrs)
+        out.ids[record.name] = out.add_vertex(
+            record.name,
+            record.group,
+            width,
+            height,
+        )
+
+    edges = [
+        (node1.name, node2.name, has_hidden, None)
+        for node1, node2, has_hidden in edges_by_name(diagram.edges)
+    ]
+    for group in by_name(diagram.groups.values()):
+        edges.extend(
+            (node1.name, node2.name, has_hidden, group.name)
+            for node1, node2, has_hidden in edges_by_name(group.edges)
+        )
+
+    # layering, longest path from the sources (Kahn's algorithm)
+    nnodes = len(out.names)
+    succs: List[List[int]] = [[] for _ in range(nnodes)]
+    indegrees = [0] * nnodes
+    for name1, name2, _, _ in edges:
+        succs[out.ids[name1]].append(out.ids[name2])
+        indegrees[out.ids[name2]] += 1
+
+    queue = deque(vid for vid in range(nnodes) if indegrees[vid] == 0)
+    topo = []
+    while queue:
+        vid = queue.popleft()
+        topo.append(vid)
+        for nvid in succs[vid]:
+            out.layers[nvid] = max(out.layers[nvid], out.layers[vid] + 1)
+            indegrees[nvid] -= 1
+            if indegrees[nvid] == 0:
+                queue.append(nvid)
+
+    # split the long edges with dummy vertices
+    ups: List[List[int]] = [[] for _ in range(nnodes)]
+    downs: List[List[int]] = [[] for _ in range(nnodes)]
+    for name1, name2, has_hidden, group in edges:
+        path = [out.ids[name1]]
+        for layer in range(out.layers[path[0]] + 1, out.layers[out.ids[name2]]):
+            dummy = out.add_vertex(None, group, DUMMY_WIDTH, 0.0)
+            out.layers[dummy] = layer
+            ups.append([])
+            downs.append([])
+            path.append(dummy)
+        path.append(out.ids[name2])
+        for vid1, vid2 in zip(path, path[1:]):
+            downs[vid1].append(vid2)
+            ups[vid2].append(vid1)
+        out.edges.append((path, has_hidden, group))
+
+    nlayers = max(out.layers, default=-1) + 1
+    layers: List[List[int]] = [[] for _ in range(nlayers)]
+    seen = set(topo)
+    # topological order first, so that the initial order follows the flow
+    for vid in topo + [v for v in range(len(out.names)) if v not in seen]:
+        layers[out.layers[vid]].append(vid)
+
+    # crossing reduction
+    positions = [0.0] * len(out.names)
+    for layer in layers:
+        for pos, vid in enumerate(layer):
+            positions[vid] = float(pos)
+
+    def _sort_layer(layer: List[int], neighbors: List[List[int]]) -> None:
+        barys = {}
+        for vid in layer:
+            nbrs = neighbors[vid]
+            barys[vid] = (
+                sum(positions[n] for n in nbrs) / len(nbrs)
+                if nbrs
+                else positions[vid]
+            )
+        # keep the members of a group together
+        group_barys: Dict[str, List[float]] = {}
+        for vid in layer:
+            if out.groups[vid]:
+                group_barys.setdefault(out.groups[vid], []).append(barys[vid])
+        group_bary = {
+            group: sum(values) / len(values) for group, values in group_barys.items()
+        }
+        layer.sort(
+            key=lambda vid: (
+                group_bary[out.groups[vid]] if out.groups[vid] else barys[vid],
+                out.groups[vid] or "",
+                barys[vid],
+            )
+        )
+        for pos, vid in enumerate(layer):
+            positions[vid] = float(pos)
+
+    for sweep in range(SWEEPS):
+        if sweep % 2 == 0:
+            for layer in layers[1:]:
+                _sort_layer(layer, ups)
+        else:
+            for layer in reversed(layers[:-1]):
+                _sort_layer(layer, downs)
+
+    # coordinates
+    def _place(layer: List[int], neighbors: List[List[int]]) -> None:
+        desired = []
+        for vid in layer:
+            nbrs = neighbors[vid]
+            desired.append(
+                sum(out.xs[n] for n in nbrs) / len(nbrs) if nbrs else out.xs[vid]
+            )
+        # keep the order and the separation, while staying close to the
+        # desired positions on average
+        prev = None
+        for i, vid in enumerate(layer):
+            x = desired[i]
+            if prev is not None:
+                x = max(
+                    x,
+                    out.xs[prev]
+                    + (out.widths[prev] + out.widths[vid]) / 2.0
+                    + NODE_SEP,
+                )
+            out.xs[vid] = x
+            prev = vid
+        shift = sum(d - out.xs[vid] for d, vid in zip(desired, layer)) / len(layer)
+        for vid in layer:
+            out.xs[vid] += shift
+
+    for layer in layers:
+        x = 0.0
+        for vid in layer:
+            out.xs[vid] = x + out.widths[vid] / 2.0
+            x += out.widths[vid] + NODE_SEP
+    for layer in layers[1:]:
+        _place(layer, ups)
+    for layer in reversed(layers[:-1]):
+        _place(layer, downs)
+
+    # the label of the graph on the top
+    fontsize = float(theme.graph.get("fontsize", 14))
+    top = MARGIN + fontsize * 2.0
+    layer_heights = [0.0] * nlayers
+    for vid, layer in enumerate(out.layers):
+        layer_heights[layer] = max(layer_heights[layer], out.heights[vid])
+    layer_ys = []
+    y = top
+    for height in layer_heights:
+        layer_ys.append(y + height / 2.0)
+        y += height + RANK_SEP
+
+    group_fontsize = float(theme.group.get("fontsize", fontsize))
+    left = min(
+        (x - w / 2.0 for x, w in zip(out.xs, out.widths)),
+        default=0.0,
+    )
+    left -= MARGIN + (GROUP_PADDING if diagram.groups else 0.0)
+    for vid in range(len(out.names)):
+        out.xs[vid] -= left
+        out.ys[vid] = layer_ys[out.layers[vid]]
+
+    for vid, group in enumerate(out.groups):
+        if not group or out.names[vid] is None:
+            continue
+        x0 = out.xs[vid] - out.widths[vid] / 2.0 - GROUP_PADDING
+        x1 = out.xs[vid] + out.widths[vid] / 2.0 + GROUP_PADDING
+        y0 = out.ys[vid] - out.heights[vid] / 2.0 - GROUP_PADDING - group_fontsize
+        y1 = out.ys[vid] + out.heights[vid] / 2.0 + GROUP_PADDING
+        if group in out.boxes:
+            bx0, by0, bx1, by1 = out.boxes[group]
+            x0, y0, x1, y1 = min(x0, bx0), min(y0, by0), max(x1, bx1), max(y1, by1)
+        out.boxes[group] = (x0, y0, x1, y1)
+
+    out.width = max(
+        [x + w / 2.0 for x, w in zip(out.xs, out.widths)]
+        + [box[2] for box in out.boxes.values()]
+        + [left + fontsize * CHAR_WIDTH * len(diagram.graph.name)],
+    ) + MARGIN
+    out.height = max(
+        [y + h / 2.0 for y, h in zip(out.ys, out.heights)]
+        + [box[3] for box in out.boxes.values()]
+        + [top],
+    ) + MARGIN
+    return out
+
+
+def _fmt(value: float) -> str:
+    """Format a coordinate"""
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+
+def _styles(attrs: Mapping[str, str]) -> List[str]:
+    """Get the styles from the attributes"""
+    return [style.strip() for style in attrs.get("style", "").split(",")]
+
+
+def _font(attrs: Mapping[str, str], default_color: str = "black") -> str:
+    """Get the svg attributes of the fonts"""
+    return (
+        f"font-family={quoteattr(attrs.get('fontname', 'Times,serif'))} "
+        f"font-size=\"{_fmt(float(attrs.get('fontsize', 14)))}\" "
+        f"fill={quoteattr(attrs.get('fontcolor', default_color))}"
+    )
+
+
+def _stroke(attrs: Mapping[str, str], styles: List[str]) -> str:
+    """Get the svg attributes of the strokes"""
+    color = attrs.get("color", "black")
+    if attrs.get("peripheries") == "0":
+        color = "none"
+    out = (
+        f"stroke={quoteattr(color)} "
+        f"stroke-width=\"{_fmt(float(attrs.get('penwidth', 1)))}\""
+    )
+    if "dashed" in styles:
+        out += ' stroke-dasharray="5,2"'
+    elif "dotted" in styles:
+        out += ' stroke-dasharray="1,5"'
+    return out
+
+
+def _text_svg(x: float, y: float, label: str, attrs: Mapping[str, str]) -> str:
+    """Render a (multi-line) label centered at a point"""
+    fontsize = float(attrs.get("fontsize", 14))
+    lines = label.split("\n")
+    # the baseline of the first line
+    top = y + fontsize * 0.35 - (len(lines) - 1) * fontsize * LINE_HEIGHT / 2.0
+    return "".join(
+        f'<text text-anchor="middle" x="{_fmt(x)}" '
+        f'y="{_fmt(top + i * fontsize * LINE_HEIGHT)}" {_font(attrs)}>'
+        f"{escape(line)}</text>"
+        for i, line in enumerate(lines)
+    )
+
+
+def _node_svg(
+    x: float,
+    y: float,
+    width: float,
+    height: float,
+    name: str,
+    tooltip: str,
+    attrs: Mapping[str, str],
+    url: str | None = None,
+    label: str | None = None,
+) -> str:
+    """Render a node, with the label (default to the name), linked to the
+    url if given"""
+    styles = _styles(attrs)
+    fill = "none"
+    if "filled" in styles:
+        fill = attrs.get("fillcolor", attrs.get("color", "lightgrey"))
+    paint = f"fill={quoteattr(fill)} {_stroke(attrs, styles)}"
+    shape = attrs.get("shape", "ellipse")
+    if shape == "diamond":
+        points = " ".join(
+            f"{_fmt(px)},{_fmt(py)}"
+            for px, py in (
+                (x, y - height / 2.0),
+                (x + width / 2.0, y),
+                (x, y + height / 2.0),
+                (x - width / 2.0, y),
+            )
+        )
+        outline = f'<polygon points="{points}" {paint}/>'
+    elif shape in ("box", "box3d", "rect", "rectangle", "square"):
+        radius = ' rx="6" ry="6"' if "rounded" in styles else ""
+        outline = (
+            f'<rect x="{_fmt(x - width / 2.0)}" y="{_fmt(y - height / 2.0)}" '
+            f'width="{_fmt(width)}" height="{_fmt(height)}"{radius} {paint}/>'
+        )
+    else:
+        outline = (
+            f'<ellipse cx="{_fmt(x)}" cy="{_fmt(y)}" rx="{_fmt(width / 2.0)}" '
+            f'ry="{_fmt(height / 2.0)}" {paint}/>'
+        )
+
+    content = f"{outline}{_text_svg(x, y, label or name, attrs)}"
+    if url:
+        content = f'<a href={quoteattr(url)} target="_top">{content}</a>'
+    return (
+        f'<g id={quoteattr(node_id(name))} class="node">'
+        f"<title>{escape(tooltip or name)}</title>{content}"
+        "</g>"
+    )
+
+
+def _edge_svg(points: List[Tuple[float, float]], attrs: Mapping[str, str]) -> str:
+    """Render an edge, with the arrowhead at the last point, the label next
+    to the middle of it and the tooltip"""
+    styles = _styles(attrs)
+    color = attrs.get("color", "black")
+    arrowsize = 10.0 * float(attrs.get("arrowsize", 1))
+    (x0, y0), (x1, y1) = points[-2], points[-1]
+    length = max(((x1 - x0) ** 2 + (y1 - y0) ** 2) ** 0.5, 1e-9)
+    ux, uy = (x1 - x0) / length, (y1 - y0) / length
+    # the line ends at the base of the arrowhead
+    bx, by = x1 - ux * arrowsize, y1 - uy * arrowsize
+    path = " ".join(f"{_fmt(px)},{_fmt(py)}" for px, py in points[:-1])
+    head = " ".join(
+        f"{_fmt(px)},{_fmt(py)}"
+        for px, py in (
+            (x1, y1),
+            (bx - uy * arrowsize * 0.35, by + ux * arrowsize * 0.35),
+            (bx + uy * arrowsize * 0.35, by - ux * arrowsize * 0.35),
+        )
+    )
+    label = ""
+    if attrs.get("label"):
+        mid = (len(points) - 1) // 2
+        (mx0, my0), (mx1, my1) = points[mid], points[mid + 1]
+        fontsize = float(attrs.get("fontsize", 14))
+        text = attrs["label"]
+        label = _text_svg(
+            (mx0 + mx1) / 2.0
+            + max(map(len, text.split("\n"))) * fontsize * CHAR_WIDTH / 2.0
+            + NODE_SEP / 3.0,
+            (my0 + my1) / 2.0,
+            text,
+            attrs,
+        )
+    title = f"<title>{escape(attrs['tooltip'])}</title>" if "tooltip" in attrs else ""
+    return (
+        f'<g class="edge">{title}'
+        f'<polyline points="{path} {_fmt(bx)},{_fmt(by)}" fill="none" '
+        f"{_stroke(attrs, styles)}/>"
+        f'<polygon points="{head}" fill={quoteattr(color)} '
+        f"stroke={quoteattr(color)}/>"
+        f"{label}"
+        "</g>"
+    )
+
+
+def render_svg(diagram: Diagram) -> str:
+    """Lay out a diagram and render it into SVG
+
+    Args:
+        diagram: The diagram, with the nodes and edges added
+
+    Returns:
+        The SVG document
+    """
+    theme = diagram.theme
+    lay = layout(diagram)
+    graph_attrs = theme.graph
+    bgcolor = graph_attrs.get("bgcolor", "white")
+    fontcolor = graph_attrs.get("fontcolor", "black")
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8" standalone="no"?>',
+        '<svg xmlns="http://www.w3.org/2000/svg" '
+        f'width="{_fmt(lay.width)}pt" height="{_fmt(lay.height)}pt" '
+        f'viewBox="0 0 {_fmt(lay.width)} {_fmt(lay.height)}">',
+        f'<g id="graph0" class="graph"><title>{escape(diagram.graph.name)}</title>',
+        f'<rect x="0" y="0" width="{_fmt(lay.width)}" '
+        f'height="{_fmt(lay.height)}" fill={quoteattr(bgcolor)} stroke="none"/>',
+        f'<text text-anchor="middle" x="{_fmt(lay.width / 2.0)}" '
+        f'y="{_fmt(MARGIN + float(graph_attrs.get("fontsize", 14)))}" '
+        f"{_font(graph_attrs)}>{escape(diagram.graph.name)}</text>",
+    ]
+
+    group_attrs = theme.group
+    group_styles = _styles(group_attrs)
+    group_fill = "none"
+    if "filled" in group_styles:
+        group_fill = group_attrs.get(
+            "fillcolor", group_attrs.get("color", "lightgrey")
+        )
+    group_fontsize = float(group_attrs.get("fontsize", graph_attrs.get("fontsize", 14)))
+    for name, (x0, y0, x1, y1) in sorted(lay.boxes.items()):
+        label_x, anchor = (x0 + GROUP_PADDING, "start")
+        if group_attrs.get("labeljust") == "r":
+            label_x, anchor = (x1 - GROUP_PADDING, "end")
+        elif group_attrs.get("labeljust") not in ("l", "r"):
+            label_x, anchor = ((x0 + x1) / 2.0, "middle")
+        parts.append(
+            '<g class="cluster">'
+            f"<title>cluster_{escape(name)}</title>"
+            f'<rect x="{_fmt(x0)}" y="{_fmt(y0)}" width="{_fmt(x1 - x0)}" '
+            f'height="{_fmt(y1 - y0)}" fill={quoteattr(group_fill)} '
+            f"{_stroke(group_attrs, [])}/>"
+            f'<text text-anchor="{anchor}" x="{_fmt(label_x)}" '
+            f'y="{_fmt(y0 + GROUP_PADDING + group_fontsize * 0.7)}" '
+            f"{_font({**graph_attrs, **group_attrs}, fontcolor)}>"
+            f"{escape(name)}</text></g>"
+        )
+
+    # the edges by the vertices they connect, to look up their extra attrs
+    edges = {
+        (lay.ids[node1.name], lay.ids[node2.name]): (node1, node2)
+        for node1, node2, _ in chain(
+            diagram.edges,
+            *(group.edges for group in diagram.groups.values()),
+        )
+    }
+    for path, has_hidden, group in lay.edges:
+        attrs: Dict[str, str] = dict(theme.edge)
+        if group:
+            attrs.update(theme.group_edge)
+            if has_hidden:
+                attrs.update(theme.group_edge_hidden)
+        elif has_hidden:
+            attrs.update(theme.edge_hidden)
+        source, target = path[0], path[-1]
+        if (source, target) in edges:
+            attrs.update(diagram.extra_attrs(*edges[(source, target)]))
+        points = [(lay.xs[source], lay.ys[source] + lay.heights[source] / 2.0)]
+        points.extend((lay.xs[vid], lay.ys[vid]) for vid in path[1:-1])
+        points.append((lay.xs[target], lay.ys[target] - lay.heights[target] / 2.0))
+        parts.append(_edge_svg(points, attrs))
+
+    for node, record in diagram.records.items():
+        vid = lay.ids[record.name]
+        attrs = {**theme.node}
+        if record.group:
+            attrs.update(theme.group_node)
+        attrs.update(theme.roles[record.role])
+        attrs.update(diagram.extra_attrs(node))
+        parts.append(
+            _node_svg(
+                lay.xs[vid],
+                lay.ys[vid],
+                lay.widths[vid],
+                lay.heights[vid],
+                record.name,
+                record.tooltip,
+                attrs,
+                record.url,
+                record.label,
+            )
+        )
+
+    parts.append("</g>")
+    parts.append("</svg>")
+    return "\n".join(parts) + "\n"
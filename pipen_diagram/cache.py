@@ -0,0 +1,158 @@
+"""Provides a content-addressed cache for the rendered diagrams"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import time
+from functools import lru_cache
+from hashlib import sha256
+from pathlib import Path
+from typing import Sequence
+
+import graphviz
+from graphviz.backend.dot_command import DOT_BINARY
+from panpath import CloudPath, PanPath
+
+
+@lru_cache(maxsize=None)
+def engine_version() -> str:
+    """Identify the graphviz installation without running `dot -V`
+
+    The python binding version plus the path, size and modification time of
+    the `dot` executable change whenever graphviz is upgraded, so they can
+    stand in for the version reported by the binary itself.
+
+    Returns:
+        A string identifying the graphviz installation
+    """
+    dot = shutil.which(DOT_BINARY)
+    if dot is None:
+        return f"graphviz-{graphviz.__version__}:no-dot"
+
+    stat = os.stat(dot)
+    return f"graphviz-{graphviz.__version__}:{dot}:{stat.st_size}:{stat.st_mtime}"
+
+
+def default_cachedir() -> Path:
+    """Get the default cache directory
+
+    A local user cache directory is used, shared by all the pipelines, so
+    that nothing but the diagrams is left in the output directories, and
+    looking up the cache does not need any remote calls for the cloud ones.
+
+    Returns:
+        The default cache directory
+    """
+    cachehome = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return PanPath(cachehome) / "pipen-diagram"
+
+
+class RenderCache:
+    """A cache of rendered diagrams, keyed by the hash of the DOT source,
+    the theme, the layout engine and the graphviz version
+
+    Args:
+        cachedir: The directory to save the cached files
+        maxsize: The max total size (in bytes) of the cached files
+        maxage: The max age (in seconds) of the cached files
+    """
+
+    def __init__(
+        self,
+        cachedir: Path,
+        maxsize: int = 50 * 1024 * 1024,
+        maxage: float = 30 * 24 * 3600,
+    ) -> None:
+        """Constructor"""
+        self.cachedir = cachedir
+        self.maxsize = maxsize
+        self.maxage = maxage
+
+    @staticmethod
+    def key(
+        source: str,
+        theme: str,
+        engine: str = "dot",
+        args: Sequence[str] = (),
+        extra: str = "",
+    ) -> str:
+        """Compute the cache key
+
+        Args:
+            source: The DOT source of the graph
+            theme: The digest of the theme used to build the graph
+            engine: The layout engine, which is not in the DOT source
+            args: The extra arguments passed to `dot` to render the graph
+            extra: Other options affecting the rendered files
+
+        Returns:
+            The hex digest of the key
+        """
+        hasher = sha256(source.encode())
+        hasher.update(theme.encode())
+        hasher.update(f"-K{engine} {' '.join(args)}".encode())
+        hasher.update(extra.encode())
+        hasher.update(engine_version().encode())
+        return hasher.hexdigest()
+
+    def _entry(self, key: str, fmt: str) -> Path:
+        """Get the path of the cache entry"""
+        return self.cachedir / f"{key}.{fmt}"
+
+    async def fetch(self, key: str, fmt: str, target: Path) -> bool:
+        """Copy the cached file to target if it exists
+
+        Args:
+            key: The cache key
+            fmt: The format of the rendered file
+            target: The target file to copy the cached file to
+
+        Returns:
+            True if it is a cache hit otherwise False
+        """
+        entry = self._entry(key, fmt)
+        if not await entry.a_exists():
+            return False
+
+        await entry.a_copy(target)
+        if not isinstance(entry, CloudPath):
+            # refresh the mtime so recently used entries survive the eviction
+            os.utime(entry)
+        return True
+
+    async def store(self, key: str, fmt: str, rendered: Path) -> None:
+        """Save a rendered file to the cache
+
+        Call `evict()` after storing all the files to remove the stale entries.
+
+        Args:
+            key: The cache key
+            fmt: The format of the rendered file
+            rendered: The rendered file
+        """
+        await self.cachedir.a_mkdir(parents=True, exist_ok=True)
+        await PanPath(rendered).a_copy(self._entry(key, fmt))
+
+    async def evict(self) -> None:
+        """Remove the entries that are too old, and then the least recently
+        used ones until the total size is under `maxsize`"""
+        now = time.time()
+        entries = []
+        async for entry in self.cachedir.a_iterdir():
+            try:
+                stat = await entry.a_stat()
+            except FileNotFoundError:  # pragma: no cover
+                # evicted by another diagram saved at the same time
+                continue
+            if now - stat.st_mtime > self.maxage:
+                await entry.a_unlink(missing_ok=True)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, entry))
+
+        total = sum(entry[1] for entry in entries)
+        for _, size, entry in sorted(entries, key=lambda x: x[0]):
+            if total <= self.maxsize:
+                break
+            await entry.a_unlink(missing_ok=True)
+            total -= size
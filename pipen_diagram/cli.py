@@ -0,0 +1,303 @@
+"""Save the diagrams of pipelines without running them
+
+    pipen-diagram [options] <pipeline> [<pipeline> ...]
+    pipen diagram [options] <pipeline> [<pipeline> ...]
+
+A pipeline is specified as `<module>:<name>` or `/path/to/file.py:<name>`,
+where the name refers to a Pipen object or class, a Proc class or a ProcGroup
+class (see `pipen.utils.load_pipeline()`). The pipelines are loaded without
+running, and their diagrams are saved concurrently, all the renders going
+through the process-wide renderer pool. The diagrams unchanged since they
+were saved last time are skipped.
+
+With `--watch`, the files of the pipelines are polled, and the diagrams of
+the pipelines are saved again when their files change.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib
+import importlib.util
+import json
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Sequence, Tuple
+
+from pipen.cli import CLIPlugin
+
+if TYPE_CHECKING:  # pragma: no cover
+    from pipen import Pipen
+
+__all__ = ("CLIDiagramPlugin",)
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments of the command to the parser"""
+    parser.add_argument(
+        "pipelines",
+        nargs="+",
+        help=(
+            "The pipelines, as `<module>:<name>` or `/path/to/file.py:<name>`, "
+            "where the name refers to a Pipen object or class, a Proc class "
+            "or a ProcGroup class"
+        ),
+    )
+    parser.add_argument(
+        "--outdir",
+        help=(
+            "Save the diagram of each pipeline to `<outdir>/<pipeline name>`, "
+            "instead of the output directory of the pipeline"
+        ),
+    )
+    parser.add_argument(
+        "--format",
+        dest="formats",
+        action="append",
+        help="The formats to render, could be repeated (default: svg)",
+    )
+    parser.add_argument("--theme", help="The theme of the diagrams")
+    parser.add_argument(
+        "--engine",
+        help="The graphviz layout engine, or `builtin`",
+    )
+    parser.add_argument(
+        "--opt",
+        dest="opts",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help=(
+            "Other plugin options, e.g. `--opt diagram_lod=eager`, "
+            "the values are parsed as JSON if possible, could be repeated"
+        ),
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        help=(
+            "Max number of the pipelines to save at the same time "
+            "(default: number of the workers of the renderer pool)"
+        ),
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Save the diagrams even if they are unchanged",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Save the diagrams again when the files of the pipelines change",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        help="The interval in seconds to poll the files with --watch",
+    )
+
+
+def _plugin_opts(args: argparse.Namespace) -> Dict[str, Any]:
+    """The plugin options from the arguments"""
+    opts: Dict[str, Any] = {}
+    for opt in args.opts:
+        key, sep, value = opt.partition("=")
+        if not sep:
+            raise ValueError(f"Expected KEY=VALUE for --opt, got {opt!r}")
+        try:
+            opts[key] = json.loads(value)
+        except json.JSONDecodeError:
+            opts[key] = value
+
+    if args.formats:
+        opts["diagram_formats"] = args.formats
+    if args.theme:
+        opts["diagram_theme"] = args.theme
+    if args.engine:
+        opts["diagram_engine"] = args.engine
+    if args.force:
+        opts["diagram_skip_unchanged"] = False
+    # nothing runs to update or to wait for
+    opts["diagram_live"] = False
+    opts["diagram_background"] = False
+    return opts
+
+
+def _source(spec: str) -> Path | None:
+    """The file that a pipeline is defined in"""
+    modpath = spec.rpartition(":")[0]
+    if Path(modpath).is_file():
+        return Path(modpath)
+
+    try:
+        origin = importlib.util.find_spec(modpath).origin
+    except (ImportError, AttributeError, ValueError):
+        return None
+    return Path(origin) if origin else None
+
+
+def _mtime(path: Path | None) -> float | None:
+    """The mtime of a file, None if it does not exist"""
+    try:
+        return path.stat().st_mtime if path else None
+    except FileNotFoundError:
+        return None
+
+
+async def save(
+    spec: str,
+    args: argparse.Namespace,
+    lock: asyncio.Lock | None = None,
+) -> Tuple[Path, bool]:
+    """Load a pipeline and save its diagram
+
+    Args:
+        spec: The specification of the pipeline
+        args: The parsed arguments
+        lock: The lock to load the pipelines one at a time, since the loading
+            swaps `sys.argv`
+
+    Returns:
+        The rendered file of the diagram, and whether it is saved (False if
+        it is unchanged)
+    """
+    from panpath import PanPath
+    from pipen.utils import load_pipeline
+
+    from .entry import DETAIL_TASKS, save_diagram
+    from .utils import suffix
+
+    opts = _plugin_opts(args)
+    async with lock or asyncio.Lock():
+        pipeline: Pipen = await load_pipeline(spec, argv1p=[], plugin_opts=opts)
+    if args.outdir:
+        pipeline.outdir = PanPath(args.outdir) / pipeline.name
+    outdir = PanPath(pipeline.outdir)
+    await outdir.a_mkdir(parents=True, exist_ok=True)
+
+    saved = await save_diagram(pipeline)
+    # nothing runs while the detail diagrams are rendered in the background
+    task = DETAIL_TASKS.pop(pipeline, None)
+    if task is not None:
+        await task
+    formats = pipeline.config.plugin_opts.get("diagram_formats", ["svg"])
+    minify = pipeline.config.plugin_opts.get("diagram_minify", False)
+    return outdir / f"diagram.{suffix(formats[0], minify)}", saved
+
+
+async def save_all(specs: Sequence[str], args: argparse.Namespace) -> int:
+    """Save the diagrams of the pipelines concurrently
+
+    Args:
+        specs: The specifications of the pipelines
+        args: The parsed arguments
+
+    Returns:
+        The number of the pipelines failed
+    """
+    from . import renderer
+
+    semaphore = asyncio.Semaphore(args.jobs or renderer.RENDERER.workers)
+    lock = asyncio.Lock()
+
+    async def _save(spec: str) -> Tuple[Path, bool]:
+        async with semaphore:
+            return await save(spec, args, lock)
+
+    results = await asyncio.gather(
+        *(_save(spec) for spec in specs),
+        return_exceptions=True,
+    )
+    failed = 0
+    for spec, result in zip(specs, results):
+        if isinstance(result, BaseException):
+            failed += 1
+            print(f"{spec}: failed: {result}", file=sys.stderr)
+        else:
+            outfile, saved = result
+            print(f"{spec}: {outfile}{'' if saved else ' (unchanged)'}")
+    return failed
+
+
+async def watch(specs: Sequence[str], args: argparse.Namespace) -> None:
+    """Save the diagrams of the pipelines again when their files change
+
+    Only the changed pipelines are loaded again, and only their changed
+    diagrams are rendered again (see also the render cache).
+
+    Args:
+        specs: The specifications of the pipelines
+        args: The parsed arguments
+    """
+    sources = {spec: _source(spec) for spec in specs}
+    mtimes = {spec: _mtime(source) for spec, source in sources.items()}
+    while True:
+        await asyncio.sleep(args.interval)
+        changed: List[str] = []
+        for spec, source in sources.items():
+            mtime = _mtime(source)
+            if mtime != mtimes[spec]:
+                mtimes[spec] = mtime
+                changed.append(spec)
+
+        for spec in changed:
+            # the file specs are executed again when loaded, the modules are
+            # cached, so reload them
+            module = sys.modules.get(spec.rpartition(":")[0])
+            if module is not None:
+                importlib.reload(module)
+        if changed:
+            await save_all(changed, args)
+
+
+async def run(args: argparse.Namespace) -> int:
+    """Save the diagrams, and watch the changes if requested
+
+    Args:
+        args: The parsed arguments
+
+    Returns:
+        The number of the pipelines failed in the first round
+    """
+    failed = await save_all(args.pipelines, args)
+    if args.watch:
+        await watch(args.pipelines, args)
+    return failed
+
+
+class CLIDiagramPlugin(CLIPlugin):
+    """Save the diagrams of pipelines without running them"""
+
+    name = "diagram"
+
+    def __init__(self, parser, subparser) -> None:
+        """Constructor"""
+        super().__init__(parser, subparser)
+        add_arguments(subparser)
+
+    def exec_command(self, args: argparse.Namespace) -> None:
+        """Run the command"""
+        try:
+            sys.exit(1 if asyncio.run(run(args)) else 0)
+        except KeyboardInterrupt:  # pragma: no cover, --watch
+            pass
+
+
+def main(argv: List[str] | None = None) -> int:
+    """The entry of `pipen-diagram`"""
+    parser = argparse.ArgumentParser(
+        prog="pipen-diagram",
+        description="Save the diagrams of pipelines without running them",
+    )
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    try:
+        return 1 if asyncio.run(run(args)) else 0
+    except KeyboardInterrupt:  # pragma: no cover, --watch
+        return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
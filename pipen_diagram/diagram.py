@@ -2,14 +2,26 @@
 
 from __future__ import annotations
 
-from copy import deepcopy
+import asyncio
+import json
+import math
+import time
+from contextlib import contextmanager
 from hashlib import sha256
-from tempfile import mkdtemp
+from itertools import chain
+from tempfile import TemporaryDirectory
+from types import MappingProxyType
 from pathlib import Path
 from typing import (
     TYPE_CHECKING,
     Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
     Mapping,
+    NamedTuple,
+    Sequence,
     Set,
     Tuple,
     Type,
@@ -18,10 +30,26 @@ from typing import (
 
 from panpath import CloudPath, PanPath
 from graphviz import Digraph
-from pipen.utils import desc_from_docstring
+from graphviz.backend.dot_command import DOT_BINARY
+
+from .builtin import render_svg
+from .layout import make_layout, pin, read_layout
+from .minify import minify_file
+from .model import MODEL_FORMATS, by_name, edges_by_name, write_model
+from . import renderer
+from .renderer import available_cpus
+from .status import node_id
+from .timings import Timing, format_duration
+from .utils import get_tooltip, suffix
 
 if TYPE_CHECKING:  # pragma: no cover
     from pipen import Proc, ProcGroup
+    from .cache import RenderCache
+
+# Size of the chunks to read from the local files when uploading
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Size of the buffer of the cloud files before each (appending) upload
+UPLOAD_BUFFER_SIZE = 8 * 1024 * 1024
 
 THEMES = dict(
     default={
@@ -54,7 +82,15 @@ THEMES = dict(
             "edge": {"arrowsize": "0.8"},
             # Themes for the group edge with hidden processes
             "edge_hidden": {},
+            # Themes for the summary node of a collapsed group
+            "collapsed": {
+                "shape": "box3d",
+                "style": "filled",
+                "fillcolor": "#eeeeee",
+            },
         },
+        # Basic themes for the nodes and edges on the critical path
+        "critical": {"color": "#ef476f", "penwidth": "2.5"},
     },
     fancy={
         # Basic themes for the graph
@@ -97,7 +133,16 @@ THEMES = dict(
             "edge": {"arrowsize": "0.8"},
             # Themes for the group edge with hidden processes
             "edge_hidden": {},
+            # Themes for the summary node of a collapsed group
+            "collapsed": {
+                "shape": "box3d",
+                "style": "filled",
+                "fillcolor": "#eeeeee",
+                "fontcolor": "#333333",
+            },
         },
+        # Basic themes for the nodes and edges on the critical path
+        "critical": {"color": "#ef476f", "penwidth": "2.5", "peripheries": "1"},
     },
     dark={
         # Basic themes for the graph
@@ -136,7 +181,16 @@ THEMES = dict(
             "edge": {},
             # Themes for the group edge with hidden processes
             "edge_hidden": {},
+            # Themes for the summary node of a collapsed group
+            "collapsed": {
+                "shape": "box3d",
+                "style": "filled",
+                "fillcolor": "#666666",
+                "fontcolor": "#eeeeee",
+            },
         },
+        # Basic themes for the nodes and edges on the critical path
+        "critical": {"color": "#ef476f", "penwidth": "2.5"},
     },
     fancy_dark={
         # Basic themes for the graph
@@ -184,11 +238,200 @@ THEMES = dict(
             "edge": {},
             # Themes for the group edge with hidden processes
             "edge_hidden": {},
+            # Themes for the summary node of a collapsed group
+            "collapsed": {
+                "shape": "box3d",
+                "style": "filled",
+                "fillcolor": "#666666",
+                "fontcolor": "#eeeeee",
+            },
         },
+        # Basic themes for the nodes and edges on the critical path
+        "critical": {"color": "#ef476f", "penwidth": "2.5", "peripheries": "1"},
     },
 )
 
 
+async def upload(src: Path, dst: Path) -> int:
+    """Stream a local file to a (cloud) path in binary chunks
+
+    Args:
+        src: The local file
+        dst: The destination
+
+    Returns:
+        The number of bytes uploaded
+    """
+    kwargs = {}
+    if isinstance(dst, CloudPath):
+        # Cloud file handles upload whenever their buffer is full,
+        # so use a large buffer to avoid many small appending uploads
+        kwargs["chunk_size"] = UPLOAD_BUFFER_SIZE
+
+    nbytes = 0
+    async with PanPath(src).a_open("rb") as fin, dst.a_open("wb", **kwargs) as fout:
+        while True:
+            chunk = await fin.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            await fout.write(chunk)
+            nbytes += len(chunk)
+
+    return nbytes
+
+
+class ResolvedTheme(NamedTuple):
+    """A theme resolved into the attribute tables used to build the graph
+
+    The tables are read-only and shared by all the diagrams using the theme.
+    """
+
+    # The digest of the merged theme items
+    digest: str
+    graph: Mapping[str, str]
+    node: Mapping[str, str]
+    edge: Mapping[str, str]
+    edge_hidden: Mapping[str, str]
+    # The node attributes by role: start, end, collapsed (the summary node of
+    # a collapsed group) and None (normal)
+    roles: Mapping[str | None, Mapping[str, str]]
+    group: Mapping[str, str]
+    group_node: Mapping[str, str]
+    group_edge: Mapping[str, str]
+    group_edge_hidden: Mapping[str, str]
+    # The attributes of the nodes and edges on the critical path
+    critical: Mapping[str, str]
+
+
+# The resolved themes, keyed by the name or the content of the themes
+RESOLVED_THEMES: Dict[Tuple[str, str], ResolvedTheme] = {}
+
+
+def _merge_theme(
+    base: Mapping[str, Any],
+    theme: Mapping[str, Any],
+) -> Dict[str, Any]:
+    """Merge the theme items over the base theme recursively"""
+    out = dict(base)
+    for key, val in theme.items():
+        if isinstance(val, Mapping) and isinstance(out.get(key), Mapping):
+            out[key] = _merge_theme(out[key], val)
+        else:
+            out[key] = val
+    return out
+
+
+def resolve_theme(
+    theme: str | Mapping[str, Any],
+    base: str = "default",
+) -> ResolvedTheme:
+    """Resolve a theme into the attribute tables, only once for each theme
+
+    Args:
+        theme: The theme, could be the name of a theme defined in
+            `pipen_diagram.diagram.THEMES`, or a dict of detailed theme
+            items, which are merged over the base theme.
+        base: The base theme to be based on, when you pass a custom theme
+
+    Returns:
+        The resolved theme
+    """
+    if isinstance(theme, str):
+        cache_key = (theme, "")
+    else:
+        cache_key = (json.dumps(theme, sort_keys=True, default=str), base)
+
+    try:
+        return RESOLVED_THEMES[cache_key]
+    except KeyError:
+        pass
+
+    name = theme if isinstance(theme, str) else base
+    try:
+        items: Mapping[str, Any] = THEMES[name]
+    except KeyError:
+        raise ValueError(f"Theme {name} not found") from None
+
+    if not isinstance(theme, str):
+        items = _merge_theme(items, theme)
+
+    procgroup = dict(items.get("procgroup", {}))
+    group_node = procgroup.pop("node", {})
+    group_edge = procgroup.pop("edge", {})
+    group_collapsed = procgroup.pop("collapsed", {})
+    group_edge_hidden = {
+        **items.get("edge_hidden", {}),
+        **procgroup.pop("edge_hidden", {}),
+    }
+    frozen = MappingProxyType
+    resolved = RESOLVED_THEMES[cache_key] = ResolvedTheme(
+        digest=sha256(
+            json.dumps(items, sort_keys=True, default=str).encode()
+        ).hexdigest(),
+        graph=frozen(dict(items.get("graph", {}))),
+        node=frozen(dict(items.get("node", {}))),
+        edge=frozen(dict(items.get("edge", {}))),
+        edge_hidden=frozen(dict(items.get("edge_hidden", {}))),
+        roles=frozen(
+            {
+                "start": frozen(dict(items.get("start", {}))),
+                "end": frozen(dict(items.get("end", {}))),
+                "collapsed": frozen(dict(group_collapsed)),
+                None: frozen({}),
+            }
+        ),
+        group=frozen(procgroup),
+        group_node=frozen(dict(group_node)),
+        group_edge=frozen(dict(group_edge)),
+        group_edge_hidden=frozen(group_edge_hidden),
+        critical=frozen(dict(items.get("critical", {}))),
+    )
+    return resolved
+
+
+class Node:
+    """The record of a node in the diagram"""
+
+    __slots__ = ("name", "role", "group", "tooltip", "url", "label")
+
+    def __init__(
+        self,
+        name: str,
+        role: str | None,
+        group: str | None,
+        tooltip: str,
+        url: str | None = None,
+        label: str | None = None,
+    ) -> None:
+        """Constructor
+
+        Args:
+            name: The name of the node
+            role: start, end, collapsed or None (a normal node)
+            group: The name of the group the node belongs to
+            tooltip: The tooltip of the node
+            url: The link of the node, e.g. to the detail diagram of a
+                collapsed group
+            label: The label of the node, default to the name
+        """
+        self.name = name
+        self.role = role
+        self.group = group
+        self.tooltip = tooltip
+        self.url = url
+        self.label = label
+
+    def attrs(self) -> Dict[str, str]:
+        """The attributes of the node, other than those from the theme"""
+        attrs = {"id": node_id(self.name), "tooltip": self.tooltip}
+        if self.label:
+            attrs["label"] = self.label
+        if self.url:
+            attrs["URL"] = self.url
+            attrs["target"] = "_top"
+        return attrs
+
+
 class Group:
     """A group of nodes and edges"""
 
@@ -218,61 +461,128 @@ class Group:
 
     def build(self, diagram: Diagram) -> None:
         """Build the group in the graph"""
-        pg_theme = deepcopy(diagram.theme.get("procgroup", {}))
-        pg_theme_node = pg_theme.pop("node", {})
-        pg_theme_edge = pg_theme.pop("edge", {})
-        pg_theme_edge_hidden = diagram.theme.get("edge_hidden", {}).copy()
-        pg_theme_edge_hidden.update(pg_theme.pop("edge_hidden", {}))
+        theme = diagram.theme
         with diagram.graph.subgraph(name=f"cluster_{self.name}") as sub:
-            sub.attr(label=self.name, **pg_theme)
-            sub.node_attr.update(**pg_theme_node)
-            sub.edge_attr.update(**pg_theme_edge)
-
-            for node in self.nodes:
-                if node in diagram.starts:
-                    sub.node(
-                        node.name,
-                        tooltip=(node.desc or desc_from_docstring(node, None) or ""),
-                        **diagram.theme.get("start", {}),
-                    )
-                elif node in diagram.ends:
-                    sub.node(
-                        node.name,
-                        tooltip=(node.desc or desc_from_docstring(node, None) or ""),
-                        **diagram.theme.get("end", {}),
-                    )
-                else:
-                    sub.node(
-                        node.name,
-                        tooltip=(node.desc or desc_from_docstring(node, None) or ""),
-                    )
+            sub.attr(label=self.name, **theme.group)
+            sub.node_attr.update(theme.group_node)
+            sub.edge_attr.update(theme.group_edge)
 
-            for node1, node2, has_hidden in self.edges:
+            for node in by_name(self.nodes):
+                record = diagram.records[node]
+                sub.node(
+                    record.name,
+                    **record.attrs(),
+                    **{**theme.roles[record.role], **diagram.extra_attrs(node)},
+                )
+
+            for node1, node2, has_hidden in edges_by_name(self.edges):
                 sub.edge(
                     node1.name,
                     node2.name,
-                    **(pg_theme_edge_hidden if has_hidden else {}),
+                    **{
+                        **(theme.group_edge_hidden if has_hidden else {}),
+                        **diagram.extra_attrs(node1, node2),
+                    },
                 )
 
 
 class Diagram:
     """Build and save diagrams"""
 
-    def __init__(self, name: str, outprefix: Path, savedot: bool) -> None:
-        """Constructor"""
-        self.graph = Digraph(name.strip())
+    def __init__(
+        self,
+        name: str,
+        outprefix: Path,
+        savedot: bool,
+        cache: RenderCache | None = None,
+        formats: Sequence[str] = ("svg",),
+        engine: str = "dot",
+        collapse_groups: bool | int | Sequence[str] = False,
+        link_details: bool = False,
+        minify: bool | str = False,
+        reuse_layout: bool = False,
+    ) -> None:
+        """Constructor
+
+        Args:
+            name: The name of the diagram
+            outprefix: The output prefix, without the extensions
+            savedot: Whether to save the DOT source
+            cache: The cache of the rendered diagrams
+            formats: The formats to render the diagram to
+            engine: The graphviz layout engine, or "builtin" to use the
+                pure-python layered layout (svg only)
+            collapse_groups: The groups to render as single summary nodes.
+                True for all the groups, an integer for the groups with at
+                least that many processes, or a list of the group names.
+            link_details: Whether to link the summary nodes of the collapsed
+                groups to their detail diagrams (see `detail()`)
+            minify: Whether to minify the svg file, "gzip" to also compress
+                it and save it as svgz
+            reuse_layout: Whether to save the layout, and to start from the
+                layout saved last time (see `pipen_diagram.layout`)
+        """
+        if engine == "builtin" and any(
+            fmt != "svg" and fmt not in MODEL_FORMATS for fmt in formats
+        ):
+            raise ValueError("The builtin engine can only render svg.")
+
+        self.graph = Digraph(
+            name.strip(),
+            engine="dot" if engine == "builtin" else engine,
+        )
         # Add some distance between the label and the graph
         self.graph.attr(label=f"{name.strip()}\n ")
         self.outprefix = outprefix
         self.savedot = savedot
-        self.theme = THEMES["default"]
-        self.nodes: Set[Type[Proc]] = set()
+        self.cache = cache
+        self.formats = formats
+        self.engine = engine
+        self.collapse_groups = collapse_groups
+        self.link_details = link_details
+        self.minify = minify
+        self.reuse_layout = reuse_layout and engine != "builtin"
+        # The machine-readable statistics of building and saving the diagram
+        self.stats: Dict[str, Any] = {
+            "counts": {},
+            "timings": {},
+            "upload": {"files": 0, "bytes": 0},
+            "minify": {"before": 0, "after": 0},
+            "cache_hits": [],
+        }
+        self.theme = resolve_theme("default")
+        # The processes, and the summary nodes of the collapsed groups
+        self.nodes: Set[Type[Proc] | Group] = set()
         self.starts: Set[Type[Proc]] = set()
         self.ends: Set[Type[Proc]] = set()
+        self.records: Dict[Type[Proc] | Group, Node] = {}
         self.groups: MutableMapping[str, Group] = {}
         self.edges: Set[Tuple[Type[Proc], Type[Proc], bool]] = set()
+        # The edges between the processes, before the groups are collapsed
+        self.expanded_edges = self.edges
+        # The hidden processes
+        self.hidden: Set[Type[Proc]] = set()
+        # The collapsed groups and the records of their processes
+        self.collapsed: Dict[str, Group] = {}
+        self.collapsed_records: Dict[Type[Proc], Node] = {}
+        # The nodes and the edges on the critical path, with the labels of
+        # the edges (the time of the hidden processes along them)
+        self.critical_nodes: Set[Any] = set()
+        self.critical_edges: Dict[Tuple[Any, Any], str | None] = {}
+        # The values of the metric of the nodes, the numbers of the items
+        # passed along the edges, and the max of them to scale against
+        self.node_volumes: Dict[Any, float] = {}
+        self.edge_volumes: Dict[Tuple[Any, Any], int] = {}
+        self.volume_tops: Tuple[float, int] = (0, 0)
+        # The layout saved last time, and the positions of the nodes from it
+        self.layout: Dict[str, Any] | None = None
+        self.positions: Dict[str, str] = {}
 
-    def set_theme(self, theme: str | Mapping[str, Any]) -> None:
+    def set_theme(
+        self,
+        theme: str | Mapping[str, Any],
+        base: str = "default",
+    ) -> None:
         """Set the theme
 
         Args:
@@ -281,13 +591,7 @@ class Diagram:
                 items.
             base: The base theme to be based on, when you pass a custom theme
         """
-        if isinstance(theme, dict):
-            self.theme = theme
-        else:
-            try:
-                self.theme = THEMES[theme]  # type: ignore
-            except KeyError:
-                raise ValueError(f"Theme {theme} not found") from None
+        self.theme = resolve_theme(theme, base)
 
     def add_node(
         self,
@@ -302,6 +606,12 @@ class Diagram:
             group: The group name
             role: Is it a start proc, an end proc or None (a normal proc).
         """
+        self.records[node] = Node(
+            node.name,
+            role,
+            group.name if group else None,
+            get_tooltip(node),
+        )
         if role == "start":
             self.starts.add(node)
 
@@ -341,65 +651,655 @@ class Diagram:
 
             self.edges.add((node1, node2, has_hidden))
 
-    def build(self) -> None:
-        """Assemble the graph for compiling"""
-        self.graph.graph_attr.update(self.theme.get("graph", {}))
-        self.graph.attr("node", **self.theme.get("node", {}))
-        self.graph.attr("edge", **self.theme.get("edge", {}))
-        for group in self.groups.values():
-            group.build(self)
+    def add_hidden(self, node: Type[Proc]) -> None:
+        """Add a hidden process, only exported in the model of the diagram
+
+        Args:
+            node: The process
+        """
+        self.hidden.add(node)
+
+    def add_timings(
+        self,
+        timings: Mapping[str, Timing],
+        path: Sequence[Type[Proc]] = (),
+    ) -> None:
+        """Annotate the nodes with the timings of the last run, and mark the
+        critical path
+
+        Should be called after the nodes, the edges and the hidden processes
+        are added.
 
-        for node in self.nodes:
-            if node in self.starts:
-                self.graph.node(
-                    node.name,
-                    tooltip=(node.desc or desc_from_docstring(node, None) or ""),
-                    **self.theme.get("start", {}),
+        Args:
+            timings: The timings of the processes, from `read_timings()`
+            path: The critical path through all the processes, including the
+                hidden ones, from `critical_path()`. The time of the hidden
+                processes is shown on the edges they are hidden along.
+        """
+        for record in self.records.values():
+            timing = timings.get(record.name)
+            if timing:
+                record.label = (
+                    f"{record.name}\n{format_duration(timing.wall)}, "
+                    f"{timing.jobs} job{'s' if timing.jobs > 1 else ''}"
                 )
-            elif node in self.ends:
-                self.graph.node(
-                    node.name,
-                    tooltip=(node.desc or desc_from_docstring(node, None) or ""),
-                    **self.theme.get("end", {}),
+
+        last = None
+        hidden_time = 0.0
+        for node in path:
+            if node in self.hidden:
+                timing = timings.get(node.name)
+                hidden_time += timing.wall if timing else 0.0
+                continue
+
+            self.critical_nodes.add(node)
+            if last is not None:
+                self.critical_edges[(last, node)] = (
+                    f"+{format_duration(hidden_time)}" if hidden_time else None
                 )
+            last, hidden_time = node, 0.0
+
+    def add_volumes(
+        self,
+        values: Mapping[str, Tuple[float, str]],
+        items: Mapping[str, int],
+    ) -> None:
+        """Scale the pen widths of the nodes by a metric of the processes,
+        and those of the edges by the number of the items passed along them
+
+        Should be called after the nodes and the edges are added.
+
+        Args:
+            values: The values of the metric of the processes, and the texts
+                to add to the labels, from `metric_values()`
+            items: The number of the output items (jobs) of the processes
+                in the last run, the number of the items passed along an
+                edge is that of the process the edge starts from
+        """
+        for node, record in self.records.items():
+            try:
+                value, text = values[record.name]
+            except KeyError:
+                continue
+            record.label = f"{record.label or record.name}\n{text}"
+            self.node_volumes[node] = value
+
+        edges = chain(
+            self.edges,
+            *(group.edges for group in self.groups.values()),
+        )
+        for node1, node2, _ in edges:
+            if items.get(node1.name):
+                self.edge_volumes[(node1, node2)] = items[node1.name]
+
+        self.volume_tops = (
+            max(self.node_volumes.values(), default=0),
+            max(self.edge_volumes.values(), default=0),
+        )
+
+    def extra_attrs(self, node: Any, node2: Any = None) -> Dict[str, str]:
+        """The attributes of a node, or an edge from `node` to `node2`, from
+        the volumes, the critical path and the previous layout"""
+        attrs: Dict[str, str] = {}
+        if node2 is None:
+            volume, top = self.node_volumes.get(node), self.volume_tops[0]
+            if node.name in self.positions:
+                attrs["pos"] = self.positions[node.name]
+            if node in self.critical_nodes:
+                attrs.update(self.theme.critical)
+        else:
+            volume, top = self.edge_volumes.get((node, node2)), self.volume_tops[1]
+            if volume is not None:
+                attrs["tooltip"] = f"{volume} item{'s' if volume > 1 else ''}"
+            try:
+                label = self.critical_edges[(node, node2)]
+            except KeyError:
+                pass
             else:
-                self.graph.node(
-                    node.name,
-                    tooltip=(node.desc or desc_from_docstring(node, None) or ""),
-                )
+                attrs.update(self.theme.critical)
+                attrs.pop("peripheries", None)
+                if label:
+                    attrs["label"] = label
 
-        # edges
+        if volume is not None and top > 0:
+            # log scale, so that a few huge processes do not flatten the rest
+            scale = min(math.log1p(volume) / math.log1p(top), 1.0)
+            penwidth = max(1.0 + 4.0 * scale, float(attrs.get("penwidth", 0)))
+            attrs["penwidth"] = f"{penwidth:.2f}"
+        return attrs
+
+    def suffix(self, fmt: str) -> str:
+        """Get the file extension of the rendered file of a format"""
+        return suffix(fmt, self.minify)
+
+    def status_nodes(self) -> Dict[str, str]:
+        """The nodes showing the processes, to color by their statuses
+
+        Returns:
+            The names of the nodes by the names of the processes, the
+            processes of the collapsed groups are shown by their summary nodes
+        """
+        nodes = {
+            record.name: record.name
+            for node, record in self.records.items()
+            if not isinstance(node, Group)
+        }
+        for record in self.collapsed_records.values():
+            nodes[record.name] = record.group
+        return nodes
+
+    def outputs(self) -> List[Path]:
+        """The files saved by `save()`, not including the detail diagrams
+
+        Returns:
+            The files, with the same options as used by `save()`
+        """
+        exts = [self.suffix(fmt) for fmt in self.formats if fmt in MODEL_FORMATS]
+        formats = [fmt for fmt in self.formats if fmt not in MODEL_FORMATS]
+        if self.savedot:
+            exts.append("dot")
+        if self.engine == "builtin":
+            # svg only
+            exts.extend(self.suffix("svg") for _ in formats[:1])
+        else:
+            exts.extend(self.suffix(fmt) for fmt in formats)
+            if formats and self.reuse_layout:
+                exts.append("layout.json")
+
+        return [
+            self.outprefix.with_name(f"{self.outprefix.name}.{ext}")
+            for ext in exts
+        ]
+
+    @contextmanager
+    def timeit(self, phase: str) -> Iterator[None]:
+        """Time a phase, the time is added to `stats["timings"][phase]`
+
+        Args:
+            phase: The name of the phase
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings = self.stats["timings"]
+            timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - start
+
+    def _to_collapse(self, group: Group) -> bool:
+        """Check if a group should be collapsed"""
+        spec = self.collapse_groups
+        if isinstance(spec, bool):
+            return spec
+        if isinstance(spec, int):
+            return len(group.nodes) >= spec
+        if isinstance(spec, str):
+            return group.name == spec
+        return group.name in spec
+
+    def _collapse(self) -> None:
+        """Replace the collapsed groups with summary nodes
+
+        The summary node of a group takes the place of the group in the
+        records, keyed by the `Group` object, and the edges from or to the
+        processes of the group are aggregated into edges from or to the
+        summary node. An aggregated edge is shown as having hidden processes
+        only if all the edges it aggregates have.
+        """
+        if self.collapse_groups is False:
+            return
+
+        summaries: Dict[str, Group] = {}
+        for name, group in list(self.groups.items()):
+            if not self._to_collapse(group):
+                continue
+
+            summaries[name] = self.collapsed[name] = self.groups.pop(name)
+            for node in group.nodes:
+                self.collapsed_records[node] = self.records.pop(node)
+            self.records[group] = Node(
+                name,
+                "collapsed",
+                None,
+                f"{len(group.nodes)} processes collapsed",
+                url=(
+                    f"{self.outprefix.name}.{name}.{self.suffix('svg')}"
+                    if self.link_details
+                    else None
+                ),
+            )
+            self.nodes.add(group)
+
+        if not summaries:
+            return
+
+        def _summary(node: Type[Proc]) -> Type[Proc] | Group:
+            record = self.collapsed_records.get(node)
+            return summaries[record.group] if record else node
+
+        self.expanded_edges = self.edges
+        edges: Dict[Tuple[Any, Any], bool] = {}
         for node1, node2, has_hidden in self.edges:
+            node1, node2 = _summary(node1), _summary(node2)
+            if node1 is node2:
+                continue
+            edges[(node1, node2)] = edges.get((node1, node2), True) and has_hidden
+        self.edges = {
+            (node1, node2, has_hidden)
+            for (node1, node2), has_hidden in edges.items()
+        }
+
+        # keep the processes of the collapsed groups for the detail diagrams
+        self.critical_nodes.update(
+            [_summary(node) for node in self.critical_nodes]
+        )
+        for (node1, node2), label in list(self.critical_edges.items()):
+            node1, node2 = _summary(node1), _summary(node2)
+            if node1 is not node2:
+                self.critical_edges.setdefault((node1, node2), label)
+
+        for group in summaries.values():
+            volumes = [
+                self.node_volumes[node]
+                for node in group.nodes
+                if node in self.node_volumes
+            ]
+            if volumes:
+                self.node_volumes[group] = sum(volumes)
+        for (node1, node2), count in list(self.edge_volumes.items()):
+            summary1, summary2 = _summary(node1), _summary(node2)
+            if summary1 is summary2 or (summary1, summary2) == (node1, node2):
+                continue
+            self.edge_volumes[(summary1, summary2)] = (
+                self.edge_volumes.get((summary1, summary2), 0) + count
+            )
+
+    def detail(self, name: str, savedot: bool | None = None) -> Diagram:
+        """Create the detail diagram of a group
+
+        The diagram is saved to `<outprefix>.<name>.*`, with the processes
+        of the group and the edges between them.
+
+        Args:
+            name: The name of the group, collapsed or not
+            savedot: Whether to save the DOT source, default to `savedot` of
+                this diagram
+
+        Returns:
+            The detail diagram, to be built and saved
+        """
+        if name in self.collapsed:
+            group, records = self.collapsed[name], self.collapsed_records
+        else:
+            group, records = self.groups[name], self.records
+
+        diagram = self.__class__(
+            name,
+            self.outprefix.with_name(f"{self.outprefix.name}.{name}"),
+            self.savedot if savedot is None else savedot,
+            cache=self.cache,
+            formats=self.formats,
+            engine=self.engine,
+            minify=self.minify,
+            reuse_layout=self.reuse_layout,
+        )
+        diagram.theme = self.theme
+        for node in group.nodes:
+            record = records[node]
+            diagram.records[node] = Node(
+                record.name,
+                record.role,
+                None,
+                record.tooltip,
+                label=record.label,
+            )
+            diagram.nodes.add(node)
+        diagram.edges.update(group.edges)
+        diagram.critical_nodes = self.critical_nodes
+        diagram.critical_edges = self.critical_edges
+        diagram.node_volumes = self.node_volumes
+        diagram.edge_volumes = self.edge_volumes
+        diagram.volume_tops = self.volume_tops
+        return diagram
+
+    async def save_details(
+        self,
+        names: Iterable[str],
+        jobs: int | None = None,
+        savedot: bool | None = None,
+    ) -> None:
+        """Build and save the detail diagrams of the groups concurrently
+
+        Args:
+            names: The names of the groups
+            jobs: Max number of the diagrams to render at the same time,
+                default to the number of available cores
+            savedot: Whether to save the DOT sources, so that the diagrams
+                can be rendered again on request (see
+                `pipen_diagram.lod.render_detail()`), default to `savedot`
+                of this diagram
+        """
+        semaphore = asyncio.Semaphore(jobs or available_cpus())
+
+        async def _save_detail(name: str) -> None:
+            async with semaphore:
+                detail = self.detail(name, savedot)
+                await detail.load_layout()
+                detail.build()
+                await detail.save()
+
+        with self.timeit("details"):
+            await asyncio.gather(*(_save_detail(name) for name in names))
+
+    def _layout_file(self, outprefix: Path) -> Path:
+        """The file of the layout for an output prefix"""
+        return outprefix.with_name(f"{outprefix.name}.layout.json")
+
+    def _layout_items(
+        self,
+    ) -> Tuple[Dict[str, str | None], List[Tuple[str, str]]]:
+        """The groups of the nodes in the graph, and the edges, by names"""
+        nodes = {record.name: record.group for record in self.records.values()}
+        edges = [
+            (node1.name, node2.name)
+            for node1, node2, _ in chain(
+                self.edges,
+                *(group.edges for group in self.groups.values()),
+            )
+        ]
+        return nodes, edges
+
+    async def load_layout(self) -> None:
+        """Read the layout saved last time, to start the layout from when
+        the graph is built, if `reuse_layout` is enabled"""
+        if self.reuse_layout:
+            with self.timeit("layout"):
+                self.layout = await read_layout(self._layout_file(self.outprefix))
+
+    def build(self) -> None:
+        """Assemble the graph for compiling"""
+        with self.timeit("build"):
+            self._collapse()
+            # the graph is not needed to export the model only
+            if self.savedot or any(
+                fmt not in MODEL_FORMATS for fmt in self.formats
+            ):
+                self._build()
+
+        counts = self.stats["counts"]
+        counts["nodes"] = len(self.records)
+        counts["edges"] = len(self.edges) + sum(
+            len(group.edges) for group in self.groups.values()
+        )
+        counts["groups"] = len(self.groups)
+        counts["collapsed"] = len(self.collapsed)
+        counts["pinned"] = sum(pos.endswith("!") for pos in self.positions.values())
+
+    def _build(self) -> None:
+        """Assemble the graph"""
+        self.graph.graph_attr.update(self.theme.graph)
+        if self.layout is not None:
+            self.positions = pin(self.layout, *self._layout_items()) or {}
+        if self.positions:
+            # only the nodes not pinned are laid out again, which dot does
+            # not support, the groups are still drawn as clusters by neato
+            self.graph.engine = "neato"
+            self.graph.graph_attr.update(inputscale="72", splines="true")
+        self.graph.attr("node", **self.theme.node)
+        self.graph.attr("edge", **self.theme.edge)
+        for group in by_name(self.groups.values()):
+            group.build(self)
+
+        for node in by_name(self.nodes):
+            record = self.records[node]
+            self.graph.node(
+                record.name,
+                **record.attrs(),
+                **{**self.theme.roles[record.role], **self.extra_attrs(node)},
+            )
+
+        # edges
+        for node1, node2, has_hidden in edges_by_name(self.edges):
             self.graph.edge(
                 node1.name,
                 node2.name,
-                **(self.theme.get("edge_hidden", {}) if has_hidden else {}),
+                **{
+                    **(self.theme.edge_hidden if has_hidden else {}),
+                    **self.extra_attrs(node1, node2),
+                },
+            )
+
+    async def _render(
+        self,
+        source: str,
+        fmt: str,
+        outfile: Path | None = None,
+        engine: str | None = None,
+        args: Sequence[str] = (),
+    ) -> bytes:
+        """Render the graph with the process-wide renderer, so that the
+        event loop is not blocked while `dot` is running
+
+        Args:
+            source: The DOT source of the graph
+            fmt: The output format
+            outfile: The output file, or None to return the output
+            engine: The layout engine, default to the engine of the graph
+            args: Extra arguments to pass to `dot`
+
+        Returns:
+            The output if outfile is None, otherwise empty bytes
+        """
+        cmd = [DOT_BINARY, f"-K{engine or self.graph.engine}", *args, f"-T{fmt}"]
+        with self.timeit("dot"):
+            stdout = await renderer.RENDERER.render(cmd, source)
+        if outfile is None:
+            return stdout
+
+        await PanPath(outfile).a_write_bytes(stdout)
+        return b""
+
+    async def _upload(self, src: Path, dst: Path) -> None:
+        """Upload a file and record the statistics"""
+        with self.timeit("upload"):
+            nbytes = await upload(src, dst)
+        self.stats["upload"]["files"] += 1
+        self.stats["upload"]["bytes"] += nbytes
+
+    async def _minify(self, rendered: Path) -> Path:
+        """Minify a rendered svg file if enabled
+
+        Args:
+            rendered: The local rendered svg file
+
+        Returns:
+            The minified file, which is the rendered file itself unless it
+            is compressed to svgz
+        """
+        if not self.minify:
+            return rendered
+
+        minified = rendered.with_suffix(f".{self.suffix('svg')}")
+        with self.timeit("minify"):
+            before, after = await asyncio.get_running_loop().run_in_executor(
+                None,
+                minify_file,
+                rendered,
+                minified,
+                1,
+                self.minify == "gzip",
+            )
+        self.stats["minify"]["before"] += before
+        self.stats["minify"]["after"] += after
+        return minified
+
+    async def _save_model(self, outprefix: Path, fmt: str) -> None:
+        """Export the model of the diagram, without graphviz
+
+        Args:
+            outprefix: The local output prefix
+            fmt: One of the model formats
+        """
+        modelfile = outprefix.with_name(f"{outprefix.name}.{self.suffix(fmt)}")
+        with self.timeit("model"):
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                write_model,
+                self,
+                fmt,
+                str(modelfile),
+            )
+        if outprefix != self.outprefix:
+            await self._upload(
+                modelfile,
+                self.outprefix.with_name(
+                    f"{self.outprefix.name}.{self.suffix(fmt)}"
+                ),
             )
 
+    async def _save_layout(self, outprefix: Path, laid_out: str) -> None:
+        """Save the positions of the nodes of the laid out graph
+
+        Args:
+            outprefix: The local output prefix
+            laid_out: The laid out DOT source
+        """
+        layoutfile = self._layout_file(outprefix)
+        await layoutfile.a_write_text(
+            make_layout(laid_out, *self._layout_items(), bool(self.positions))
+        )
+        if outprefix != self.outprefix:
+            await self._upload(layoutfile, self._layout_file(self.outprefix))
+
     async def save(self) -> None:
         """Save the graph"""
         outprefix = self.outprefix
         # in case pipeline outdir is not created
         await outprefix.parent.a_mkdir(parents=True, exist_ok=True)
 
-        if isinstance(outprefix, CloudPath):
+        with self.timeit("save"):
+            if not isinstance(outprefix, CloudPath):
+                await self._save(outprefix)
+                return
+
+            # render locally and upload the files
             dig = sha256(str(outprefix).encode()).hexdigest()[:8]
-            outprefix = PanPath(mkdtemp(suffix=dig)) / outprefix.name
+            with TemporaryDirectory(suffix=dig) as tmpdir:
+                await self._save(PanPath(tmpdir) / outprefix.name)
 
+    async def _save(self, outprefix: Path) -> None:
+        """Save the graph to a local output prefix, and upload the files
+        if the real output prefix is on the cloud
+
+        Args:
+            outprefix: The local output prefix
+        """
+        formats = [fmt for fmt in self.formats if fmt not in MODEL_FORMATS]
+        for fmt in self.formats:
+            if fmt in MODEL_FORMATS:
+                await self._save_model(outprefix, fmt)
+
+        if not formats and not self.savedot:
+            return
+
+        # serialize the graph only once for the dot file, the cache and `dot`
+        with self.timeit("serialize"):
+            source = self.graph.source
         if self.savedot:
             dotfile = outprefix.with_name(f"{outprefix.name}.dot")
-            # self.graph.save(dotfile)
-            async with dotfile.a_open("w") as f:
-                for uline in self.graph:
-                    await f.write(uline)
+            await dotfile.a_write_text(source)
 
             if outprefix != self.outprefix:  # cloud
-                await self.outprefix.with_name(f"{outprefix.name}.dot").a_write_text(
-                    await dotfile.a_read_text()
+                await self._upload(
+                    dotfile,
+                    self.outprefix.with_name(f"{self.outprefix.name}.dot"),
                 )
 
-        rendered_file = self.graph.render(outprefix, format="svg", cleanup=True)
-        if outprefix != self.outprefix:
-            await self.outprefix.with_name(f"{self.outprefix.name}.svg").a_write_text(
-                await PanPath(rendered_file).a_read_text()
+        if not formats:
+            return
+
+        if self.engine == "builtin":
+            rendered_file = outprefix.with_name(f"{outprefix.name}.svg")
+            with self.timeit("render"):
+                svg = await asyncio.get_running_loop().run_in_executor(
+                    None,
+                    render_svg,
+                    self,
+                )
+                await rendered_file.a_write_text(svg)
+            rendered_file = await self._minify(rendered_file)
+            if outprefix != self.outprefix:
+                await self._upload(
+                    rendered_file,
+                    self.outprefix.with_name(
+                        f"{self.outprefix.name}.{self.suffix('svg')}"
+                    ),
+                )
+            return
+
+        outfiles = {
+            fmt: self.outprefix.with_name(
+                f"{self.outprefix.name}.{self.suffix(fmt)}"
+            )
+            for fmt in formats
+        }
+        # Lay out the graph only once for all the formats, see below
+        layout_once = len(formats) > 1 or self.reuse_layout
+        if self.cache is not None:
+            cache_key = self.cache.key(
+                source,
+                self.theme.digest,
+                self.graph.engine,
+                ("-Tdot", "-Kneato", "-n2") if layout_once else (),
+                extra=f"minify={self.minify}",
             )
+            with self.timeit("cache"):
+                # the layout is saved with the rendered files, without it,
+                # the graph is laid out and all the formats are rendered again
+                if not self.reuse_layout or await self.cache.fetch(
+                    cache_key,
+                    "layout.json",
+                    self._layout_file(self.outprefix),
+                ):
+                    for fmt in formats:
+                        if await self.cache.fetch(cache_key, fmt, outfiles[fmt]):
+                            self.stats["cache_hits"].append(fmt)
+                            del outfiles[fmt]
+
+        if not outfiles:
+            return
+
+        engine, args = None, ()
+        if layout_once:
+            # Lay out the graph only once, and render all the formats from
+            # the positions (neato -n2 keeps the positions of nodes and edges)
+            with self.timeit("layout"):
+                source = (await self._render(source, "dot")).decode()
+            engine, args = "neato", ("-n2",)
+            if self.reuse_layout:
+                await self._save_layout(outprefix, source)
+
+        rendered_files = {
+            fmt: outprefix.with_name(f"{outprefix.name}.{fmt}") for fmt in outfiles
+        }
+
+        async def _render_format(fmt: str) -> None:
+            await self._render(source, fmt, rendered_files[fmt], engine, args)
+            if fmt == "svg":
+                rendered_files[fmt] = await self._minify(rendered_files[fmt])
+            if outprefix != self.outprefix:
+                await self._upload(rendered_files[fmt], outfiles[fmt])
+
+        with self.timeit("render"):
+            await asyncio.gather(*(_render_format(fmt) for fmt in outfiles))
+
+        if self.cache is not None:
+            with self.timeit("cache"):
+                for fmt, rendered_file in rendered_files.items():
+                    await self.cache.store(cache_key, fmt, rendered_file)
+                if self.reuse_layout:
+                    await self.cache.store(
+                        cache_key,
+                        "layout.json",
+                        self._layout_file(outprefix),
+                    )
+                await self.cache.evict()
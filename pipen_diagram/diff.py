@@ -0,0 +1,539 @@
+"""Compare the diagrams of two versions of a pipeline
+
+The diagrams are compared by their models (see `model`): the nodes, the edges
+and the groups, from the `Diagram` objects, or from the saved model files
+(`diagram.model.json` or `diagram.model.msgpack`) or DOT files (`diagram.dot`).
+The union of the two diagrams is rendered in one file, with the nodes, edges
+and groups added, removed or changed highlighted:
+
+    python -m pipen_diagram.diff <old>/diagram.model.json \\
+        <new>/diagram.model.json -o diagram.diff.svg
+
+The union is laid out with `dot`, keeping the groups as clusters. For the
+large diagrams, the positions are kept stable instead: the positions of the
+old diagram, from its saved layout (see `layout`) or laid out again, seed the
+layout of the union (with `neato`), where only the changed neighbourhood (the
+nodes changed, and their neighbours) is laid out again, and the other nodes
+are pinned to where they were. The small diagrams are only pinned the same way
+as by `diagram_reuse_layout` if the layout of the old diagram is saved,
+otherwise the nodes may move, as `dot` does not take the positions.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import shlex
+from itertools import chain
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Set,
+    Tuple,
+)
+
+from graphviz import Digraph
+from graphviz.backend.dot_command import DOT_BINARY
+from panpath import PanPath
+
+from . import renderer
+from .diagram import ResolvedTheme, resolve_theme
+from .layout import (
+    SEED_OFFSET,
+    neighbourhood,
+    parse_dot,
+    pin,
+    read_layout,
+    seed,
+)
+from .model import MODEL_FORMATS, model_dict
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .diagram import Diagram
+
+# Lay out only the changed neighbourhood of the diagrams with more nodes
+LOCAL_LAYOUT_NODES = 100
+# The highlights of the elements added, removed or changed
+DIFF_STYLES = {
+    "added": {"color": "#06d6a0", "penwidth": "2.5"},
+    "removed": {"color": "#ef476f", "penwidth": "2.5", "style": "dashed"},
+    "changed": {"color": "#ffb703", "penwidth": "2.5"},
+}
+# The line styles, replaced by the highlights
+LINE_STYLES = {"solid", "dashed", "dotted", "bold"}
+# The extensions of the saved diagrams to load, see `load_model()`
+SOURCE_EXTS = (".dot", ".gv", *(f".{ext}" for ext in MODEL_FORMATS.values()))
+
+# The name, and the nodes, edges and groups by their names
+Model = Dict[str, Any]
+
+
+class Changes(NamedTuple):
+    """The elements added, removed or changed"""
+
+    added: List[Any]
+    removed: List[Any]
+    changed: List[Any]
+
+
+class DiagramDiff(NamedTuple):
+    """The differences between two diagrams"""
+
+    nodes: Changes
+    edges: Changes
+    groups: Changes
+
+    def __bool__(self) -> bool:
+        """Whether there are any differences"""
+        return any(any(changes) for changes in self)
+
+    def summary(self) -> str:
+        """Summarize the differences, e.g. `nodes +1 -0 ~2, edges +1 -1 ~0`"""
+        return ", ".join(
+            f"{kind} +{len(changes.added)} -{len(changes.removed)} "
+            f"~{len(changes.changed)}"
+            for kind, changes in zip(self._fields, self)
+        )
+
+
+def _from_items(model: Mapping[str, Any]) -> Model:
+    """Index the items of a model (from `model_dict()` or the model files)"""
+    return {
+        "name": model.get("name"),
+        "nodes": {
+            node["name"]: {key: val for key, val in node.items() if key != "name"}
+            for node in model.get("nodes", ())
+        },
+        "edges": {
+            (edge["from"], edge["to"]): {
+                key: val for key, val in edge.items() if key not in ("from", "to")
+            }
+            for edge in model.get("edges", ())
+        },
+        "groups": {
+            group["name"]: {
+                "collapsed": group["collapsed"],
+                "nodes": set(group["nodes"]),
+            }
+            for group in model.get("groups", ())
+        },
+    }
+
+
+def _from_dot(source: str) -> Model:
+    """Read the model from a DOT source, the roles of the nodes and the
+    hidden processes are not known"""
+    parsed = parse_dot(source)
+    return {
+        "name": parsed["name"],
+        "nodes": {
+            node: {
+                "group": attrs["group"],
+                "hidden": False,
+                **({"tooltip": attrs["tooltip"]} if "tooltip" in attrs else {}),
+            }
+            for node, attrs in parsed["nodes"].items()
+        },
+        "edges": parsed["edges"],
+        "groups": parsed["groups"],
+    }
+
+
+def load_model(source: Diagram | str | Path) -> Model:
+    """Load the model of a diagram to compare
+
+    Args:
+        source: The diagram (built), or a saved model file
+            (`.model.json` or `.model.msgpack`) or DOT file (`.dot` or `.gv`)
+
+    Returns:
+        The name of the diagram, and the nodes, the edges and the groups, by
+        their names
+    """
+    if not isinstance(source, (str, Path)):
+        return _from_items(model_dict(source))
+
+    path = Path(source)
+    if path.suffix in (".dot", ".gv"):
+        return _from_dot(path.read_text())
+
+    if path.suffix == ".msgpack":
+        try:
+            import msgpack
+        except ImportError as exc:  # pragma: no cover
+            raise ImportError(
+                "`msgpack` is required to load the diagram model from msgpack, "
+                "install it with `pip install msgpack`."
+            ) from exc
+
+        return _from_items(msgpack.unpackb(path.read_bytes()))
+
+    return _from_items(json.loads(path.read_text()))
+
+
+def _changed_fields(old: Mapping[str, Any], new: Mapping[str, Any]) -> List[str]:
+    """The fields changed, of those known in both (not known for DOT files)"""
+    return sorted(key for key in old.keys() & new.keys() if old[key] != new[key])
+
+
+def _compare(old: Mapping[Any, Any], new: Mapping[Any, Any]) -> Changes:
+    """Compare the elements of a kind"""
+    return Changes(
+        sorted(new.keys() - old.keys()),
+        sorted(old.keys() - new.keys()),
+        sorted(
+            key
+            for key in old.keys() & new.keys()
+            if _changed_fields(old[key], new[key])
+        ),
+    )
+
+
+def diff_models(old: Model, new: Model) -> DiagramDiff:
+    """Compute the differences between two diagrams
+
+    Args:
+        old: The model of the old diagram, from `load_model()`
+        new: The model of the new diagram, from `load_model()`
+
+    Returns:
+        The nodes, the edges (as tuples of the names of the nodes) and the
+        groups added, removed or changed, sorted
+    """
+    return DiagramDiff(
+        *(_compare(old[kind], new[kind]) for kind in ("nodes", "edges", "groups"))
+    )
+
+
+def _statuses(diff: DiagramDiff) -> Dict[Tuple[str, Any], str]:
+    """The status of each element added, removed or changed"""
+    return {
+        (kind, key): status
+        for kind, changes in zip(diff._fields, diff)
+        for status, keys in zip(changes._fields, changes)
+        for key in keys
+    }
+
+
+def _merged(old: Mapping[Any, Any], new: Mapping[Any, Any]) -> Dict[Any, Any]:
+    """The union of the elements, the new ones preferred, sorted by the keys"""
+    return {
+        key: new.get(key, old.get(key)) for key in sorted(old.keys() | new.keys())
+    }
+
+
+def _highlight(
+    attrs: Dict[str, str],
+    status: str | None,
+    base: Mapping[str, str],
+) -> Dict[str, str]:
+    """Add the highlight of a status to the attributes
+
+    Args:
+        attrs: The attributes of the element
+        status: added, removed, changed or None
+        base: The attributes of the element from the theme
+    """
+    if status is None:
+        return attrs
+    highlight = DIFF_STYLES[status]
+    attrs.update(highlight)
+    if "style" in highlight:
+        # replace the line style, keep the others (rounded, filled, etc)
+        styles = [
+            style
+            for style in base.get("style", "").split(",")
+            if style and style not in LINE_STYLES
+        ]
+        attrs["style"] = ",".join([*styles, highlight["style"]])
+    if base.get("peripheries") == "0":  # the fancy themes draw no borders
+        attrs["peripheries"] = "1"
+    return attrs
+
+
+def diff_source(
+    name: str,
+    old: Model,
+    new: Model,
+    diff: DiagramDiff | None = None,
+    theme: ResolvedTheme | None = None,
+    positions: Mapping[str, Tuple[float, float]] | None = None,
+    pinned: Iterable[str] = (),
+) -> str:
+    """Assemble the DOT source of the union of two diagrams
+
+    Args:
+        name: The name of the graph
+        old: The model of the old diagram
+        new: The model of the new diagram
+        diff: The differences to highlight, None to highlight nothing
+        theme: The theme, default to the default theme
+        positions: The positions (in points) to start the layout from
+        pinned: The nodes to keep at their positions
+
+    Returns:
+        The DOT source
+    """
+    theme = theme or resolve_theme("default")
+    statuses = _statuses(diff) if diff else {}
+    positions = positions or {}
+    pinned = set(pinned)
+    nodes = {
+        node: data
+        for node, data in _merged(old["nodes"], new["nodes"]).items()
+        if not data.get("hidden")
+    }
+
+    graph = Digraph(name)
+    if positions:
+        graph.attr(inputscale="72")
+    graph.attr(label=f"{name}\n{diff.summary()}\n " if diff else f"{name}\n ")
+    graph.graph_attr.update(theme.graph)
+    graph.attr("node", **theme.node)
+    graph.attr("edge", **theme.edge)
+
+    def _node(sub: Digraph, node: str) -> None:
+        data = nodes[node]
+        base = {**theme.node, **theme.roles[data.get("role")]}
+        status = statuses.get(("nodes", node))
+        attrs = {"tooltip": data.get("tooltip", "")}
+        if status == "changed":
+            fields = _changed_fields(old["nodes"][node], new["nodes"][node])
+            attrs["tooltip"] += f"\n(changed: {', '.join(fields)})"
+        elif status:
+            attrs["tooltip"] += f"\n({status})"
+        if node in positions:
+            x, y = positions[node]
+            attrs["pos"] = f"{x:.2f},{y:.2f}{'!' if node in pinned else ''}"
+        sub.node(
+            node,
+            **{
+                **theme.roles[data.get("role")],
+                **_highlight(attrs, status, base),
+            },
+        )
+
+    def _edge(sub: Digraph, node1: str, node2: str, data: Mapping) -> None:
+        in_group = data.get("group") is not None
+        attrs: Dict[str, str] = {}
+        if data.get("has_hidden"):
+            attrs.update(theme.group_edge_hidden if in_group else theme.edge_hidden)
+        base = {**theme.edge, **(theme.group_edge if in_group else {}), **attrs}
+        status = statuses.get(("edges", (node1, node2)))
+        sub.edge(node1, node2, **{**attrs, **_highlight({}, status, base)})
+
+    edges = {
+        edge: data
+        for edge, data in _merged(old["edges"], new["edges"]).items()
+        if edge[0] in nodes and edge[1] in nodes
+    }
+    groups = _merged(old["groups"], new["groups"])
+    for group in groups:
+        members = [
+            node for node, data in nodes.items() if data.get("group") == group
+        ]
+        if not members:  # all hidden
+            continue
+        with graph.subgraph(name=f"cluster_{group}") as sub:
+            status = statuses.get(("groups", group))
+            sub.attr(
+                label=f"{group} ({status})" if status else group,
+                **theme.group,
+            )
+            if status:
+                sub.attr(pencolor=DIFF_STYLES[status]["color"], penwidth="2.5")
+            sub.node_attr.update(theme.group_node)
+            sub.edge_attr.update(theme.group_edge)
+            for node in members:
+                _node(sub, node)
+            for (node1, node2), data in edges.items():
+                if data.get("group") == group:
+                    _edge(sub, node1, node2, data)
+
+    for node, data in nodes.items():
+        if data.get("group") not in groups:
+            _node(graph, node)
+
+    for (node1, node2), data in edges.items():
+        if data.get("group") not in groups:
+            _edge(graph, node1, node2, data)
+
+    return graph.source
+
+
+def parse_positions(plain: str) -> Dict[str, Tuple[float, float]]:
+    """Parse the positions of the nodes from the output of `dot -Tplain`
+
+    Args:
+        plain: The output, with the positions in inches
+
+    Returns:
+        The positions of the nodes in points, by their names
+    """
+    positions = {}
+    for line in plain.splitlines():
+        if not line.startswith("node "):
+            continue
+        fields = shlex.split(line)
+        positions[fields[1]] = (float(fields[2]) * 72, float(fields[3]) * 72)
+    return positions
+
+
+def _layout_file(source: Diagram | str | Path) -> Path:
+    """The saved layout of a diagram, e.g. `diagram.layout.json` for
+    `diagram.model.json` or `diagram.dot`, and `diagram.G1.layout.json` for
+    `diagram.G1.dot`"""
+    if not isinstance(source, (str, Path)):
+        return source.outprefix.with_name(f"{source.outprefix.name}.layout.json")
+
+    path = PanPath(source)
+    stem = next(
+        (path.name[: -len(ext)] for ext in SOURCE_EXTS if path.name.endswith(ext)),
+        path.stem,
+    )
+    return path.with_name(f"{stem}.layout.json")
+
+
+async def _positions(
+    old: Diagram | str | Path,
+    model: Model,
+    name: str,
+    theme: ResolvedTheme,
+) -> Dict[str, Tuple[float, float]]:
+    """The positions of the nodes of the old diagram as it was rendered, from
+    its saved layout (see `diagram_reuse_layout`), otherwise laid out again"""
+    layout = await read_layout(_layout_file(old))
+    if layout is not None:
+        return {node: tuple(item["pos"]) for node, item in layout["nodes"].items()}
+
+    plain = await renderer.RENDERER.render(
+        [DOT_BINARY, "-Kdot", "-Tplain"],
+        diff_source(name, model, model, theme=theme),
+    )
+    return parse_positions(plain.decode())
+
+
+async def render_diff(
+    old: Diagram | str | Path,
+    new: Diagram | str | Path,
+    outfile: str | Path,
+    theme: str | Mapping[str, Any] = "default",
+    local_above: int = LOCAL_LAYOUT_NODES,
+) -> DiagramDiff:
+    """Render the differences between two diagrams in one file
+
+    Args:
+        old: The old diagram, see `load_model()`
+        new: The new diagram, see `load_model()`
+        outfile: The file to render to, the format is the extension
+        theme: The theme, see `Diagram.set_theme()`
+        local_above: Lay out only the changed neighbourhood of the diagrams
+            with more nodes than this, the other nodes are pinned. The smaller
+            diagrams are laid out by `dot`, where the nodes may move, unless
+            the layout of the old diagram is saved (`diagram_reuse_layout`),
+            from which the nodes unchanged are pinned (see `layout.pin()`)
+
+    Returns:
+        The differences
+    """
+    old_model, new_model = load_model(old), load_model(new)
+    name = new_model["name"] or old_model["name"] or "diagram"
+    diff = diff_models(old_model, new_model)
+    resolved = resolve_theme(theme)
+
+    union = {
+        kind: _merged(old_model[kind], new_model[kind])
+        for kind in ("nodes", "edges", "groups")
+    }
+    positions: Dict[str, Tuple[float, float]] = {}
+    pinned: Set[str] = set()
+    if len(union["nodes"]) > local_above:
+        positions = await _positions(old, old_model, name, resolved)
+        for node in union["nodes"]:
+            if node not in positions:
+                position = seed(node, union["edges"], positions, SEED_OFFSET)
+                if position is not None:
+                    positions[node] = position
+
+        # the nodes removed or changed stay where they were, only the nodes
+        # and the edges added, and the groups changed, need a new layout
+        changed = set(diff.nodes.added)
+        for edge in diff.edges.added:
+            changed.update(edge)
+        for group in chain(diff.groups.added, diff.groups.changed):
+            changed.update(union["groups"][group]["nodes"])
+        pinned = set(positions) - neighbourhood(union["edges"], changed)
+    else:
+        layout = await read_layout(_layout_file(old))
+        held = layout and pin(
+            layout,
+            {node: item.get("group") for node, item in union["nodes"].items()},
+            list(union["edges"]),
+        )
+        for node, pos in (held or {}).items():
+            x, y = pos.rstrip("!").split(",")
+            positions[node] = (float(x), float(y))
+            if pos.endswith("!"):
+                pinned.add(node)
+
+    outfile = PanPath(outfile)
+    fmt = outfile.suffix[1:] or "svg"
+    if pinned:
+        source = diff_source(
+            name, old_model, new_model, diff, resolved, positions, pinned
+        )
+        cmd = [DOT_BINARY, "-Kneato", "-Gsplines=true", f"-T{fmt}"]
+    else:
+        # nothing to keep in place, dot lays out the groups as clusters
+        source = diff_source(name, old_model, new_model, diff, resolved)
+        cmd = [DOT_BINARY, "-Kdot", f"-T{fmt}"]
+    await outfile.a_write_bytes(await renderer.RENDERER.render(cmd, source))
+    return diff
+
+
+def main(argv: List[str] | None = None) -> None:
+    """Render the differences between two diagrams from the command line"""
+    parser = argparse.ArgumentParser(
+        prog="python -m pipen_diagram.diff",
+        description="Render the differences between two diagrams in one file",
+    )
+    parser.add_argument(
+        "old",
+        help="The old diagram, the model (.model.json/.model.msgpack) or DOT file",
+    )
+    parser.add_argument(
+        "new",
+        help="The new diagram, the model (.model.json/.model.msgpack) or DOT file",
+    )
+    parser.add_argument(
+        "-o",
+        "--outfile",
+        default="diagram.diff.svg",
+        help="The file to render to, the format is the extension",
+    )
+    parser.add_argument("--theme", default="default", help="The theme")
+    parser.add_argument(
+        "--local-above",
+        type=int,
+        default=LOCAL_LAYOUT_NODES,
+        help=(
+            "Lay out only the changed neighbourhood of the diagrams with more "
+            "nodes than this"
+        ),
+    )
+    args = parser.parse_args(argv)
+    diff = asyncio.run(
+        render_diff(args.old, args.new, args.outfile, args.theme, args.local_above)
+    )
+    print(f"{args.outfile}: {diff.summary()}")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
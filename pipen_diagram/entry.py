@@ -1,37 +1,505 @@
 """Creates the plugin"""
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Iterable, Tuple, Type
+import asyncio
+import json
+import logging
+from hashlib import sha256
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Mapping, Tuple, Type
+from weakref import WeakKeyDictionary
+
+from panpath import PanPath
 from pipen import plugin
 from pipen.utils import get_logger
 
-from .diagram import Diagram
+from .utils import get_tooltip, proc_list
 
 logger = get_logger("diagram", "debug")
+# The diagrams being saved in the background, to be awaited in on_complete
+BACKGROUND_TASKS: WeakKeyDictionary[Pipen, asyncio.Task] = WeakKeyDictionary()
+# The detail diagrams of the lazy level-of-detail output being rendered in the
+# background, to be awaited in on_complete
+DETAIL_TASKS: WeakKeyDictionary[Pipen, asyncio.Task] = WeakKeyDictionary()
+# The live statuses of the processes patched into the diagrams
+LIVE_STATUSES: WeakKeyDictionary[Pipen, LiveStatus] = WeakKeyDictionary()
+# The file to save the fingerprint of the diagram to, in the workdir, so that
+# nothing but the diagrams is saved to the output directory
+FINGERPRINT_FILE = ".diagram_fingerprint"
+# The options that affect the saved diagram, and their defaults
+OUTPUT_OPTS = {
+    "diagram_theme": "default",
+    "diagram_theme_base": "default",
+    "diagram_savedot": False,
+    "diagram_formats": ["svg"],
+    "diagram_engine": "dot",
+    "diagram_stats": False,
+    "diagram_collapse_groups": False,
+    "diagram_collapse_details": False,
+    "diagram_lod": False,
+    "diagram_group_diagrams": False,
+    "diagram_minify": False,
+    "diagram_live": False,
+    "diagram_timings": False,
+    "diagram_annotate": False,
+    "diagram_reuse_layout": False,
+}
 
 if TYPE_CHECKING:  # pragma: no cover
     from pipen import Pipen, Proc
+    from .diagram import Diagram
+    from .status import LiveStatus
+    from .timings import Timing
+    from .volumes import Volume
+
+
+def _is_hidden(proc: Type[Proc]) -> bool:
+    """Check if a process is hidden from the diagram"""
+    return bool(proc.plugin_opts and proc.plugin_opts.get("diagram_hide", False))
+
 
+def _get_mates(
+    procs: Iterable[Type[Proc]],
+) -> Mapping[Type[Proc], List[Tuple[Type[Proc], bool]]]:
+    """Find the mates of the visible processes
 
-def _get_mate(proc: Type[Proc]) -> Iterable[Tuple[Type[Proc], bool]]:
-    """Find the mate starting with proc
+    The visible successors of each hidden process are computed only once
+    (iteratively, in post-order) and reused by all the processes that reach
+    it, so that the paths through the hidden processes are never enumerated.
 
     Args:
-        proc: The process
+        procs: The processes of the pipeline
 
-    Yields:
-        A tuple of the dependent process and whether there are hidden processes
-        along the path.
+    Returns:
+        A dict of the visible processes to a list of tuples of the dependent
+        processes and whether there are hidden processes along the path.
+        A dependent process reachable both directly and through hidden
+        processes is only reported once, as reached directly.
     """
-    if proc.nexts:
-        for nproc in proc.nexts:
-            if nproc.plugin_opts and nproc.plugin_opts.get(
-                "diagram_hide", False
+    procs = list(procs)
+    hidden = {proc for proc in procs if _is_hidden(proc)}
+    # hidden proc => visible successors (dict as an ordered set)
+    reach: Dict[Type[Proc], Dict[Type[Proc], None]] = {}
+
+    def _resolve(proc: Type[Proc]) -> None:
+        stack = [(proc, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node in reach:
+                continue
+            if expanded:
+                out: Dict[Type[Proc], None] = {}
+                for nproc in node.nexts or ():
+                    if nproc in hidden:
+                        out.update(reach[nproc])
+                    else:
+                        out[nproc] = None
+                reach[node] = out
+                continue
+
+            stack.append((node, True))
+            for nproc in node.nexts or ():
+                if nproc in hidden and nproc not in reach:
+                    stack.append((nproc, False))
+
+    mates = {}
+    for proc in procs:
+        if proc in hidden:
+            continue
+
+        proc_mates: Dict[Type[Proc], bool] = {}
+        for nproc in proc.nexts or ():
+            if nproc not in hidden:
+                proc_mates[nproc] = False
+                continue
+
+            _resolve(nproc)
+            for nnproc in reach[nproc]:
+                proc_mates.setdefault(nnproc, True)
+
+        mates[proc] = list(proc_mates.items())
+
+    return mates
+
+
+def _add_procs(
+    diagram: Diagram,
+    procs: Iterable[Type[Proc]],
+    starts: Iterable[Type[Proc]],
+    mates: Mapping[Type[Proc], List[Tuple[Type[Proc], bool]]],
+) -> None:
+    """Add the visible processes and the edges between them to the diagram
+
+    Args:
+        diagram: The diagram
+        procs: The processes of the pipeline
+        starts: The start processes of the pipeline
+        mates: The mates of the visible processes, from `_get_mates()`
+    """
+    for node in procs:
+        if _is_hidden(node):
+            if not node.nexts:
+                raise ValueError(
+                    "Cannot hide end process {node} from diagram."
+                )
+
+            if len(node.requires) > 1 and len(node.nexts) > 1:
+                raise ValueError(
+                    f"Cannot hide process {node} from diagram with "
+                    "multiple required processes or "
+                    "multiple dependent processes."
+                )
+
+            diagram.add_hidden(node)
+            continue
+
+        role = (
+            "start"
+            if node in starts
+            else "end"
+            if not node.nexts
+            else None
+        )
+        diagram.add_node(node, group=node.__meta__["procgroup"], role=role)
+
+        for dep_proc, has_hidden in mates[node]:
+            if (
+                node.__meta__["procgroup"]
+                and dep_proc.__meta__["procgroup"]
+                == node.__meta__["procgroup"]
             ):
-                for nnproc, _ in _get_mate(nproc):
-                    yield (nnproc, True)
+                group = node.__meta__["procgroup"]
             else:
-                yield (nproc, False)
+                group = None
+            diagram.add_edge(
+                node,
+                dep_proc,
+                group=group,
+                has_hidden=has_hidden,
+            )
+
+
+def _fingerprint(
+    pipen: Pipen,
+    timings: Mapping[str, Timing] | None = None,
+    volumes: Mapping[str, Volume] | None = None,
+) -> str:
+    """Compute the fingerprint of everything that the diagram depends on
+
+    That includes the topology of the pipeline, the hidden processes, the
+    groups, the descriptions, the options affecting the output and the
+    timings shown. No graph is built for that.
+
+    Args:
+        pipen: The pipeline
+        timings: The timings of the processes, if shown
+        volumes: The volumes of the processes, if shown
+
+    Returns:
+        The hex digest of the fingerprint
+    """
+    hasher = sha256(
+        f"{pipen.name}:{pipen.outdir}:{PipenDiagram.__version__}".encode()
+    )
+    hasher.update(
+        json.dumps(
+            {
+                key: pipen.config.plugin_opts.get(key, default)
+                for key, default in OUTPUT_OPTS.items()
+            },
+            sort_keys=True,
+            default=str,
+        ).encode()
+    )
+    if timings:
+        hasher.update(json.dumps(timings, sort_keys=True).encode())
+    if volumes:
+        hasher.update(json.dumps(volumes, sort_keys=True).encode())
+    starts = set(proc_list(pipen.starts))
+    for proc in pipen.procs:
+        group = proc.__meta__["procgroup"]
+        hasher.update(
+            json.dumps(
+                [
+                    proc.name,
+                    proc in starts,
+                    [rproc.name for rproc in proc_list(proc.requires)],
+                    [nproc.name for nproc in proc.nexts or ()],
+                    _is_hidden(proc),
+                    group.name if group else None,
+                    get_tooltip(proc),
+                ]
+            ).encode()
+        )
+    return hasher.hexdigest()
+
+
+def _fingerprint_file(pipen: Pipen) -> PanPath:
+    """The file the fingerprint of the diagram is saved to"""
+    return PanPath(pipen.workdir) / FINGERPRINT_FILE
+
+
+async def _unchanged(pipen: Pipen, fingerprint: str) -> Dict[str, Any] | None:
+    """Check if the diagram saved in the output directory is up to date
+
+    Args:
+        pipen: The pipeline
+        fingerprint: The fingerprint computed by `_fingerprint()`
+
+    Returns:
+        What is saved with the fingerprint, if the fingerprint is unchanged
+        and all the files saved with it (the formats, the dot source, the
+        detail diagrams, the statistics, the models and the layout) still
+        exist, otherwise None
+    """
+    try:
+        saved = json.loads(await _fingerprint_file(pipen).a_read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    if not isinstance(saved, dict) or saved.get("fingerprint") != fingerprint:
+        return None
+
+    exists = await asyncio.gather(
+        *((PanPath(pipen.outdir) / name).a_exists() for name in saved["outputs"])
+    )
+    return saved if all(exists) else None
+
+
+def _live_status(pipen: Pipen, names: Mapping[str, str]) -> LiveStatus | None:
+    """Set up the live status of the processes if enabled
+
+    Args:
+        pipen: The pipeline
+        names: The nodes showing the processes in the diagram, by the names
+            of the processes (see `Diagram.status_nodes()`)
+
+    Returns:
+        The live status, or None if not enabled
+    """
+    opts = pipen.config.plugin_opts
+    if (
+        not opts.get("diagram_live", False)
+        or "svg" not in opts.get("diagram_formats", ["svg"])
+        or opts.get("diagram_minify") == "gzip"
+    ):
+        return None
+
+    from .status import LiveStatus
+
+    live = LIVE_STATUSES[pipen] = LiveStatus(
+        PanPath(pipen.outdir) / "diagram.svg",
+        names,
+        interval=opts.get("diagram_live_interval", 1.0),
+    )
+    return live
+
+
+async def _save(pipen: Pipen, diagram: Diagram, fingerprint: str) -> None:
+    """Save the diagram, then log and save the statistics and the fingerprint
+    """
+    await diagram.save()
+    live = LIVE_STATUSES.get(pipen)
+    if live is not None:
+        await live.load()
+
+    jobs = pipen.config.plugin_opts.get("diagram_group_jobs")
+    lod = pipen.config.plugin_opts.get("diagram_lod", False)
+    lazy = lod and lod != "eager"
+    # the dot sources of the lazy details, to render them again on request
+    # (not without graphviz)
+    lazy_savedot = diagram.savedot or diagram.engine != "builtin"
+    if lazy and diagram.collapsed:
+        # the overview is ready to open, the details are rendered while the
+        # pipeline is running
+        DETAIL_TASKS[pipen] = asyncio.create_task(
+            diagram.save_details(
+                list(diagram.collapsed),
+                jobs=jobs,
+                savedot=lazy_savedot,
+            )
+        )
+
+    details: List[str] = []
+    if not lazy and (
+        lod
+        or pipen.config.plugin_opts.get("diagram_collapse_details", False)
+    ):
+        details.extend(diagram.collapsed)
+    if pipen.config.plugin_opts.get("diagram_group_diagrams", False):
+        details.extend(diagram.groups)
+    if details:
+        await diagram.save_details(details, jobs=jobs)
+
+    # the files to check the next time before skipping
+    outputs = diagram.outputs()
+    for name in details:
+        outputs.extend(diagram.detail(name).outputs())
+    if lazy:
+        for name in diagram.collapsed:
+            outputs.extend(diagram.detail(name, lazy_savedot).outputs())
+
+    stats = diagram.stats
+    level = pipen.config.plugin_opts.get("diagram_stats_loglevel", "debug")
+    levelno = logging.getLevelName(str(level).upper())
+    if not isinstance(levelno, int):
+        logger.warning("Unknown diagram_stats_loglevel %r, using debug", level)
+        levelno = logging.DEBUG
+    minified = ""
+    if stats["minify"]["before"]:
+        minified = "; minified svg from {before} to {after} bytes".format(
+            **stats["minify"]
+        )
+    logger.log(
+        levelno,
+        "Diagram stats: %s; %s; uploaded %s file(s), %s bytes%s",
+        ", ".join(f"{key}={val}" for key, val in stats["counts"].items()),
+        ", ".join(
+            f"{key}={val * 1000:.2f}ms" for key, val in stats["timings"].items()
+        ),
+        stats["upload"]["files"],
+        stats["upload"]["bytes"],
+        minified,
+    )
+    if pipen.config.plugin_opts.get("diagram_stats", False):
+        statsfile = diagram.outprefix.with_name(
+            f"{diagram.outprefix.name}.stats.json"
+        )
+        await statsfile.a_write_text(json.dumps(stats, indent=2))
+        outputs.append(statsfile)
+
+    await _fingerprint_file(pipen).a_write_text(
+        json.dumps(
+            {
+                "fingerprint": fingerprint,
+                "outputs": sorted({path.name for path in outputs}),
+                # to color the nodes when the diagram is not built again
+                "nodes": diagram.status_nodes(),
+            }
+        )
+    )
+
+
+async def save_diagram(pipen: Pipen) -> bool:
+    """Build and save the diagram of a pipeline, unless it is unchanged
+
+    Called when the pipeline starts, or by the command line tool to save the
+    diagram without running the pipeline (see `pipen_diagram.cli`).
+
+    Args:
+        pipen: The pipeline, with the process relationships built
+
+    Returns:
+        False if the diagram is unchanged and not saved again
+    """
+    show_timings = pipen.config.plugin_opts.get("diagram_timings", False)
+    annotate = pipen.config.plugin_opts.get("diagram_annotate", False)
+    timings = volumes = None
+    if show_timings or annotate == "rate":
+        from .timings import critical_path, read_timings
+
+        timings = await read_timings(
+            PanPath(pipen.workdir),
+            [proc.name for proc in pipen.procs],
+        )
+    if annotate:
+        from .volumes import metric_values, read_volumes
+
+        volumes = await read_volumes(
+            PanPath(pipen.workdir),
+            [proc.name for proc in pipen.procs],
+        )
+
+    fingerprint = _fingerprint(pipen, timings, volumes)
+    saved = None
+    if pipen.config.plugin_opts.get("diagram_skip_unchanged", True):
+        saved = await _unchanged(pipen, fingerprint)
+    if saved is not None:
+        logger.debug(
+            "Diagram unchanged, skipped saving to `%s/diagram.svg`",
+            pipen.outdir,
+        )
+        live = _live_status(
+            pipen,
+            saved.get("nodes")
+            or {proc.name: proc.name for proc in pipen.procs if not _is_hidden(proc)},
+        )
+        if live is not None:
+            await live.load()
+        return False
+
+    logger.debug(
+        "Building diagram and saving to `%s/diagram.svg`", pipen.outdir
+    )
+    # imported here, graphviz and the themes are only needed to build
+    from .cache import RenderCache, default_cachedir
+    from .diagram import Diagram
+
+    lod = pipen.config.plugin_opts.get("diagram_lod", False)
+    cache = None
+    if pipen.config.plugin_opts.get("diagram_cache", True):
+        cachedir = pipen.config.plugin_opts.get("diagram_cachedir")
+        cache = RenderCache(
+            PanPath(cachedir) if cachedir else default_cachedir(),
+            maxsize=pipen.config.plugin_opts.get(
+                "diagram_cache_maxsize", 50 * 1024 * 1024
+            ),
+            maxage=pipen.config.plugin_opts.get(
+                "diagram_cache_maxage", 30 * 24 * 3600
+            ),
+        )
+
+    diagram = Diagram(
+        pipen.name,
+        PanPath(pipen.outdir) / "diagram",
+        savedot=pipen.config.plugin_opts.get("diagram_savedot", False),
+        cache=cache,
+        formats=pipen.config.plugin_opts.get("diagram_formats", ["svg"]),
+        engine=pipen.config.plugin_opts.get("diagram_engine", "dot"),
+        # the level-of-detail overview has all the groups collapsed
+        collapse_groups=bool(lod)
+        or pipen.config.plugin_opts.get("diagram_collapse_groups", False),
+        link_details=bool(lod),
+        minify=pipen.config.plugin_opts.get("diagram_minify", False),
+        reuse_layout=pipen.config.plugin_opts.get("diagram_reuse_layout", False),
+    )
+
+    if (
+        pipen.config.plugin_opts
+        and "diagram_theme" in pipen.config.plugin_opts
+    ):
+        diagram.set_theme(
+            pipen.config.plugin_opts.diagram_theme,
+            base=pipen.config.plugin_opts.get("diagram_theme_base", "default"),
+        )
+
+    with diagram.timeit("mates"):
+        mates = _get_mates(pipen.procs)
+    with diagram.timeit("add"):
+        _add_procs(diagram, pipen.procs, proc_list(pipen.starts), mates)
+    if show_timings:
+        with diagram.timeit("critical_path"):
+            path, wall = critical_path(pipen.procs, timings)
+            diagram.add_timings(timings, path)
+        diagram.stats["critical_path"] = {
+            "procs": [proc.name for proc in path],
+            "wall": wall,
+        }
+    if annotate:
+        diagram.add_volumes(
+            metric_values(annotate, volumes, timings),
+            {name: volume.jobs for name, volume in volumes.items()},
+        )
+
+    await diagram.load_layout()
+    diagram.build()
+    diagram.stats["counts"]["hidden"] = len(pipen.procs) - len(mates)
+    _live_status(pipen, diagram.status_nodes())
+    if pipen.config.plugin_opts.get("diagram_background", False):
+        BACKGROUND_TASKS[pipen] = asyncio.create_task(
+            _save(pipen, diagram, fingerprint)
+        )
+    else:
+        await _save(pipen, diagram, fingerprint)
+    return True
 
 
 class PipenDiagram:
@@ -45,10 +513,70 @@ class PipenDiagram:
         """Default configurations"""
         # pipeline level: name or detailed theme
         pipen.config.plugin_opts.diagram_theme = "default"
+        # pipeline level: the theme that a detailed theme is based on
+        pipen.config.plugin_opts.diagram_theme_base = "default"
         # pipeline level: save dot file?
         pipen.config.plugin_opts.diagram_savedot = False
         # pipeline level: loglevel
         pipen.config.plugin_opts.diagram_loglevel = "info"
+        # pipeline level: the formats to render the diagram to
+        pipen.config.plugin_opts.diagram_formats = ["svg"]
+        # pipeline level: the graphviz layout engine, or "builtin" to use the
+        # pure-python layout without the `dot` executable
+        pipen.config.plugin_opts.diagram_engine = "dot"
+        # pipeline level: reuse the rendered diagram if nothing changed?
+        pipen.config.plugin_opts.diagram_cache = True
+        # pipeline level: the cache directory
+        # (default: ~/.cache/pipen-diagram, or under $XDG_CACHE_HOME)
+        pipen.config.plugin_opts.diagram_cachedir = None
+        # pipeline level: max total size (in bytes) of the cache
+        pipen.config.plugin_opts.diagram_cache_maxsize = 50 * 1024 * 1024
+        # pipeline level: max age (in seconds) of the cached diagrams
+        pipen.config.plugin_opts.diagram_cache_maxage = 30 * 24 * 3600
+        # pipeline level: save the statistics to diagram.stats.json?
+        pipen.config.plugin_opts.diagram_stats = False
+        # pipeline level: the log level of the statistics
+        pipen.config.plugin_opts.diagram_stats_loglevel = "debug"
+        # pipeline level: render process groups as single summary nodes,
+        # True for all groups, an integer for the groups with at least that
+        # many processes, or a list of group names
+        pipen.config.plugin_opts.diagram_collapse_groups = False
+        # pipeline level: save a detail diagram for each collapsed group?
+        pipen.config.plugin_opts.diagram_collapse_details = False
+        # pipeline level: level-of-detail output, the overview has all groups
+        # collapsed, linking to the detail diagrams of the groups, which are
+        # rendered right away ("eager"), or in the background while the
+        # pipeline is running ("lazy" or True, with the dot sources saved to
+        # render them again on request)
+        pipen.config.plugin_opts.diagram_lod = False
+        # pipeline level: save a diagram for each (not collapsed) group?
+        pipen.config.plugin_opts.diagram_group_diagrams = False
+        # pipeline level: max number of the group diagrams to render at the
+        # same time (default: number of available cores)
+        pipen.config.plugin_opts.diagram_group_jobs = None
+        # pipeline level: minify the svg file? "gzip" to save it as svgz
+        pipen.config.plugin_opts.diagram_minify = False
+        # pipeline level: color the nodes in diagram.svg by the status of
+        # the processes while the pipeline is running?
+        pipen.config.plugin_opts.diagram_live = False
+        # pipeline level: min interval (in seconds) between the updates
+        pipen.config.plugin_opts.diagram_live_interval = 1.0
+        # pipeline level: skip saving the diagram if nothing changed since
+        # the last run (see the fingerprint in <workdir>/.diagram_fingerprint)
+        pipen.config.plugin_opts.diagram_skip_unchanged = True
+        # pipeline level: annotate the processes with the wall time and the
+        # number of jobs of the last run, and highlight the critical path
+        pipen.config.plugin_opts.diagram_timings = False
+        # pipeline level: scale the pen widths of the processes by a metric
+        # of the last run, "jobs", "input_size", "output_size" or "rate"
+        # (jobs per second), and those of the edges by the number of the
+        # items passed along them
+        pipen.config.plugin_opts.diagram_annotate = False
+        # pipeline level: save the layout to <outdir>/diagram.layout.json,
+        # and lay out only what changed since then in the next runs?
+        pipen.config.plugin_opts.diagram_reuse_layout = False
+        # pipeline level: save the diagram in the background?
+        pipen.config.plugin_opts.diagram_background = False
         # process level: hide certain processes in diagram
         pipen.config.plugin_opts.diagram_hide = False
 
@@ -58,61 +586,49 @@ class PipenDiagram:
         loglevel = pipen.config.plugin_opts.get("diagram_loglevel", "info")
         logger.setLevel(loglevel.upper())
 
-        logger.debug(
-            "Building diagram and saving to `%s/diagram.svg`", pipen.outdir
-        )
-        diagram = Diagram(
-            pipen.name,
-            pipen.outdir / "diagram",
-            savedot=pipen.config.plugin_opts.get("diagram_savedot", False),
-        )
+        await save_diagram(pipen)
+
+    @plugin.impl
+    async def on_proc_start(proc: Proc) -> None:
+        """Mark the process as running in the diagram"""
+        live = LIVE_STATUSES.get(proc.pipeline)
+        if live is not None:
+            live.update(proc.name, "running")
 
-        if (
-            pipen.config.plugin_opts
-            and "diagram_theme" in pipen.config.plugin_opts
-        ):
-            diagram.set_theme(pipen.config.plugin_opts.diagram_theme)
-
-        for node in pipen.procs:
-            if node.plugin_opts and node.plugin_opts.get("diagram_hide", False):
-                if not node.nexts:
-                    raise ValueError(
-                        "Cannot hide end process {node} from diagram."
-                    )
-
-                if len(node.requires) > 1 and len(node.nexts) > 1:
-                    raise ValueError(
-                        f"Cannot hide process {node} from diagram with "
-                        "multiple required processes or "
-                        "multiple dependent processes."
-                    )
-
-                continue  # pragma: no cover
-
-            role = (
-                "start"
-                if node in pipen.starts
-                else "end"
-                if not node.nexts
-                else None
+    @plugin.impl
+    async def on_proc_done(proc: Proc, succeeded: bool | str) -> None:
+        """Mark the process as succeeded, failed or cached in the diagram"""
+        live = LIVE_STATUSES.get(proc.pipeline)
+        if live is not None:
+            live.update(
+                proc.name,
+                "cached"
+                if succeeded == "cached"
+                else "succeeded"
+                if succeeded
+                else "failed",
             )
-            diagram.add_node(node, group=node.__meta__["procgroup"], role=role)
-
-            for dep_proc, has_hidden in _get_mate(node):
-                if (
-                    node.__meta__["procgroup"]
-                    and dep_proc.__meta__["procgroup"]
-                    == node.__meta__["procgroup"]
-                ):
-                    group = node.__meta__["procgroup"]
-                else:
-                    group = None
-                diagram.add_edge(
-                    node,
-                    dep_proc,
-                    group=group,
-                    has_hidden=has_hidden,
-                )
 
-        diagram.build()
-        await diagram.save()
+    @plugin.impl
+    async def on_complete(pipen: Pipen, succeeded: bool) -> None:
+        """Wait for the diagram and the detail diagrams to be saved in the
+        background, and write the final statuses of the processes"""
+        task = BACKGROUND_TASKS.pop(pipen, None)
+        if task is not None:
+            try:
+                await task
+            except Exception as exc:
+                logger.error("Failed to save diagram: %s", exc)
+            else:
+                logger.debug("Diagram saved to `%s/diagram.svg`", pipen.outdir)
+
+        task = DETAIL_TASKS.pop(pipen, None)
+        if task is not None:
+            try:
+                await task
+            except Exception as exc:
+                logger.error("Failed to save the detail diagrams: %s", exc)
+
+        live = LIVE_STATUSES.pop(pipen, None)
+        if live is not None:
+            await live.close()
@@ -0,0 +1,338 @@
+"""Persist the layouts of the diagrams, and reuse them in the next renders
+
+With `diagram_reuse_layout`, the positions of the nodes of a rendered diagram
+are saved to `<outprefix>.layout.json`, with the groups of the nodes, the
+edges between them, and whether the nodes were pinned when it was laid out:
+
+    {
+      "version": 1,
+      "nodes": {"P1": {"group": null, "pos": [27.0, 162.0]}, ...},
+      "edges": [["P1", "P2"], ...],
+      "pinned": false
+    }
+
+The positions are in points. With no changes to the nodes, their groups or
+the edges, a graph laid out by `dot` is laid out by `dot` again, the same as
+last time, and a graph laid out with pinned nodes has all its nodes pinned, so
+the output is byte-stable and the render cache is hit. Otherwise, in the next
+render, the nodes not changed are pinned to where they were, and only the nodes
+added or moved to another group, and those newly connected to each other, are
+laid out again, starting from where they were, or next to their neighbours for
+the new ones. `dot` does not take the positions, so the graph is laid out with
+`neato` then: the groups are still drawn as boxes around their nodes, but the
+edges are routed as splines rather than by the ranks. If more than half of the
+nodes are changed, the graph is laid out from scratch (with `dot`).
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Collection,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Set,
+    Tuple,
+)
+
+if TYPE_CHECKING:  # pragma: no cover
+    from pathlib import Path
+
+VERSION = 1
+# Lay out the whole graph again if more of the nodes than this are changed
+RELAYOUT_RATIO = 0.5
+# The vertical distance from the neighbours to place the new nodes at, in points
+SEED_OFFSET = 72.0
+# The tokens of the DOT language: quoted strings, operators and IDs
+DOT_TOKEN = re.compile(
+    r'"((?:\\.|[^"\\])*)"|(->|--|[{}\[\];=,])|((?:[^\s{}\[\];=,"-]|-(?!>))+)',
+    re.S,
+)
+
+
+def dot_tokens(source: str) -> Iterator[Tuple[str, bool]]:
+    """Tokenize a DOT source
+
+    Args:
+        source: The DOT source
+
+    Yields:
+        The tokens, with the quotes removed and unescaped, and whether each
+        token is an operator
+    """
+    for match in DOT_TOKEN.finditer(source):
+        quoted, operator, name = match.groups()
+        if operator:
+            yield operator, True
+        elif quoted is None:
+            yield name, False
+        else:
+            # long strings are wrapped with backslash-newlines by graphviz
+            yield quoted.replace("\\\n", "").replace('\\"', '"'), False
+
+
+def parse_dot(source: str) -> Dict[str, Any]:
+    """Read the nodes, edges and groups (clusters) from a DOT source
+
+    Only the subset of DOT written by `graphviz` for the diagrams (and by
+    `dot -Tdot` for the laid out ones) is supported.
+
+    Args:
+        source: The DOT source
+
+    Returns:
+        The name of the graph, the attributes of the nodes with their groups,
+        the groups of the edges and the nodes of the groups
+    """
+    model: Dict[str, Any] = {"name": None, "nodes": {}, "edges": {}, "groups": {}}
+    tokens = list(dot_tokens(source))
+    # the groups of the graph and the subgraphs being read
+    stack: List[str | None] = []
+    pos = 0
+
+    def _attrs() -> Dict[str, str]:
+        nonlocal pos
+        attrs: Dict[str, str] = {}
+        while pos < len(tokens) and tokens[pos] == ("[", True):
+            pos += 1
+            while tokens[pos] != ("]", True):
+                if tokens[pos][1]:  # , or ;
+                    pos += 1
+                    continue
+                attrs[tokens[pos][0]] = tokens[pos + 2][0]
+                pos += 3
+            pos += 1
+        return attrs
+
+    def _node(name: str) -> Dict[str, Any]:
+        group = stack[-1] if stack else None
+        node = model["nodes"].setdefault(name, {"group": group})
+        if group is not None:
+            node["group"] = group
+            model["groups"].setdefault(group, {"nodes": set()})["nodes"].add(name)
+        return node
+
+    while pos < len(tokens):
+        token, operator = tokens[pos]
+        pos += 1
+        if operator:
+            if token == "{":
+                stack.append(stack[-1] if stack else None)
+            elif token == "}":
+                stack.pop()
+            continue
+
+        if token in ("digraph", "graph", "strict", "node", "edge"):
+            _attrs()
+        elif token == "subgraph":
+            name = tokens[pos][0]
+            pos += 2  # the name and {
+            stack.append(name[8:] if name.startswith("cluster_") else stack[-1])
+        elif pos < len(tokens) and tokens[pos] == ("=", True):
+            pos += 2  # graph attribute
+        elif not stack:  # the name of the graph
+            model["name"] = token
+        else:
+            names = [token]
+            while pos < len(tokens) and tokens[pos] in (("->", True), ("--", True)):
+                names.append(tokens[pos + 1][0])
+                pos += 2
+            attrs = _attrs()
+            for name in names:
+                node = _node(name)
+            if len(names) == 1:
+                node.update(attrs)
+            for node1, node2 in zip(names, names[1:]):
+                model["edges"][(node1, node2)] = {"group": stack[-1]}
+
+    return model
+
+
+def neighbourhood(
+    edges: Iterable[Tuple[str, str]],
+    nodes: Iterable[str],
+) -> Set[str]:
+    """The nodes and their neighbours
+
+    Args:
+        edges: The edges, by the names of the nodes
+        nodes: The nodes
+
+    Returns:
+        The nodes and the nodes connected to them by an edge
+    """
+    nodes = set(nodes)
+    out = set(nodes)
+    for node1, node2 in edges:
+        if node1 in nodes:
+            out.add(node2)
+        if node2 in nodes:
+            out.add(node1)
+    return out
+
+
+def seed(
+    node: str,
+    edges: Collection[Tuple[str, str]],
+    positions: Mapping[str, Tuple[float, float]],
+    offset: float,
+) -> Tuple[float, float] | None:
+    """The position to start the layout of a new node from, right below its
+    laid out upstream nodes (or above the downstream ones)
+
+    Args:
+        node: The new node
+        edges: The edges, by the names of the nodes
+        positions: The positions of the laid out nodes
+        offset: The vertical distance from the neighbours, also the min
+            distance from the other nodes
+
+    Returns:
+        The position, or None if none of the neighbours is laid out
+    """
+    above = [
+        positions[node1]
+        for node1, node2 in edges
+        if node2 == node and node1 in positions
+    ]
+    below = [
+        positions[node2]
+        for node1, node2 in edges
+        if node1 == node and node2 in positions
+    ]
+    near, dy = (above, -offset) if above else (below, offset)
+    if not near:
+        return None
+    x = sum(x for x, _ in near) / len(near)
+    y = sum(y for _, y in near) / len(near) + dy
+    # beside the nodes already there, rather than on top of them
+    while any(
+        abs(x - x0) < offset and abs(y - y0) < offset / 2.0
+        for x0, y0 in positions.values()
+    ):
+        x += offset * 1.5
+    return x, y
+
+
+def pin(
+    layout: Mapping[str, Any],
+    nodes: Mapping[str, str | None],
+    edges: Collection[Tuple[str, str]],
+) -> Dict[str, str] | None:
+    """Compute the positions of the nodes from the previous layout
+
+    The nodes and the edges removed leave their places empty, so that the
+    other nodes stay where they were.
+
+    Args:
+        layout: The previous layout, from `read_layout()`
+        nodes: The groups of the nodes, by their names
+        edges: The edges, by the names of the nodes
+
+    Returns:
+        The `pos` attributes of the nodes, in points, with `!` for the pinned
+        ones, empty if nothing is changed since the graph was laid out by
+        `dot`, so that it is laid out the same again, or None if too much is
+        changed to reuse the layout
+    """
+    previous = layout["nodes"]
+    previous_edges = {tuple(edge) for edge in layout["edges"]}
+    # with pinned nodes last time, all the nodes are pinned now, `dot` would
+    # not lay them out where they were
+    if (
+        not layout.get("pinned")
+        and nodes.keys() == previous.keys()
+        and set(edges) == previous_edges
+        and all(previous[node]["group"] == group for node, group in nodes.items())
+    ):
+        return {}
+
+    free = {
+        node
+        for node, group in nodes.items()
+        if node not in previous or previous[node]["group"] != group
+    }
+    # the nodes newly connected may need to be closer, while those connected
+    # to the new nodes stay, and the new nodes are placed next to them
+    for node1, node2 in edges:
+        if (
+            (node1, node2) not in previous_edges
+            and node1 not in free
+            and node2 not in free
+        ):
+            free.update((node1, node2))
+
+    if len(free) > len(nodes) * RELAYOUT_RATIO:
+        return None
+
+    positions = {
+        node: tuple(previous[node]["pos"]) for node in nodes if node in previous
+    }
+    for node in sorted(nodes.keys() - positions.keys()):
+        position = seed(node, edges, positions, SEED_OFFSET)
+        if position is not None:
+            positions[node] = position
+
+    return {
+        node: f"{x:.2f},{y:.2f}{'' if node in free else '!'}"
+        for node, (x, y) in positions.items()
+    }
+
+
+def make_layout(
+    laid_out: str,
+    nodes: Mapping[str, str | None],
+    edges: Iterable[Tuple[str, str]],
+    pinned: bool = False,
+) -> str:
+    """Make the layout to save from a laid out graph
+
+    Args:
+        laid_out: The laid out DOT source, from `dot -Tdot`
+        nodes: The groups of the nodes, by their names
+        edges: The edges, by the names of the nodes
+        pinned: Whether the graph was laid out with pinned nodes
+
+    Returns:
+        The layout, as JSON, byte-stable for the same positions
+    """
+    attrs = parse_dot(laid_out)["nodes"]
+    layout = {
+        "version": VERSION,
+        "nodes": {
+            node: {
+                "group": group,
+                "pos": [
+                    round(float(coord), 2)
+                    for coord in attrs[node]["pos"].rstrip("!").split(",")
+                ],
+            }
+            for node, group in nodes.items()
+            if "pos" in attrs.get(node, {})
+        },
+        "edges": sorted(list(edge) for edge in edges),
+        "pinned": pinned,
+    }
+    return json.dumps(layout, sort_keys=True, separators=(",", ":")) + "\n"
+
+
+async def read_layout(path: Path) -> Dict[str, Any] | None:
+    """Read a saved layout
+
+    Args:
+        path: The layout file
+
+    Returns:
+        The layout, or None if it is not saved, or saved by another version
+    """
+    try:
+        layout = json.loads(await path.a_read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    return layout if layout.get("version") == VERSION else None
@@ -0,0 +1,133 @@
+"""Render the detail diagrams of the level-of-detail output on request
+
+With `diagram_lod = "lazy"`, the overview `diagram.svg` is rendered with all
+the groups collapsed, each linking to `diagram.<group>.svg`, and saved right
+away. The detail diagrams are then rendered in the background while the
+pipeline is running (awaited when it completes), with their DOT sources
+(`diagram.<group>.dot`) saved, so that they can be rendered again on request,
+for example to other formats, or if the pipeline is stopped before they are
+rendered:
+
+    python -m pipen_diagram.lod <outdir>/diagram.<group>.dot
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import List
+
+from graphviz.backend.dot_command import DOT_BINARY
+from panpath import PanPath
+
+from . import renderer
+from .diagram import upload
+from .minify import minify_file
+from .utils import suffix
+
+
+async def render_detail(
+    dotfile: str | Path,
+    fmt: str = "svg",
+    engine: str = "dot",
+    force: bool = False,
+    minify: bool | str = False,
+) -> Path:
+    """Render a detail diagram from its saved DOT source
+
+    The rendering is skipped if the rendered file is newer than the source.
+
+    Args:
+        dotfile: The DOT source of the detail diagram, local or on the cloud
+        fmt: The format to render
+        engine: The graphviz layout engine
+        force: Whether to render even if the rendered file is up to date
+        minify: Whether to minify the svg file, "gzip" to also compress it
+
+    Returns:
+        The rendered file
+    """
+    dotfile = PanPath(dotfile)
+    outfile = dotfile.with_suffix(f".{suffix(fmt, minify)}")
+    if not force:
+        try:
+            stats = await asyncio.gather(outfile.a_stat(), dotfile.a_stat())
+        except FileNotFoundError:
+            pass
+        else:
+            if stats[0].st_mtime >= stats[1].st_mtime:
+                return outfile
+
+    rendered = await renderer.RENDERER.render(
+        [DOT_BINARY, f"-K{engine}", f"-T{fmt}"],
+        await dotfile.a_read_text(),
+    )
+    if fmt != "svg" or not minify:
+        await outfile.a_write_bytes(rendered)
+        return outfile
+
+    with TemporaryDirectory() as tmpdir:
+        svgfile = Path(tmpdir) / "detail.svg"
+        svgfile.write_bytes(rendered)
+        minified = svgfile.with_suffix(outfile.suffix)
+        await asyncio.get_running_loop().run_in_executor(
+            None,
+            minify_file,
+            svgfile,
+            minified,
+            1,
+            minify == "gzip",
+        )
+        await upload(minified, outfile)
+    return outfile
+
+
+def main(argv: List[str] | None = None) -> None:
+    """Render the detail diagrams from the command line"""
+    parser = argparse.ArgumentParser(
+        prog="python -m pipen_diagram.lod",
+        description="Render the detail diagrams of the level-of-detail output",
+    )
+    parser.add_argument(
+        "dotfiles",
+        nargs="+",
+        help="The DOT sources of the detail diagrams (diagram.<group>.dot)",
+    )
+    parser.add_argument("--format", default="svg", help="The format to render")
+    parser.add_argument("--engine", default="dot", help="The layout engine")
+    parser.add_argument(
+        "--minify",
+        nargs="?",
+        const=True,
+        default=False,
+        help="Minify the svg files, `--minify gzip` to save them as svgz",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Render even if the rendered files are up to date",
+    )
+    args = parser.parse_args(argv)
+
+    async def _render_all() -> List[Path]:
+        return await asyncio.gather(
+            *(
+                render_detail(
+                    dotfile,
+                    args.format,
+                    args.engine,
+                    args.force,
+                    args.minify,
+                )
+                for dotfile in args.dotfiles
+            )
+        )
+
+    for outfile in asyncio.run(_render_all()):
+        print(outfile)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,255 @@
+"""A streaming minifier of the rendered svg files
+
+The svg is tokenized into comments, tags and texts chunk by chunk, without
+building a DOM, so the memory use does not grow with the size of the diagram.
+"""
+
+from __future__ import annotations
+
+import gzip
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# Size of the chunks to read from the svg file
+CHUNK_SIZE = 64 * 1024
+# The attributes with coordinates or sizes to round
+NUMERIC_ATTRS = {
+    "points",
+    "d",
+    "x",
+    "y",
+    "cx",
+    "cy",
+    "rx",
+    "ry",
+    "x1",
+    "y1",
+    "x2",
+    "y2",
+    "width",
+    "height",
+    "viewBox",
+    "transform",
+    "font-size",
+    "stroke-width",
+}
+# The presentation attributes to hoist into css classes, and the units to
+# add to the bare numbers, which are not valid lengths in css
+PRESENTATION_ATTRS = {
+    "fill": "",
+    "stroke": "",
+    "stroke-width": "px",
+    "stroke-dasharray": "",
+    "font-family": "",
+    "font-size": "px",
+    "font-weight": "",
+    "font-style": "",
+    "text-anchor": "",
+}
+TAGNAME = re.compile(r"<[\w:-]+")
+ATTR = re.compile(r'([\w:-]+)="([^"]*)"')
+NUMBER = re.compile(r"-?\d*\.\d+")
+
+
+def _tokenize(chunks: Iterable[str]) -> Iterator[str]:
+    """Split the svg into comments, tags and texts"""
+    buf = ""
+    for chunk in chunks:
+        buf += chunk
+        pos = 0
+        size = len(buf)
+        while pos < size:
+            if buf[pos] != "<":
+                end = buf.find("<", pos)
+                if end < 0:
+                    break
+            elif buf.startswith("<!--", pos):
+                end = buf.find("-->", pos)
+                if end < 0:
+                    break
+                end += 3
+            elif size - pos < 4 and "<!--".startswith(buf[pos:]):
+                # maybe an incomplete comment opening
+                break
+            else:
+                end = buf.find(">", pos)
+                if end < 0:
+                    break
+                end += 1
+            yield buf[pos:end]
+            pos = end
+        buf = buf[pos:]
+
+    if buf:
+        yield buf
+
+
+def _round(precision: int):
+    """Make a function to round the numbers matched"""
+
+    def _sub(match: re.Match) -> str:
+        out = f"{float(match.group(0)):.{precision}f}".rstrip("0").rstrip(".")
+        return "0" if out in ("-0", "") else out
+
+    return _sub
+
+
+def minify_svg(chunks: Iterable[str], precision: int = 1) -> Iterator[str]:
+    """Minify an svg document
+
+    - The comments and the whitespaces between the tags are removed
+    - The titles of the edges and the clusters, and those of the nodes with
+      tooltips (shown by the links wrapping the nodes), are removed
+    - The coordinates are rounded to `precision` decimals
+    - The presentation attributes are hoisted into css classes, defined by
+      a style element at the end of the document
+
+    Args:
+        chunks: The chunks of the svg document
+        precision: The number of decimals to keep for the coordinates
+
+    Yields:
+        The chunks of the minified svg document
+    """
+    rounder = _round(precision)
+    classes: Dict[Tuple[Tuple[str, str], ...], str] = {}
+    # The title (tokens) of the current node, held until we know whether
+    # the node has a tooltip
+    held: List[str] | None = None
+    # The class of the last opened group, to tell the titles of edges,
+    # clusters and nodes apart
+    group_class = ""
+    in_title = in_text = skip_title = False
+
+    for token in _tokenize(chunks):
+        if token.startswith("<!--"):
+            continue
+
+        if not token.startswith("<"):
+            if in_title:
+                if skip_title:
+                    continue
+                if held is not None:
+                    held.append(token)
+                    continue
+            elif not in_text and not token.strip():
+                continue
+            yield token
+            continue
+
+        if token.startswith("<title"):
+            in_title = True
+            skip_title = group_class in ("edge", "cluster")
+            if group_class == "node":
+                held = [token]
+            elif not skip_title:
+                yield token
+            continue
+
+        if token == "</title>":
+            in_title = False
+            if held is not None:
+                held.append(token)
+            elif not skip_title:
+                yield token
+            skip_title = False
+            continue
+
+        if held is not None:
+            # a node with a tooltip is wrapped by <g id="a_..."><a xlink:title>
+            if not token.startswith('<g id="a_'):
+                yield "".join(held)
+            held = None
+
+        if token.startswith("<g"):
+            match = re.search(r'class="([^"]*)"', token)
+            group_class = match.group(1) if match else ""
+        elif token.startswith("<text"):
+            in_text = not token.endswith("/>")
+        elif token == "</text>":
+            in_text = False
+        elif token == "</svg>" and classes:
+            rules = "".join(
+                f".{name}{{"
+                + ";".join(
+                    f"{attr}:{value}{PRESENTATION_ATTRS[attr]}"
+                    if NUMBER.fullmatch(value) or value.isdigit()
+                    else f"{attr}:{value}"
+                    for attr, value in key
+                )
+                + "}"
+                for key, name in classes.items()
+            )
+            yield f"<style>{rules}</style>"
+
+        if token.startswith(("</", "<!", "<?")) or "=" not in token:
+            yield token
+            continue
+
+        attrs = []
+        presentation = []
+        class_ = None
+        for name, value in ATTR.findall(token):
+            if name in NUMERIC_ATTRS:
+                value = NUMBER.sub(rounder, value)
+            if name in PRESENTATION_ATTRS:
+                presentation.append((name, value))
+            elif name == "class":
+                class_ = value
+            else:
+                attrs.append(f'{name}="{value}"')
+
+        if presentation:
+            cls = classes.setdefault(tuple(presentation), f"c{len(classes)}")
+            class_ = f"{class_} {cls}" if class_ else cls
+        if class_ is not None:
+            attrs.append(f'class="{class_}"')
+        tagname = TAGNAME.match(token).group(0)
+        yield f"{tagname} {' '.join(attrs)}{'/>' if token.endswith('/>') else '>'}"
+
+    if held is not None:  # pragma: no cover, broken svg
+        yield "".join(held)
+
+
+def minify_file(
+    src: Path,
+    dst: Path,
+    precision: int = 1,
+    compress: bool = False,
+) -> Tuple[int, int]:
+    """Minify an svg file, streaming from src to dst
+
+    Args:
+        src: The local svg file
+        dst: The local file to write the minified svg to, could be the same
+            as src
+        precision: The number of decimals to keep for the coordinates
+        compress: Whether to gzip the minified svg (svgz)
+
+    Returns:
+        The sizes of the files in bytes, before and after the minification
+    """
+    src, dst = Path(src), Path(dst)
+    tmpfile = dst.with_name(f"{dst.name}.tmp")
+
+    def _chunks(fin) -> Iterator[str]:
+        while True:
+            chunk = fin.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    opener = gzip.open if compress else open
+    with open(src, encoding="utf-8") as fin, opener(
+        tmpfile, "wt", encoding="utf-8"
+    ) as fout:
+        for chunk in minify_svg(_chunks(fin), precision):
+            fout.write(chunk)
+
+    before = src.stat().st_size
+    os.replace(tmpfile, dst)
+    if src != dst:
+        src.unlink()
+    return before, dst.stat().st_size
@@ -0,0 +1,221 @@
+"""Export the model of a diagram (nodes, edges and groups) without graphviz
+
+The model is written item by item, so no intermediate structure of the whole
+model is built. The JSON document looks like:
+
+    {
+      "version": 1,
+      "name": "<name of the diagram>",
+      "nodes": [
+        {"name": "P1", "role": "start", "group": null, "tooltip": "...",
+         "hidden": false},
+        ...
+      ],
+      "edges": [
+        {"from": "P1", "to": "P2", "has_hidden": false, "group": null},
+        ...
+      ],
+      "groups": [{"name": "G", "collapsed": false, "nodes": ["P3", ...]}, ...]
+    }
+
+The same structure is written with `msgpack` (if installed) for the msgpack
+format.
+"""
+
+from __future__ import annotations
+
+import json
+from operator import attrgetter
+from typing import IO, TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Tuple
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .diagram import Diagram
+
+# The formats of the model and the extensions of the files
+MODEL_FORMATS = {"model": "model.json", "msgpack": "model.msgpack"}
+VERSION = 1
+
+
+def by_name(nodes: Iterable[Any]) -> List[Any]:
+    """Sort the nodes (processes, or groups for the collapsed ones) by their
+    names, so that they are emitted in the same order in every run, whatever
+    the order of the sets they are kept in
+
+    Args:
+        nodes: The nodes
+
+    Returns:
+        The sorted nodes
+    """
+    return sorted(nodes, key=attrgetter("name"))
+
+
+def edges_by_name(edges: Iterable[Tuple[Any, ...]]) -> List[Tuple[Any, ...]]:
+    """Sort the edges by the names of the nodes they connect
+
+    Args:
+        edges: The edges, tuples of the nodes and the other fields
+
+    Returns:
+        The sorted edges
+    """
+    return sorted(edges, key=lambda edge: (edge[0].name, edge[1].name))
+
+
+def _nodes(diagram: Diagram) -> Iterator[Dict[str, Any]]:
+    """Iterate over the nodes, including the processes of the collapsed groups
+    and the hidden processes"""
+    for record in diagram.records.values():
+        if record.role == "collapsed":
+            continue
+        yield {
+            "name": record.name,
+            "role": record.role,
+            "group": record.group,
+            "tooltip": record.tooltip,
+            "hidden": False,
+        }
+    for record in diagram.collapsed_records.values():
+        yield {
+            "name": record.name,
+            "role": record.role,
+            "group": record.group,
+            "tooltip": record.tooltip,
+            "hidden": False,
+        }
+    for node in by_name(diagram.hidden):
+        group = node.__meta__["procgroup"]
+        yield {
+            "name": node.name,
+            "role": None,
+            "group": group.name if group else None,
+            "tooltip": "",
+            "hidden": True,
+        }
+
+
+def _edges(diagram: Diagram) -> Iterator[Dict[str, Any]]:
+    """Iterate over the edges between the processes"""
+    for node1, node2, has_hidden in edges_by_name(diagram.expanded_edges):
+        yield {
+            "from": node1.name,
+            "to": node2.name,
+            "has_hidden": has_hidden,
+            "group": None,
+        }
+    for groups in (diagram.groups, diagram.collapsed):
+        for group in groups.values():
+            for node1, node2, has_hidden in edges_by_name(group.edges):
+                yield {
+                    "from": node1.name,
+                    "to": node2.name,
+                    "has_hidden": has_hidden,
+                    "group": group.name,
+                }
+
+
+def _groups(diagram: Diagram) -> Iterator[Dict[str, Any]]:
+    """Iterate over the groups"""
+    for collapsed, groups in ((False, diagram.groups), (True, diagram.collapsed)):
+        for group in groups.values():
+            yield {
+                "name": group.name,
+                "collapsed": collapsed,
+                "nodes": [node.name for node in by_name(group.nodes)],
+            }
+
+
+def _sections(diagram: Diagram) -> Iterator[Tuple[str, int, Iterator]]:
+    """The sections of the model, with the number of items in each section"""
+    nnodes = (
+        len(diagram.records)
+        - len(diagram.collapsed)
+        + len(diagram.collapsed_records)
+        + len(diagram.hidden)
+    )
+    nedges = len(diagram.expanded_edges) + sum(
+        len(group.edges)
+        for groups in (diagram.groups, diagram.collapsed)
+        for group in groups.values()
+    )
+    yield "nodes", nnodes, _nodes(diagram)
+    yield "edges", nedges, _edges(diagram)
+    yield "groups", len(diagram.groups) + len(diagram.collapsed), _groups(diagram)
+
+
+def model_dict(diagram: Diagram) -> Dict[str, Any]:
+    """The model of a diagram as a dict, the same as the JSON document
+
+    Args:
+        diagram: The diagram, built
+
+    Returns:
+        The model
+    """
+    model: Dict[str, Any] = {"version": VERSION, "name": diagram.graph.name}
+    for key, _, items in _sections(diagram):
+        model[key] = list(items)
+    return model
+
+
+def write_json(diagram: Diagram, fout: IO[str]) -> None:
+    """Write the model as compact JSON
+
+    Args:
+        diagram: The diagram, built
+        fout: The file handler, in text mode
+    """
+    dumps = json.JSONEncoder(separators=(",", ":")).encode
+    fout.write(f'{{"version":{VERSION},"name":{dumps(diagram.graph.name)}')
+    for key, _, items in _sections(diagram):
+        fout.write(f',"{key}":[')
+        for i, item in enumerate(items):
+            if i:
+                fout.write(",")
+            fout.write(dumps(item))
+        fout.write("]")
+    fout.write("}\n")
+
+
+def write_msgpack(diagram: Diagram, fout: IO[bytes]) -> None:
+    """Write the model with msgpack
+
+    Args:
+        diagram: The diagram, built
+        fout: The file handler, in binary mode
+    """
+    try:
+        import msgpack
+    except ImportError as exc:  # pragma: no cover
+        raise ImportError(
+            "`msgpack` is required to export the diagram model as msgpack, "
+            "install it with `pip install msgpack`."
+        ) from exc
+
+    packer = msgpack.Packer()
+    fout.write(packer.pack_map_header(5))
+    fout.write(packer.pack("version"))
+    fout.write(packer.pack(VERSION))
+    fout.write(packer.pack("name"))
+    fout.write(packer.pack(diagram.graph.name))
+    for key, count, items in _sections(diagram):
+        fout.write(packer.pack(key))
+        fout.write(packer.pack_array_header(count))
+        for item in items:
+            fout.write(packer.pack(item))
+
+
+def write_model(diagram: Diagram, fmt: str, path: str) -> None:
+    """Write the model of a diagram to a local file
+
+    Args:
+        diagram: The diagram, built
+        fmt: One of the keys of `MODEL_FORMATS`
+        path: The local file
+    """
+    if fmt == "msgpack":
+        with open(path, "wb") as fout:
+            write_msgpack(diagram, fout)
+    else:
+        with open(path, "w", encoding="utf-8") as fout:
+            write_json(diagram, fout)
@@ -0,0 +1,209 @@
+"""Provides a process-wide service to run the graphviz executables
+
+All the diagrams saved in the process, by any pipeline and any event loop,
+submit their renders to the same bounded pool of workers, so that the number
+of `dot` processes running at the same time is capped. Identical renders
+requested at the same time (e.g. the same pipeline run by many `Pipen`
+instances) run only once.
+
+To change the size of the pool, replace the renderer before the pipelines
+run, e.g. `pipen_diagram.renderer.RENDERER = Renderer(workers=4)`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import atexit
+import os
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from hashlib import sha256
+from typing import Deque, Dict, List, Sequence, Tuple
+
+from graphviz import CalledProcessError, ExecutableNotFound
+
+
+def available_cpus() -> int:
+    """Get the number of the cores available to the current process"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover, not on linux
+        return os.cpu_count() or 1
+
+
+def _run(cmd: List[str], source: str) -> bytes:
+    """Run a graphviz executable in a worker
+
+    Args:
+        cmd: The command
+        source: The DOT source to pass to the stdin
+
+    Returns:
+        The stdout of the command
+    """
+    try:
+        proc = subprocess.run(cmd, input=source.encode(), capture_output=True)
+    except FileNotFoundError as exc:
+        raise ExecutableNotFound(cmd) from exc
+
+    if proc.returncode != 0:
+        raise CalledProcessError(proc.returncode, cmd, stderr=proc.stderr)
+    return proc.stdout
+
+
+class Renderer:
+    """A bounded pool of workers running the graphviz executables
+
+    Args:
+        workers: The number of the workers, that is the max number of the
+            graphviz processes running at the same time. Default to the
+            number of available cores.
+        maxsize: The max number of the renders running or waiting in the
+            queue, the submitters wait for a free slot when it is reached,
+            and the freed slots are handed over to them in order.
+            Default to 4 times the number of the workers.
+    """
+
+    def __init__(self, workers: int | None = None, maxsize: int | None = None):
+        """Constructor"""
+        self.workers = workers or available_cpus()
+        self.maxsize = maxsize or self.workers * 4
+        self.stats = {"submitted": 0, "deduped": 0, "waited": 0}
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.maxsize)
+        self._inflight: Dict[Tuple[str, ...], Future] = {}
+        # the submitters waiting for a slot, from any event loop
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def _release(self) -> None:
+        """Hand a slot over to the first waiter, or free it if none is
+        waiting, with the lock held"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            try:
+                waiter.get_loop().call_soon_threadsafe(self._handover, waiter)
+            except RuntimeError:  # pragma: no cover, the loop is closed
+                continue
+            return
+        self._slots.release()
+
+    def _handover(self, waiter: asyncio.Future) -> None:
+        """Wake up a waiter with the slot, in its event loop"""
+        if waiter.cancelled():
+            with self._lock:
+                self._release()
+        else:
+            waiter.set_result(None)
+
+    def _submit(self, key: Tuple[str, ...], cmd: List[str], source: str):
+        """Join the identical render in flight, or start a new one with the
+        slot taken
+
+        Returns:
+            The future of the render
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats["deduped"] += 1
+                self._release()
+                return future
+
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    self.workers,
+                    thread_name_prefix="pipen-diagram-renderer",
+                )
+            self.stats["submitted"] += 1
+            future = self._inflight[key] = self._executor.submit(_run, cmd, source)
+
+        future.add_done_callback(partial(self._done, key))
+        return future
+
+    def _done(self, key: Tuple[str, ...], future: Future) -> None:
+        """Free the slot of a finished render"""
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            self._release()
+
+    async def render(self, cmd: Sequence[str], source: str) -> bytes:
+        """Render a graph
+
+        Args:
+            cmd: The command to run, without `-o`, so that the output goes
+                to the stdout
+            source: The DOT source of the graph
+
+        Returns:
+            The output of the command
+        """
+        cmd = list(cmd)
+        key = (sha256(source.encode()).hexdigest(), *cmd)
+        waiter = None
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats["deduped"] += 1
+            elif not self._slots.acquire(blocking=False):
+                self.stats["waited"] += 1
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+
+        if future is None:
+            if waiter is not None:
+                try:
+                    await waiter
+                except asyncio.CancelledError:
+                    # cancelled after the slot is handed over
+                    if waiter.done() and not waiter.cancelled():
+                        with self._lock:
+                            self._release()
+                    raise
+            future = self._submit(key, cmd, source)
+
+        # shield the shared future, so a cancelled waiter does not cancel
+        # the render for the other waiters
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def reset(self) -> None:
+        """Drop the pool and the renders in flight without waiting for them,
+        e.g. in a forked child, where the threads of the pool do not exist"""
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.maxsize)
+        self._inflight = {}
+        self._waiters = deque()
+
+    def shutdown(self) -> None:
+        """Cancel the queued renders and wait for the running ones
+
+        The renderer can still be used afterwards, with a new pool.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+# The renderer shared by all the diagrams in the process
+RENDERER = Renderer()
+
+
+@atexit.register
+def _shutdown() -> None:
+    """Shut down the renderer when the process exits"""
+    RENDERER.shutdown()
+
+
+def _after_fork() -> None:
+    """Start the renderer over in a forked child"""
+    RENDERER.reset()
+
+
+if hasattr(os, "register_at_fork"):  # pragma: no branch
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,176 @@
+"""Color the nodes in the rendered diagram by the status of the processes,
+while the pipeline is running"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping
+
+from panpath import CloudPath
+
+# The fill colors of the nodes by the status of the processes
+STATUS_COLORS = {
+    "queued": "#d9d9d9",
+    "running": "#ffd166",
+    "succeeded": "#06d6a0",
+    "failed": "#ef476f",
+    "cached": "#8ecae6",
+}
+# The id of the style element patched into the svg file
+STYLE_ID = "pipen-diagram-status"
+
+
+def node_id(name: str) -> str:
+    """Get the id of the element of a node in the rendered svg
+
+    Args:
+        name: The name of the node (process)
+
+    Returns:
+        The id of the node element
+    """
+    return f"proc_{name}"
+
+
+def summary_status(statuses: Iterable[str]) -> str:
+    """Get the status of a node showing multiple processes, for example the
+    summary node of a collapsed group
+
+    Args:
+        statuses: The statuses of the processes
+
+    Returns:
+        The status of any process failed or running, "succeeded" (or "cached"
+        if all cached) when all are done, and "running" when some are done
+        while the others are queued
+    """
+    statuses = set(statuses)
+    if len(statuses) == 1:
+        return statuses.pop()
+    for status in ("failed", "running"):
+        if status in statuses:
+            return status
+    if statuses <= {"succeeded", "cached"}:
+        return "succeeded"
+    return "running"
+
+
+def _selector(name: str) -> str:
+    """Get the css selector of the shapes of a node"""
+    nid = node_id(name).replace("\\", "\\\\").replace('"', '\\"')
+    return ",".join(
+        f'[id="{nid}"] {shape}' for shape in ("polygon", "path", "ellipse", "rect")
+    )
+
+
+class LiveStatus:
+    """Patch the status of the processes into the rendered svg file
+
+    The layout is not touched. A `<style>` element is inserted into the svg,
+    overriding the fill colors of the nodes. The updates are coalesced, so
+    that the file is rewritten at most once every `interval` seconds.
+
+    Args:
+        svgfile: The rendered svg file
+        names: The names of the processes in the diagram, or the names of the
+            nodes showing them by the names of the processes, where the
+            processes of a collapsed group are shown by its summary node
+        interval: The min interval (in seconds) between two rewrites
+    """
+
+    def __init__(
+        self,
+        svgfile: Path,
+        names: Iterable[str] | Mapping[str, str],
+        interval: float = 1.0,
+    ) -> None:
+        """Constructor"""
+        self.svgfile = svgfile
+        self.interval = interval
+        self.nodes: Dict[str, str] = (
+            dict(names)
+            if isinstance(names, Mapping)
+            else {name: name for name in names}
+        )
+        self.statuses: Dict[str, str] = dict.fromkeys(self.nodes, "queued")
+        # The svg content before and after the inserted style element
+        self._head: str | None = None
+        self._tail: str | None = None
+        self._task: asyncio.Task | None = None
+        self.writes = 0
+
+    async def load(self) -> None:
+        """Load the rendered svg file, and write the current statuses"""
+        svg = await self.svgfile.a_read_text()
+        start = svg.find("<svg")
+        end = svg.find(">", start) + 1
+        self._head, self._tail = svg[:end], svg[end:]
+        if self._tail.startswith(f'<style id="{STYLE_ID}">'):
+            # patched by a previous run
+            self._tail = self._tail[self._tail.index("</style>") + 8 :]
+        self.schedule()
+
+    def update(self, name: str, status: str) -> None:
+        """Update the status of a process, and schedule a rewrite
+
+        Args:
+            name: The name of the process
+            status: One of the keys of `STATUS_COLORS`
+        """
+        if name not in self.statuses or self.statuses[name] == status:
+            return
+        self.statuses[name] = status
+        self.schedule()
+
+    def schedule(self) -> None:
+        """Schedule a rewrite, unless one is pending or the svg is not loaded"""
+        if self._head is None or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        """Wait for more updates to come, then rewrite the file"""
+        await asyncio.sleep(self.interval)
+        self._task = None
+        await self.flush()
+
+    def style(self) -> str:
+        """Compose the style element of the current statuses"""
+        node_statuses: Dict[str, List[str]] = {}
+        for name, status in self.statuses.items():
+            node_statuses.setdefault(self.nodes[name], []).append(status)
+
+        names: Dict[str, List[str]] = {}
+        for node, statuses in node_statuses.items():
+            names.setdefault(summary_status(statuses), []).append(node)
+
+        rules = "".join(
+            f"{','.join(_selector(name) for name in members)}"
+            f"{{fill:{STATUS_COLORS[status]}}}"
+            for status, members in names.items()
+        )
+        return f'<style id="{STYLE_ID}"><![CDATA[{rules}]]></style>'
+
+    async def flush(self) -> None:
+        """Rewrite the svg file with the current statuses"""
+        if self._head is None:
+            return
+
+        content = f"{self._head}{self.style()}{self._tail}"
+        if isinstance(self.svgfile, CloudPath):
+            await self.svgfile.a_write_text(content)
+        else:
+            # replace the file at once so that a viewer never sees it half written
+            tmpfile = self.svgfile.with_name(f"{self.svgfile.name}.tmp")
+            await tmpfile.a_write_text(content)
+            os.replace(tmpfile, self.svgfile)
+        self.writes += 1
+
+    async def close(self) -> None:
+        """Cancel the pending rewrite and write the final statuses"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
@@ -0,0 +1,211 @@
+"""Read the timings of the processes from the last run, and find the
+critical path of the pipeline
+
+The timings are read from the metadata of the jobs in the workdir. A job is
+timed from the time it was submitted (its wrapped script, `job.wrapped.<scheduler>`,
+is written right before each submission) to the time it finished (`job.rc`).
+The wall time of a process is the time when at least one of its jobs was
+running, so that cached jobs from earlier runs do not count the time between
+the runs.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+if TYPE_CHECKING:  # pragma: no cover
+    from pathlib import Path
+    from pipen import Proc
+
+from .utils import proc_list
+
+# Max number of the jobs to read the metadata of at the same time
+METADATA_JOBS = 64
+
+
+class Timing(NamedTuple):
+    """The timing of a process in the last run"""
+
+    # The number of the finished jobs
+    jobs: int
+    # The wall time, in seconds
+    wall: float
+
+
+def format_duration(seconds: float) -> str:
+    """Format a duration for the labels, e.g. 1.2s, 3m05s or 2h07m
+
+    Args:
+        seconds: The duration in seconds
+
+    Returns:
+        The formatted duration
+    """
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    if minutes < 60:
+        return f"{minutes}m{seconds:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m"
+
+
+def _busy_time(intervals: List[Tuple[float, float]]) -> float:
+    """The length of the union of the intervals"""
+    intervals.sort()
+    total = 0.0
+    cur_start, cur_end = intervals[0]
+    for start, end in intervals[1:]:
+        if start > cur_end:
+            total += cur_end - cur_start
+            cur_start = start
+        cur_end = max(cur_end, end)
+    return total + cur_end - cur_start
+
+
+async def job_dirs(workdir: Path, names: Sequence[str]) -> List[List[Path]]:
+    """List the job directories of the processes concurrently
+
+    Args:
+        workdir: The workdir of the pipeline
+        names: The names of the processes
+
+    Returns:
+        The job directories of each process, empty if the process has not run
+    """
+
+    async def _jobdirs(name: str) -> List[Path]:
+        try:
+            return [
+                jobdir
+                async for jobdir in (workdir / name).a_iterdir()
+                if jobdir.name.isdigit()
+            ]
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+
+    return await asyncio.gather(*(_jobdirs(name) for name in names))
+
+
+async def read_timings(
+    workdir: Path,
+    names: Iterable[str],
+    jobs: int = METADATA_JOBS,
+) -> Dict[str, Timing]:
+    """Read the timings of the processes from the metadata of their jobs
+
+    The job directories of all the processes are listed concurrently, then
+    the metadata of all the jobs are read in one batch, at most `jobs` at the
+    same time.
+
+    Args:
+        workdir: The workdir of the pipeline
+        names: The names of the processes
+        jobs: Max number of the jobs to read at the same time
+
+    Returns:
+        The timings of the processes with at least one finished job
+    """
+    semaphore = asyncio.Semaphore(jobs)
+
+    async def _interval(jobdir: Path) -> Tuple[float, float] | None:
+        async with semaphore:
+            files = {
+                metafile.name: metafile
+                async for metafile in jobdir.a_iterdir()
+                if metafile.name == "job.rc"
+                or metafile.name.startswith("job.wrapped.")
+            }
+            wrapped = [name for name in files if name != "job.rc"]
+            if "job.rc" not in files or not wrapped:  # not submitted or finished
+                return None
+            start, end = await asyncio.gather(
+                files[wrapped[0]].a_stat(),
+                files["job.rc"].a_stat(),
+            )
+        return start.st_mtime, end.st_mtime
+
+    names = list(names)
+    jobdirs = await job_dirs(workdir, names)
+    intervals = await asyncio.gather(
+        *(_interval(jobdir) for dirs in jobdirs for jobdir in dirs)
+    )
+
+    timings: Dict[str, Timing] = {}
+    pos = 0
+    for name, dirs in zip(names, jobdirs):
+        finished = [
+            interval
+            for interval in intervals[pos : pos + len(dirs)]
+            if interval is not None
+        ]
+        pos += len(dirs)
+        if finished:
+            timings[name] = Timing(len(finished), _busy_time(finished))
+    return timings
+
+
+def critical_path(
+    procs: Iterable[Type[Proc]],
+    timings: Mapping[str, Timing],
+) -> Tuple[List[Type[Proc]], float]:
+    """Find the path through the pipeline with the longest total wall time
+
+    The processes are visited in topological order, so that the path is
+    found in linear time of the number of the processes and the dependencies.
+    The processes without timings count as taking no time.
+
+    Args:
+        procs: All the processes of the pipeline, including the hidden ones
+        timings: The timings of the processes, from `read_timings()`
+
+    Returns:
+        The processes along the critical path, and its total wall time
+    """
+    procs = list(procs)
+    indegrees = {proc: len(proc_list(proc.requires)) for proc in procs}
+    queue = deque(proc for proc, indegree in indegrees.items() if not indegree)
+    # The earliest time that a process can start, and the process it waits for
+    starts: Dict[Type[Proc], float] = {}
+    waits: Dict[Type[Proc], Type[Proc]] = {}
+    finishes: Dict[Type[Proc], float] = {}
+
+    while queue:
+        proc = queue.popleft()
+        timing = timings.get(proc.name)
+        finish = finishes[proc] = starts.get(proc, 0.0) + (
+            timing.wall if timing else 0.0
+        )
+        for nproc in proc.nexts or ():
+            if nproc not in indegrees:  # pragma: no cover, not in pipeline
+                continue
+            if finish > starts.get(nproc, -1.0):
+                starts[nproc] = finish
+                waits[nproc] = proc
+            indegrees[nproc] -= 1
+            if not indegrees[nproc]:
+                queue.append(nproc)
+
+    if not finishes:
+        return [], 0.0
+
+    # the last one visited wins the ties, so that the path ends at an end
+    # process rather than the one before it if the end process takes no time
+    last = max(reversed(list(finishes)), key=finishes.__getitem__)
+    path = [last]
+    while path[-1] in waits:
+        path.append(waits[path[-1]])
+    path.reverse()
+    return path, finishes[last]
@@ -0,0 +1,67 @@
+"""Utilities needed before a diagram is built
+
+Kept apart from `diagram`, so that checking whether a diagram needs to be
+saved at all does not import `graphviz` or build the themes.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, List, Sequence, Type
+from weakref import WeakKeyDictionary
+
+from pipen.utils import desc_from_docstring
+
+from .model import MODEL_FORMATS
+
+if TYPE_CHECKING:  # pragma: no cover
+    from pipen import Proc
+
+# The tooltips of the processes, shared by all the diagrams in the process
+TOOLTIPS: WeakKeyDictionary[Type[Proc], str] = WeakKeyDictionary()
+
+
+def get_tooltip(proc: Type[Proc]) -> str:
+    """Get the tooltip of a process, parsing the docstring only once
+
+    Args:
+        proc: The process
+
+    Returns:
+        The description of the process, or the summary of its docstring
+    """
+    try:
+        return TOOLTIPS[proc]
+    except KeyError:
+        tooltip = TOOLTIPS[proc] = proc.desc or desc_from_docstring(proc, None) or ""
+        return tooltip
+
+
+def proc_list(procs: Type[Proc] | Sequence[Type[Proc]] | None) -> List[Type[Proc]]:
+    """Get the processes given as one or many, such as `requires` or `starts`
+
+    Args:
+        procs: A process, the processes or None
+
+    Returns:
+        The list of the processes
+    """
+    if procs is None:
+        return []
+    if isinstance(procs, type):
+        return [procs]
+    return list(procs)
+
+
+def suffix(fmt: str, minify: bool | str = False) -> str:
+    """Get the file extension of the rendered file of a format
+
+    Args:
+        fmt: The format
+        minify: The minify option of the diagram
+
+    Returns:
+        The file extension
+    """
+    if fmt in MODEL_FORMATS:
+        return MODEL_FORMATS[fmt]
+    return "svgz" if fmt == "svg" and minify == "gzip" else fmt
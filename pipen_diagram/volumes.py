@@ -0,0 +1,193 @@
+"""Read the number of the jobs and the sizes of the input and output files of
+the processes from the last run
+
+The paths of the input and output files are read from the signatures of the
+jobs (`job.signature.toml`, written by pipen when a job finishes), then all
+the distinct paths are stat'ed in one batch. For the directories, only the
+size of the directory entry is counted, they are not walked.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Set,
+    Tuple,
+)
+
+from panpath import PanPath
+from simpleconf import Config
+
+from .timings import METADATA_JOBS, Timing, job_dirs
+
+if TYPE_CHECKING:  # pragma: no cover
+    from pathlib import Path
+
+# The metrics to scale the nodes by
+METRICS = ("jobs", "input_size", "output_size", "rate")
+# The types of the input and output data that are paths
+PATH_TYPES = {"file", "dir"}
+MULTI_PATH_TYPES = {"files", "dirs"}
+
+
+class Volume(NamedTuple):
+    """The data volume of a process in the last run"""
+
+    # The number of the finished jobs, also the number of the output items
+    jobs: int
+    # The total size of the input files, in bytes
+    input_bytes: int
+    # The total size of the output files, in bytes
+    output_bytes: int
+
+
+def format_size(size: float) -> str:
+    """Format a size for the labels, e.g. 12B, 3.4KB or 1.2GB
+
+    Args:
+        size: The size in bytes
+
+    Returns:
+        The formatted size
+    """
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024.0
+    return f"{size:.1f}TB"
+
+
+def _paths(section: Any) -> List[str]:
+    """The paths in the input or output section of a signature"""
+    if not section:
+        return []
+
+    out = []
+    types, data = section.get("type", {}), section.get("data", {})
+    for key, type_ in types.items():
+        value = data.get(key)
+        if not value:
+            continue
+        if type_ in PATH_TYPES:
+            out.append(value)
+        elif type_ in MULTI_PATH_TYPES:
+            out.extend(value)
+    return out
+
+
+async def read_volumes(
+    workdir: Path,
+    names: Iterable[str],
+    jobs: int = METADATA_JOBS,
+) -> Dict[str, Volume]:
+    """Read the data volumes of the processes from the signatures of their jobs
+
+    Args:
+        workdir: The workdir of the pipeline
+        names: The names of the processes
+        jobs: Max number of the files to read or stat at the same time
+
+    Returns:
+        The volumes of the processes with at least one finished job
+    """
+    semaphore = asyncio.Semaphore(jobs)
+
+    async def _signature(jobdir: Path) -> Any:
+        async with semaphore:
+            try:
+                text = await (jobdir / "job.signature.toml").a_read_text()
+            except FileNotFoundError:  # not finished
+                return None
+        return Config.load(text, loader="tomls")
+
+    async def _size(path: str) -> int:
+        async with semaphore:
+            try:
+                return (await PanPath(path).a_stat()).st_size
+            except (FileNotFoundError, NotADirectoryError):  # removed since
+                return 0
+
+    names = list(names)
+    jobdirs = await job_dirs(workdir, names)
+    signatures = await asyncio.gather(
+        *(_signature(jobdir) for dirs in jobdirs for jobdir in dirs)
+    )
+
+    # the paths of each process, the output files of a process are mostly
+    # the input files of the next ones, so each path is stat'ed only once
+    inputs: Dict[str, Set[str]] = {}
+    outputs: Dict[str, Set[str]] = {}
+    counts: Dict[str, int] = {}
+    pos = 0
+    for name, dirs in zip(names, jobdirs):
+        for signature in signatures[pos : pos + len(dirs)]:
+            if signature is None:
+                continue
+            counts[name] = counts.get(name, 0) + 1
+            inputs.setdefault(name, set()).update(_paths(signature.get("input")))
+            outputs.setdefault(name, set()).update(_paths(signature.get("output")))
+        pos += len(dirs)
+
+    paths = list(
+        set().union(*inputs.values(), *outputs.values()) if counts else ()
+    )
+    sizes = dict(zip(paths, await asyncio.gather(*(_size(path) for path in paths))))
+    return {
+        name: Volume(
+            count,
+            sum(sizes[path] for path in inputs[name]),
+            sum(sizes[path] for path in outputs[name]),
+        )
+        for name, count in counts.items()
+    }
+
+
+def metric_values(
+    metric: str,
+    volumes: Mapping[str, Volume],
+    timings: Mapping[str, Timing] | None = None,
+) -> Dict[str, Tuple[float, str]]:
+    """Compute a metric of the processes, with the texts for the labels
+
+    Args:
+        metric: One of `METRICS`
+        volumes: The volumes of the processes, from `read_volumes()`
+        timings: The timings of the processes, from `read_timings()`,
+            required by the "rate" metric
+
+    Returns:
+        The values of the metric and the texts, by the names of the processes
+    """
+    if metric not in METRICS:
+        raise ValueError(
+            f"Unknown metric {metric!r} to annotate the diagram, "
+            f"expected one of {', '.join(METRICS)}."
+        )
+
+    out: Dict[str, Tuple[float, str]] = {}
+    for name, volume in volumes.items():
+        if metric == "jobs":
+            out[name] = (
+                volume.jobs,
+                f"{volume.jobs} job{'s' if volume.jobs > 1 else ''}",
+            )
+        elif metric == "input_size":
+            out[name] = (volume.input_bytes, f"in {format_size(volume.input_bytes)}")
+        elif metric == "output_size":
+            out[name] = (
+                volume.output_bytes,
+                f"out {format_size(volume.output_bytes)}",
+            )
+        else:
+            timing = (timings or {}).get(name)
+            if timing and timing.wall > 0:
+                rate = volume.jobs / timing.wall
+                out[name] = (rate, f"{rate:.2g} jobs/s")
+    return out
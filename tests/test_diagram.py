@@ -1,3 +1,4 @@
+import os
 import pytest
 from unittest.mock import MagicMock
 from panpath import CloudPath, PanPath
@@ -5,6 +6,12 @@ from pipen import Pipen, Proc, ProcGroup
 from pipen_diagram import PipenDiagram
 
 
+@pytest.fixture(autouse=True)
+def cachehome(tmp_path, monkeypatch):
+    """Keep the render cache of each test to itself"""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+
 @pytest.fixture
 def pipen(tmp_path):
     index = Pipen.PIPELINE_COUNT + 1
@@ -84,6 +91,24 @@ def test_diagram(pipen, caplog):
     assert "<title>pipeline" in svg
 
 
+@pytest.mark.forked
+def test_background(tmp_path, caplog):
+    p1 = Proc.from_proc(NormalProc, input_data=[1])
+    p2 = Proc.from_proc(NormalProc, requires=p1)
+
+    pipen = Pipen(
+        name="pipeline_bg",
+        cache=False,
+        plugins=[PipenDiagram],
+        plugin_opts={"diagram_background": True, "diagram_loglevel": "debug"},
+        outdir=tmp_path / "pipen_bg",
+    )
+    pipen.set_starts(p1).run()
+    svg = (pipen.outdir / "diagram.svg").read_text()
+    assert "<title>pipeline_bg" in svg
+    assert "Diagram saved to" in caplog.text
+
+
 @pytest.mark.forked
 def test_hide_end_proc(pipen):
     p1 = Proc.from_proc(NormalProc, input_data=[1])
@@ -140,7 +165,13 @@ def test_custom_theme(pipen_custom_theme):
 
 
 @pytest.mark.forked
-def test_cloud_outdir(pipen_custom_theme, tmp_path):
+def test_cloud_outdir(pipen_custom_theme, tmp_path, monkeypatch):
+    import tempfile
+
+    tempdir = tmp_path / "tempdir"
+    tempdir.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(tempdir))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
     p1 = Proc.from_proc(NormalProc, input_data=[1])
     p2 = Proc.from_proc(NormalProc, requires=p1)
     p3 = Proc.from_proc(HiddenProc, requires=p2)
@@ -162,6 +193,45 @@ def test_cloud_outdir(pipen_custom_theme, tmp_path):
 
     pipen_custom_theme.set_starts(p1).run()
     assert tmp_path.joinpath("xyz.svg").exists()
+    assert tmp_path.joinpath("xyz.dot").read_text().startswith("digraph")
+    # the local rendering directory is cleaned up
+    assert list(tempdir.iterdir()) == []
+
+
+def test_upload(tmp_path, monkeypatch):
+    import asyncio
+    import pipen_diagram.diagram as diagram_module
+
+    monkeypatch.setattr(diagram_module, "UPLOAD_CHUNK_SIZE", 4)
+    src = tmp_path / "src.svg"
+    src.write_bytes(b"0123456789")
+
+    chunks = []
+    opened = {}
+
+    class FakeCloudFile:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *args):
+            pass
+
+        async def write(self, data):
+            chunks.append(data)
+
+    def a_open(mode, **kwargs):
+        opened.update(mode=mode, **kwargs)
+        return FakeCloudFile()
+
+    dst = MagicMock(spec=CloudPath)
+    dst.a_open = a_open
+
+    assert asyncio.run(diagram_module.upload(src, dst)) == 10
+    assert chunks == [b"0123", b"4567", b"89"]
+    assert opened == {
+        "mode": "wb",
+        "chunk_size": diagram_module.UPLOAD_BUFFER_SIZE,
+    }
 
 
 class PG(ProcGroup):
@@ -240,3 +310,1643 @@ def test_theme_not_found(tmp_path):
     assert "Theme x not found" in str(err) or (
         cause and "Theme x not found" in str(cause)
     )
+
+
+@pytest.mark.forked
+def test_render_cache(tmp_path, monkeypatch):
+    import asyncio
+    from pipen_diagram.cache import RenderCache
+    from pipen_diagram.diagram import Diagram
+
+    tmp_path = PanPath(tmp_path)
+    p1 = Proc.from_proc(NormalProc, input_data=[1])
+    p2 = Proc.from_proc(NormalProc, requires=p1)
+
+    def build(engine="dot"):
+        diagram = Diagram(
+            "pipeline",
+            tmp_path / "out" / "diagram",
+            savedot=False,
+            cache=RenderCache(tmp_path / "cache"),
+            engine=engine,
+        )
+        diagram.add_node(p1, role="start")
+        diagram.add_node(p2, role="end")
+        diagram.add_edge(p1, p2)
+        diagram.build()
+        return diagram
+
+    asyncio.run(build().save())
+    assert len(list((tmp_path / "cache").glob("*.svg"))) == 1
+    svg = (tmp_path / "out" / "diagram.svg").read_text()
+    (tmp_path / "out" / "diagram.svg").unlink()
+
+    async def render(*args, **kwargs):
+        raise AssertionError("dot should not run on a cache hit")
+
+    # the engine is not in the DOT source, but in the key
+    diagram = build("circo")
+    asyncio.run(diagram.save())
+    assert diagram.stats["cache_hits"] == []
+    assert len(list((tmp_path / "cache").glob("*.svg"))) == 2
+    assert (tmp_path / "out" / "diagram.svg").read_text() != svg
+
+    monkeypatch.setattr(Diagram, "_render", render)
+    diagram = build()
+    asyncio.run(diagram.save())
+    assert diagram.stats["cache_hits"] == ["svg"]
+    assert (tmp_path / "out" / "diagram.svg").read_text() == svg
+
+
+def test_render_cache_eviction(tmp_path):
+    import asyncio
+    import os
+    import time
+    from pipen_diagram.cache import RenderCache
+
+    now = time.time()
+    cachedir = PanPath(tmp_path) / "cache"
+    cachedir.mkdir()
+    for i, age in enumerate([10000, 30, 20, 10]):
+        entry = cachedir / f"{i}.svg"
+        entry.write_text("x" * 10)
+        os.utime(entry, (now - age, now - age))
+
+    # entry 0 is too old, entry 1 is the least recently used one
+    asyncio.run(RenderCache(cachedir, maxsize=20, maxage=1000).evict())
+    assert sorted(p.name for p in cachedir.iterdir()) == ["2.svg", "3.svg"]
+
+
+def test_get_mates():
+    from pipen_diagram.entry import _get_mates
+
+    class P:
+        def __init__(self, hidden=False):
+            self.nexts = []
+            self.plugin_opts = {"diagram_hide": hidden}
+
+    # a -> h1 -> h2 -> b, a -> h3 -> h2, a -> b, b -> h4 -> c
+    a, b, c = P(), P(), P()
+    h1, h2, h3, h4 = P(True), P(True), P(True), P(True)
+    a.nexts = [h1, h3, b]
+    h1.nexts = [h2]
+    h3.nexts = [h2]
+    h2.nexts = [b]
+    b.nexts = [h4]
+    h4.nexts = [c]
+
+    mates = _get_mates([a, b, c, h1, h2, h3, h4])
+    assert mates == {a: [(b, False)], b: [(c, True)], c: []}
+
+
+def test_node_records(tmp_path, monkeypatch):
+    import pipen_diagram.utils as utils_module
+    from pipen_diagram.diagram import Diagram
+
+    class Documented(Proc):
+        """Documented process"""
+
+    calls = []
+    desc_from_docstring = utils_module.desc_from_docstring
+
+    def counting_desc_from_docstring(proc, base):
+        calls.append(proc)
+        return desc_from_docstring(proc, base)
+
+    monkeypatch.setattr(
+        utils_module, "desc_from_docstring", counting_desc_from_docstring
+    )
+    # Proc sets desc from the docstring already, clear it to parse it here
+    monkeypatch.setattr(Documented, "desc", None)
+
+    pg = PG()
+    for _ in range(2):
+        diagram = Diagram("pipeline", PanPath(tmp_path) / "diagram", False)
+        diagram.add_node(Documented, role="start")
+        diagram.add_node(pg.c, group=pg, role="end")
+        diagram.build()
+
+        record = diagram.records[Documented]
+        assert (record.name, record.role, record.group) == (
+            "Documented",
+            "start",
+            None,
+        )
+        assert record.tooltip == "Documented process"
+        assert diagram.records[pg.c].group == "PG"
+        assert "Documented process" in diagram.graph.source
+
+    # parsed only once for each process
+    assert calls == [Documented, pg.c]
+
+
+def test_resolve_theme():
+    from pipen_diagram.diagram import resolve_theme
+
+    custom = {"start": {"color": "#59b95f"}, "procgroup": {"color": "red"}}
+    theme = resolve_theme(custom, base="dark")
+    # resolved only once
+    assert resolve_theme(dict(custom), base="dark") is theme
+    assert resolve_theme("dark") is resolve_theme("dark")
+    assert theme.digest != resolve_theme(custom).digest
+
+    # merged over the base theme
+    assert theme.roles["start"]["shape"] == "diamond"
+    assert theme.roles["start"]["color"] == "#59b95f"
+    assert theme.graph["bgcolor"] == "#333333"
+    assert theme.group["color"] == "red"
+    assert theme.group["labeljust"] == "l"
+    assert "node" not in theme.group
+    assert theme.group_edge_hidden == {"style": "dashed"}
+
+    with pytest.raises(TypeError):
+        theme.roles["start"]["color"] = "blue"
+
+    with pytest.raises(ValueError, match="Theme x not found"):
+        resolve_theme(custom, base="x")
+
+
+@pytest.mark.forked
+def test_multiple_formats(tmp_path, monkeypatch):
+    import asyncio
+    import json
+    from pipen_diagram.diagram import Diagram
+
+    calls = []
+    _render = Diagram._render
+
+    async def render(self, source, fmt, outfile=None, engine=None, args=()):
+        calls.append((fmt, engine))
+        return await _render(self, source, fmt, outfile, engine, args)
+
+    monkeypatch.setattr(Diagram, "_render", render)
+
+    pg = PG()
+    p1 = Proc.from_proc(NormalProc, input_data=[1])
+    diagram = Diagram(
+        "pipeline",
+        PanPath(tmp_path) / "diagram",
+        savedot=False,
+        formats=["svg", "png", "json"],
+    )
+    diagram.add_node(p1, role="start")
+    diagram.add_node(pg.c, group=pg, role="end")
+    diagram.add_edge(p1, pg.c)
+    diagram.build()
+    asyncio.run(diagram.save())
+
+    # laid out only once
+    assert calls[0] == ("dot", None)
+    assert sorted(calls[1:]) == [
+        ("json", "neato"),
+        ("png", "neato"),
+        ("svg", "neato"),
+    ]
+    assert "cluster_PG" in (tmp_path / "diagram.svg").read_text()
+    assert (tmp_path / "diagram.png").read_bytes().startswith(b"\x89PNG")
+    assert json.loads((tmp_path / "diagram.json").read_text())["name"] == "pipeline"
+
+
+def test_builtin_engine(tmp_path, monkeypatch):
+    import asyncio
+    from pipen_diagram.diagram import Diagram
+
+    async def render(*args, **kwargs):
+        raise AssertionError("dot should not run with the builtin engine")
+
+    monkeypatch.setattr(Diagram, "_render", render)
+
+    pg = PG()
+    p1 = Proc.from_proc(NormalProc, input_data=[1])
+    p2 = Proc.from_proc(NormalProc, requires=p1)
+    diagram = Diagram(
+        "pipeline",
+        PanPath(tmp_path) / "diagram",
+        savedot=False,
+        engine="builtin",
+    )
+    diagram.set_theme("fancy_dark")
+    diagram.add_node(p1, role="start")
+    diagram.add_node(p2)
+    diagram.add_node(pg.c, group=pg)
+    diagram.add_node(pg.d, group=pg, role="end")
+    diagram.add_edge(p1, p2)
+    diagram.add_edge(p1, pg.c)
+    diagram.add_edge(pg.c, pg.d, group=pg, has_hidden=True)
+    diagram.build()
+    asyncio.run(diagram.save())
+
+    svg = (tmp_path / "diagram.svg").read_text()
+    assert svg.count('class="node"') == 4
+    assert svg.count('class="edge"') == 3
+    assert "<title>cluster_PG</title>" in svg
+    assert 'stroke-dasharray="5,2"' in svg
+    # start node is a diamond, with the fill color from the theme
+    assert '<polygon points="' in svg
+    assert "#4c956c" in svg
+    assert "#333333" in svg
+
+    with pytest.raises(ValueError, match="only render svg"):
+        Diagram("x", PanPath(tmp_path), False, formats=["png"], engine="builtin")
+
+
+def test_builtin_labels(tmp_path):
+    from pipen_diagram.builtin import layout, render_svg
+    from pipen_diagram.diagram import Diagram
+    from pipen_diagram.timings import Timing
+
+    p1 = Proc.from_proc(NormalProc, name="BuiltinP1")
+    p2 = Proc.from_proc(HiddenProc, name="BuiltinP2", requires=p1)
+    p3 = Proc.from_proc(NormalProc, name="BuiltinP3", requires=p2)
+    diagram = Diagram(
+        "pipeline",
+        PanPath(tmp_path) / "diagram",
+        savedot=False,
+        engine="builtin",
+    )
+    diagram.add_node(p1, role="start")
+    diagram.add_node(p3, role="end")
+    diagram.add_hidden(p2)
+    diagram.add_edge(p1, p3, has_hidden=True)
+    diagram.add_timings(
+        {"BuiltinP1": Timing(2, 3.0), "BuiltinP2": Timing(1, 65.0)},
+        [p1, p2, p3],
+    )
+    diagram.add_volumes({"BuiltinP1": (1024.0, "out 1.0KB")}, {"BuiltinP1": 2})
+    diagram.build()
+
+    svg = render_svg(diagram)
+    assert ">BuiltinP1</text>" in svg
+    assert ">3.0s, 2 jobs</text>" in svg
+    assert ">out 1.0KB</text>" in svg
+    # the time of the hidden process on the edge
+    assert ">+1m05s</text>" in svg
+    assert "<title>2 items</title>" in svg
+    # the nodes are sized by their labels
+    lay = layout(diagram)
+    assert lay.heights[lay.ids["BuiltinP1"]] > lay.heights[lay.ids["BuiltinP3"]]
+
+
+@pytest.mark.forked
+def test_stats(tmp_path, caplog):
+    import json
+
+    p1 = Proc.from_proc(NormalProc, input_data=[1])
+    p2 = Proc.from_proc(NormalProc, requires=p1)
+    p3 = Proc.from_proc(HiddenProc, requires=p2)
+    p4 = Proc.from_proc(NormalProc, requires=p3)
+
+    def run(level):
+        pipen = Pipen(
+            name="pipeline_stats",
+            cache=False,
+            plugins=[PipenDiagram],
+            plugin_opts={
+                "diagram_stats": True,
+                "diagram_stats_loglevel": level,
+                "diagram_cache": False,
+                "diagram_skip_unchanged": False,
+            },
+            outdir=tmp_path / "pipen_stats",
+        )
+        pipen.set_starts(p1).run()
+        return pipen
+
+    pipen = run("info")
+    stats = json.loads((pipen.outdir / "diagram.stats.json").read_text())
+    assert stats["counts"] == {
+        "nodes": 3,
+        "edges": 2,
+        "groups": 0,
+        "collapsed": 0,
+        "pinned": 0,
+        "hidden": 1,
+    }
+    for phase in ("mates", "add", "build", "serialize", "dot", "render", "save"):
+        assert stats["timings"][phase] >= 0
+    assert stats["upload"] == {"files": 0, "bytes": 0}
+    assert "Diagram stats: nodes=3, edges=2" in caplog.text
+
+    caplog.clear()
+    run("x")
+    assert "Unknown diagram_stats_loglevel 'x', using debug" in caplog.text
+
+
+@pytest.mark.forked
+def test_live_status(tmp_path):
+    p1 = Proc.from_proc(NormalProc, input_data=[1])
+    p2 = Proc.from_proc(NormalProc, requires=p1)
+
+    pipen = Pipen(
+        name="pipeline_live",
+        cache=False,
+        plugins=[PipenDiagram],
+        plugin_opts={"diagram_live": True, "diagram_live_interval": 0.01},
+        outdir=tmp_path / "pipen_live",
+    )
+    pipen.set_starts(p1).run()
+    svg = (pipen.outdir / "diagram.svg").read_text()
+    assert f'<g id="proc_{p1.name}" class="node">' in svg
+    assert svg.count('<style id="pipen-diagram-status">') == 1
+    assert f'[id="proc_{p2.name}"] polygon' in svg
+    assert "#06d6a0" in svg  # succeeded
+    assert "#d9d9d9" not in svg  # queued
+
+
+def test_live_status_coalesced(tmp_path):
+    import asyncio
+    from pipen_diagram.status import LiveStatus, STATUS_COLORS
+
+    svgfile = PanPath(tmp_path / "diagram.svg")
+    svgfile.write_text('<?xml version="1.0"?>\n<svg width="1pt"><g/></svg>')
+    names = [f"p{i}" for i in range(2000)]
+
+    async def run():
+        live = LiveStatus(svgfile, names, interval=0.05)
+        live.update("p0", "running")  # ignored, svg not loaded yet
+        await live.load()
+        for name in names:
+            live.update(name, "running")
+            live.update(name, "succeeded")
+            await asyncio.sleep(0)
+        live.update("p1", "failed")
+        live.update("nonexist", "failed")
+        await live.close()
+        return live.writes
+
+    writes = asyncio.run(run())
+    assert writes < 5
+    svg = svgfile.read_text()
+    assert svg.startswith('<?xml version="1.0"?>\n<svg width="1pt"><style id=')
+    assert svg.endswith("<g/></svg>")
+    assert STATUS_COLORS["failed"] in svg
+    assert STATUS_COLORS["running"] not in svg
+    assert not svgfile.with_name("diagram.svg.tmp").exists()
+
+    async def rerun():
+        # a diagram patched by a previous run
+        live = LiveStatus(svgfile, names, interval=0.05)
+        await live.load()
+        await live.close()
+
+    asyncio.run(rerun())
+    svg = svgfile.read_text()
+    assert svg.count("<style") == 1
+    assert STATUS_COLORS["failed"] not in svg
+
+
+@pytest.mark.forked
+def test_live_status_collapsed(tmp_path, caplog):
+    from pipen_diagram.status import summary_status
+
+    assert summary_status(["queued", "queued"]) == "queued"
+    assert summary_status(["succeeded", "queued"]) == "running"
+    assert summary_status(["succeeded", "running"]) == "running"
+    assert summary_status(["failed", "running"]) == "failed"
+    assert summary_status(["succeeded", "cached"]) == "succeeded"
+    assert summary_status(["cached", "cached"]) == "cached"
+
+    def run():
+        # the groups and the processes are singletons, bound to the pipeline
+        class LiveGroup(ProcGroup):
+            """Process Group"""
+
+            @ProcGroup.add_proc
+            def c(self):
+                return Proc.from_proc(NormalProc, name="LiveC", input_data=[1])
+
+            @ProcGroup.add_proc
+            def d(self):
+                return Proc.from_proc(NormalProc, name="LiveD", requires=self.c)
+
+        pg = LiveGroup()
+        pipen = Pipen(
+            name="pipeline_live_collapsed",
+            cache=False,
+            plugins=[PipenDiagram],
+            plugin_opts={
+                "diagram_live": True,
+                "diagram_live_interval": 0.01,
+                "diagram_collapse_groups": True,
+                "diagram_loglevel": "debug",
+            },
+            outdir=tmp_path / "pipen_live_collapsed",
+        )
+        pipen.set_start(pg.c).run()
+        return (pipen.outdir / "diagram.svg").read_text()
+
+    # the summary node is colored by the statuses of the processes, also
+    # when the diagram is unchanged and not built again
+    for unchanged in (False, True):
+        svg = run()
+        assert ("Diagram unchanged" in caplog.text) is unchanged
+        assert '<g id="proc_LiveGroup" class="node">' in svg
+        assert '[id="proc_LiveGroup"] polygon' in svg
+        assert "proc_LiveC" not in svg
+        assert "#06d6a0" in svg  # succeeded
+        assert "#d9d9d9" not in svg  # queued
+
+
+@pytest.mark.forked
+def test_collapse_groups(tmp_path):
+    import asyncio
+    from pipen_diagram.diagram import Diagram
+
+    pg = PG()
+    p1 = Proc.from_proc(NormalProc, name="P1", input_data=[1])
+    p2 = Proc.from_proc(NormalProc, name="P2")
+
+    def _diagram(collapse_groups):
+        diagram = Diagram(
+            "pipeline",
+            PanPath(tmp_path) / "diagram",
+            savedot=False,
+            collapse_groups=collapse_groups,
+        )
+        diagram.add_node(p1, role="start")
+        diagram.add_node(p2, role="end")
+        diagram.add_node(pg.c, group=pg)
+        diagram.add_node(pg.d, group=pg)
+        diagram.add_edge(p1, pg.c)
+        diagram.add_edge(p1, pg.d, has_hidden=True)
+        diagram.add_edge(pg.d, p2, has_hidden=True)
+        diagram.add_edge(pg.c, pg.d, group=pg, has_hidden=True)
+        diagram.build()
+        return diagram
+
+    diagram = _diagram(3)
+    assert "subgraph cluster_PG" in diagram.graph.source
+    assert diagram.collapsed == {}
+
+    diagram = _diagram(["PG"])
+    source = diagram.graph.source
+    assert "cluster_PG" not in source
+    assert 'PG [fillcolor="#eeeeee" id=proc_PG shape=box3d' in source
+    # p1 -> c and p1 -> d (with hidden) aggregated, as not hidden
+    assert "P1 -> PG\n" in source
+    assert "PG -> P2 [style=dashed]" in source
+    assert diagram.stats["counts"]["nodes"] == 3
+    assert diagram.stats["counts"]["edges"] == 2
+    assert diagram.stats["counts"]["collapsed"] == 1
+
+    detail = diagram.detail("PG")
+    detail.build()
+    asyncio.run(detail.save())
+    svg = (tmp_path / "diagram.PG.svg").read_text()
+    assert f'id="proc_{pg.c.name}"' in svg
+    assert f'id="proc_{pg.d.name}"' in svg
+    assert svg.count('class="edge"') == 1
+
+
+@pytest.mark.forked
+def test_group_diagrams(tmp_path, monkeypatch):
+    import asyncio
+    from pipen_diagram.diagram import Diagram
+
+    from types import SimpleNamespace
+
+    groups = [SimpleNamespace(name=f"G{i}") for i in range(3)]
+    diagram = Diagram("pipeline", PanPath(tmp_path) / "diagram", savedot=False)
+    for group in groups:
+        group.c = Proc.from_proc(NormalProc, name=f"{group.name}_C")
+        group.d = Proc.from_proc(NormalProc, name=f"{group.name}_D")
+        diagram.add_node(group.c, group=group)
+        diagram.add_node(group.d, group=group)
+        diagram.add_edge(group.c, group.d, group=group, has_hidden=True)
+    diagram.build()
+
+    running = []
+    concurrency = []
+    save = Diagram.save
+
+    async def fake_save(self):
+        running.append(self.graph.name)
+        concurrency.append(len(running))
+        await asyncio.sleep(0.05)
+        running.remove(self.graph.name)
+
+    monkeypatch.setattr(Diagram, "save", fake_save)
+    asyncio.run(diagram.save_details(diagram.groups, jobs=2))
+    assert len(concurrency) == 3
+    assert max(concurrency) == 2
+
+    monkeypatch.setattr(Diagram, "save", save)
+    asyncio.run(diagram.save_details(diagram.groups))
+    for group in groups:
+        svg = (tmp_path / f"diagram.{group.name}.svg").read_text()
+        assert f'<g id="proc_{group.c.name}" class="node">' in svg
+        assert svg.count('class="edge"') == 1
+    assert diagram.stats["timings"]["details"] > 0
+
+
+@pytest.mark.forked
+@pytest.mark.parametrize("lod", ["lazy", "eager"])
+def test_lod(tmp_path, lod):
+    class LodGroup(ProcGroup):
+        """Process Group"""
+
+        @ProcGroup.add_proc
+        def c(self):
+            return Proc.from_proc(NormalProc, name="LodC", input_data=[1])
+
+        @ProcGroup.add_proc
+        def d(self):
+            return Proc.from_proc(NormalProc, name="LodD", requires=self.c)
+
+    pg = LodGroup()
+    pipen = Pipen(
+        name=f"pipeline_lod_{lod}",
+        cache=False,
+        plugins=[PipenDiagram],
+        plugin_opts={"diagram_lod": lod, "diagram_loglevel": "debug"},
+        outdir=tmp_path / "pipen_lod",
+    )
+    pipen.set_start(pg.c).run()
+
+    svg = (pipen.outdir / "diagram.svg").read_text()
+    assert "cluster_LodGroup" not in svg
+    assert 'href="diagram.LodGroup.svg"' in svg
+    # rendered while the pipeline is running with lazy
+    detail = pipen.outdir / "diagram.LodGroup.svg"
+    assert f'<g id="proc_{pg.c.name}" class="node">' in detail.read_text()
+    dotfile = pipen.outdir / "diagram.LodGroup.dot"
+    if lod == "eager":
+        assert not dotfile.exists()
+    else:
+        assert "digraph LodGroup" in dotfile.read_text()
+
+
+def test_render_detail(tmp_path):
+    import asyncio
+    from pipen_diagram.lod import render_detail
+
+    dotfile = tmp_path / "diagram.PG.dot"
+    dotfile.write_text('digraph PG { "P1" -> "P2" }')
+    detail = tmp_path / "diagram.PG.svg"
+    assert asyncio.run(render_detail(str(dotfile))) == detail
+    assert '<g id="node1" class="node">' in detail.read_text()
+
+    # up to date
+    mtime = detail.stat().st_mtime
+    os.utime(dotfile, (mtime - 10, mtime - 10))
+    asyncio.run(render_detail(dotfile))
+    assert detail.stat().st_mtime == mtime
+    os.utime(detail, (mtime - 20, mtime - 20))
+    asyncio.run(render_detail(dotfile, force=True))
+    assert detail.stat().st_mtime > mtime - 20
+
+    # a newer source is rendered again
+    os.utime(detail, (mtime - 20, mtime - 20))
+    asyncio.run(render_detail(dotfile))
+    assert detail.stat().st_mtime > mtime - 20
+
+    assert asyncio.run(render_detail(dotfile, force=True, minify=True)) == detail
+    assert "<!--" not in detail.read_text()
+
+
+def test_render_detail_main(tmp_path, capsys):
+    import gzip
+    from pipen_diagram.lod import main as lod_main
+
+    dotfiles = [tmp_path / "diagram.G1.dot", tmp_path / "diagram.G2.dot"]
+    for dotfile in dotfiles:
+        dotfile.write_text(f'digraph {dotfile.stem[8:]} {{ "P1" -> "P2" }}')
+
+    lod_main([str(dotfile) for dotfile in dotfiles] + ["--minify", "gzip"])
+    assert capsys.readouterr().out.splitlines() == [
+        str(tmp_path / "diagram.G1.svgz"),
+        str(tmp_path / "diagram.G2.svgz"),
+    ]
+    with gzip.open(tmp_path / "diagram.G1.svgz", "rt") as fin:
+        svg = fin.read()
+    assert "<title>G1</title>" in svg
+    assert "<!--" not in svg
+
+    lod_main([str(dotfiles[0]), "--format", "plain", "--engine", "neato"])
+    assert (tmp_path / "diagram.G1.plain").read_text().startswith("graph ")
+
+
+def test_minify_svg():
+    from pipen_diagram.minify import minify_svg
+
+    svg = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n'
+        "<!-- Generated by graphviz\n -->\n"
+        '<svg width="78pt" height="277pt"\n viewBox="0.00 0.00 78.00 277.00">\n'
+        '<g id="graph0" class="graph">\n<title>x</title>\n'
+        '<text xml:space="preserve" text-anchor="middle" x="35" y="-3.95" '
+        'font-size="14.00"> </text>\n'
+        '<g id="clust1" class="cluster">\n<title>cluster_G</title>\n</g>\n'
+        '<!-- a -->\n<g id="proc_a" class="node">\n<title>a</title>\n'
+        '<g id="a_proc_a"><a xlink:title="A  tip">\n'
+        '<ellipse fill="none" stroke="black" cx="35.04" cy="-200.5" rx="27"/>\n'
+        "</a>\n</g>\n</g>\n"
+        '<g id="proc_b" class="node">\n<title>b</title>\n'
+        '<ellipse fill="none" stroke="black" cx="35" cy="-128.54" rx="27"/>\n'
+        "</g>\n"
+        '<g id="edge1" class="edge">\n<title>a&#45;&gt;b</title>\n'
+        '<path fill="none" stroke="black" d="M35,-182.21C35,-174.91"/>\n'
+        "</g>\n</g>\n</svg>\n"
+    )
+    # the result does not depend on how the document is chunked
+    out = "".join(minify_svg([svg]))
+    assert "".join(minify_svg(svg)) == out
+    assert out == (
+        '<?xml version="1.0" encoding="UTF-8" standalone="no"?>'
+        '<svg width="78pt" height="277pt" viewBox="0 0 78 277">'
+        '<g id="graph0" class="graph"><title>x</title>'
+        '<text xml:space="preserve" x="35" y="-4" class="c0"> </text>'
+        '<g id="clust1" class="cluster"></g>'
+        '<g id="proc_a" class="node">'
+        '<g id="a_proc_a"><a xlink:title="A  tip">'
+        '<ellipse cx="35" cy="-200.5" rx="27" class="c1"/></a></g></g>'
+        '<g id="proc_b" class="node"><title>b</title>'
+        '<ellipse cx="35" cy="-128.5" rx="27" class="c1"/></g>'
+        '<g id="edge1" class="edge"><path d="M35,-182.2C35,-174.9" class="c1"/></g>'
+        "</g><style>.c0{text-anchor:middle;font-size:14px}"
+        ".c1{fill:none;stroke:black}</style></svg>"
+    )
+
+
+@pytest.mark.forked
+@pytest.mark.parametrize("minify", [True, "gzip"])
+def test_minify(tmp_path, minify):
+    import asyncio
+    import gzip
+    from pipen_diagram.diagram import Diagram
+
+    p1 = Proc.from_proc(NormalProc, name="P1", input_data=[1])
+    p2 = Proc.from_proc(NormalProc, name="P2")
+    diagram = Diagram(
+        "pipeline",
+        PanPath(tmp_path) / "diagram",
+        savedot=False,
+        minify=minify,
+    )
+    diagram.add_node(p1, role="start")
+    diagram.add_node(p2, role="end")
+    diagram.add_edge(p1, p2)
+    diagram.build()
+    asyncio.run(diagram.save())
+
+    if minify == "gzip":
+        assert not (tmp_path / "diagram.svg").exists()
+        with gzip.open(tmp_path / "diagram.svgz", "rt") as fin:
+            svg = fin.read()
+    else:
+        svg = (tmp_path / "diagram.svg").read_text()
+    assert "<!--" not in svg
+    assert "<style>.c0{" in svg
+    assert '<g id="proc_P1" class="node">' in svg
+    minified = diagram.stats["minify"]
+    assert 0 < minified["after"] < minified["before"]
+
+
+@pytest.mark.forked
+def test_skip_unchanged(tmp_path, monkeypatch):
+    from pipen_diagram import diagram
+
+    p1 = Proc.from_proc(NormalProc, input_data=[1])
+    p2 = Proc.from_proc(NormalProc, requires=p1)
+
+    def run(**opts):
+        Pipen(
+            name="pipeline_skip",
+            cache=False,
+            plugins=[PipenDiagram],
+            plugin_opts={"diagram_loglevel": "debug", **opts},
+            outdir=tmp_path / "pipen_skip",
+            workdir=tmp_path / "workdir",
+        ).set_starts(p1).run()
+
+    run()
+    outdir = tmp_path / "pipen_skip"
+    svgfile = outdir / "diagram.svg"
+    fpfile = tmp_path / "workdir" / "pipeline_skip" / ".diagram_fingerprint"
+    fingerprint = fpfile.read_text()
+    # nothing but the diagram in the output directory, the cache is shared
+    assert [path.name for path in outdir.glob(".*")] == []
+    assert len(list((tmp_path / "cache" / "pipen-diagram").glob("*.svg"))) == 1
+    mtime = svgfile.stat().st_mtime
+
+    class NoDiagram:
+        def __init__(self, *args, **kwargs):
+            raise AssertionError("diagram should not be built when unchanged")
+
+    monkeypatch.setattr(diagram, "Diagram", NoDiagram)
+    # options not affecting the output
+    run(diagram_stats_loglevel="info")
+    assert svgfile.stat().st_mtime == mtime
+
+    monkeypatch.undo()
+    run(diagram_theme="dark")
+    assert fpfile.read_text() != fingerprint
+    assert "#333333" in svgfile.read_text()
+
+    # regenerated if the diagram is removed
+    svgfile.unlink()
+    run(diagram_theme="dark")
+    assert svgfile.exists()
+
+
+@pytest.mark.forked
+def test_skip_unchanged_outputs(tmp_path):
+    pg = PG()
+    outdir = tmp_path / "pipen_skip_outputs"
+
+    def run():
+        pipen = Pipen(
+            name="pipeline_skip_outputs",
+            cache=False,
+            plugins=[PipenDiagram],
+            plugin_opts={
+                "diagram_loglevel": "debug",
+                "diagram_formats": ["svg", "dot"],
+                "diagram_lod": "eager",
+            },
+            outdir=outdir,
+        )
+        try:
+            pipen.set_start(pg.c).run()
+        except Exception:  # no input for the group
+            pass
+
+    run()
+    second = outdir / "diagram.dot"
+    detail = outdir / "diagram.PG.svg"
+    assert second.exists() and detail.exists()
+    mtime = (outdir / "diagram.svg").stat().st_mtime
+    run()
+    assert (outdir / "diagram.svg").stat().st_mtime == mtime
+
+    # any of the files saved removed
+    second.unlink()
+    detail.unlink()
+    run()
+    assert second.exists()
+    assert detail.exists()
+
+
+def test_renderer(tmp_path):
+    import asyncio
+    from pipen_diagram.renderer import Renderer
+
+    logfile = tmp_path / "running.log"
+    # log the start and the end of each run, and echo the source
+    cmd = ["sh", "-c", f"echo + >> {logfile}; sleep 0.1; cat; echo - >> {logfile}"]
+    renderer = Renderer(workers=2, maxsize=3)
+
+    async def main():
+        return await asyncio.gather(
+            *(renderer.render(cmd, "same") for _ in range(3)),
+            *(renderer.render(cmd, f"src{i}") for i in range(4)),
+        )
+
+    outs = asyncio.run(main())
+    assert outs == [b"same"] * 3 + [f"src{i}".encode() for i in range(4)]
+    assert renderer.stats["submitted"] == 5
+    assert renderer.stats["deduped"] == 2
+    assert renderer.stats["waited"] > 0
+
+    running = max_running = 0
+    for line in logfile.read_text().split():
+        running += 1 if line == "+" else -1
+        max_running = max(max_running, running)
+    assert max_running == 2
+
+    renderer.shutdown()
+    with pytest.raises(Exception, match="exit status 1"):
+        asyncio.run(renderer.render(["sh", "-c", "exit 1"], ""))
+    renderer.shutdown()
+
+
+def test_renderer_waiters():
+    import asyncio
+    from pipen_diagram.renderer import Renderer
+
+    renderer = Renderer(workers=1, maxsize=1)
+    cmd = ["sh", "-c", "sleep 0.2; cat"]
+
+    async def main():
+        first = asyncio.ensure_future(renderer.render(cmd, "first"))
+        await asyncio.sleep(0)
+        cancelled = asyncio.ensure_future(renderer.render(cmd, "cancelled"))
+        last = asyncio.ensure_future(renderer.render(cmd, "last"))
+        await asyncio.sleep(0.05)
+        # the slot is not taken by the cancelled waiter
+        cancelled.cancel()
+        return await asyncio.gather(first, last)
+
+    assert asyncio.run(main()) == [b"first", b"last"]
+    assert renderer.stats["waited"] == 2
+    assert renderer.stats["submitted"] == 2
+    # the slot is freed
+    out = asyncio.run(asyncio.wait_for(renderer.render(["cat"], "x"), 5))
+    assert out == b"x"
+    renderer.shutdown()
+
+
+def test_renderer_fork():
+    import asyncio
+    from pipen_diagram import renderer
+
+    # the pool is started in the parent
+    asyncio.run(renderer.RENDERER.render(["cat"], "parent"))
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover, in the child
+        out = asyncio.run(
+            asyncio.wait_for(renderer.RENDERER.render(["cat"], "child"), 10)
+        )
+        os._exit(0 if out == b"child" else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+
+@pytest.mark.forked
+def test_model(tmp_path, monkeypatch):
+    import json
+    from pipen_diagram.diagram import Diagram
+
+    async def render(*args, **kwargs):
+        raise AssertionError("dot should not run to export the model")
+
+    monkeypatch.setattr(Diagram, "_render", render)
+
+    pg = PG()
+    p1 = Proc.from_proc(NormalProc, name="P1", input_data=[1])
+    p2 = Proc.from_proc(HiddenProc, name="P2", requires=p1)
+    p3 = Proc.from_proc(NormalProc, name="P3", requires=p2)
+    pipen = Pipen(
+        name="pipeline_model",
+        cache=False,
+        plugins=[PipenDiagram],
+        plugin_opts={
+            "diagram_formats": ["model"],
+            "diagram_collapse_groups": True,
+        },
+        outdir=tmp_path / "pipen_model",
+    )
+    try:
+        pipen.set_starts(p1, pg.c).run()
+    except Exception:  # no input for the group
+        pass
+
+    assert not (pipen.outdir / "diagram.svg").exists()
+    text = (pipen.outdir / "diagram.model.json").read_text()
+    assert ", " not in text
+    model = json.loads(text)
+    assert model["version"] == 1
+    assert model["name"] == "pipeline_model"
+    nodes = {node["name"]: node for node in model["nodes"]}
+    assert nodes["P1"] == {
+        "name": "P1",
+        "role": "start",
+        "group": None,
+        "tooltip": "",
+        "hidden": False,
+    }
+    assert nodes["P2"]["hidden"] is True
+    assert nodes["P3"]["role"] == "end"
+    assert nodes[pg.c1.name]["hidden"] is True
+    assert nodes[pg.d.name]["group"] == "PG"
+    assert "PG" not in nodes  # the summary node of the collapsed group
+    edges = {(edge["from"], edge["to"]): edge for edge in model["edges"]}
+    assert edges[("P1", "P3")]["has_hidden"] is True
+    assert edges[(pg.c.name, pg.c2.name)] == {
+        "from": pg.c.name,
+        "to": pg.c2.name,
+        "has_hidden": True,
+        "group": "PG",
+    }
+    assert model["groups"] == [
+        {
+            "name": "PG",
+            "collapsed": True,
+            "nodes": model["groups"][0]["nodes"],
+        }
+    ]
+    assert sorted(model["groups"][0]["nodes"]) == sorted(
+        [pg.c.name, pg.c2.name, pg.d.name]
+    )
+
+
+def test_model_msgpack(tmp_path):
+    import asyncio
+    from pipen_diagram.diagram import Diagram
+
+    msgpack = pytest.importorskip("msgpack")
+    p1 = Proc.from_proc(NormalProc, name="P1", input_data=[1])
+    p2 = Proc.from_proc(NormalProc, name="P2")
+    diagram = Diagram(
+        "pipeline",
+        PanPath(tmp_path) / "diagram",
+        savedot=False,
+        formats=["msgpack"],
+    )
+    diagram.add_node(p1, role="start")
+    diagram.add_node(p2, role="end")
+    diagram.add_edge(p1, p2)
+    diagram.build()
+    asyncio.run(diagram.save())
+    model = msgpack.unpackb((tmp_path / "diagram.model.msgpack").read_bytes())
+    assert model["name"] == "pipeline"
+    assert [node["name"] for node in model["nodes"]] == ["P1", "P2"]
+    assert model["edges"] == [
+        {"from": "P1", "to": "P2", "has_hidden": False, "group": None}
+    ]
+
+
+def test_importtime():
+    import subprocess
+    import sys
+
+    out = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            # pipen is imported first, to measure the plugin only
+            "import pipen; import pipen_diagram",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    modules = {}
+    for line in out.splitlines()[1:]:
+        _, cumulative, module = line.split("|")
+        modules[module.strip()] = int(cumulative)
+
+    assert "pipen_diagram.entry" in modules
+    # deferred until a diagram is built
+    for module in ("graphviz", "pipen_diagram.diagram", "pipen_diagram.cache"):
+        assert module not in modules
+    # in microseconds, generous for slow or busy machines
+    assert modules["pipen_diagram"] < 100_000
+
+
+def test_timings(tmp_path):
+    import asyncio
+    import os
+    from pipen_diagram.timings import (
+        Timing,
+        critical_path,
+        format_duration,
+        read_timings,
+    )
+
+    # job: (start, end), None for not finished
+    jobs = {
+        "A": [(0, 10), (5, 20), (100, 105)],
+        "B": [(20, 22), None],
+        "C": [(20, 50)],
+    }
+    for name, intervals in jobs.items():
+        for i, interval in enumerate(intervals):
+            jobdir = tmp_path / name / str(i)
+            jobdir.mkdir(parents=True)
+            (jobdir / "job.script").touch()
+            if interval is not None:
+                (jobdir / "job.wrapped.local").touch()
+                os.utime(jobdir / "job.wrapped.local", interval[:1] * 2)
+                (jobdir / "job.rc").touch()
+                os.utime(jobdir / "job.rc", interval[1:] * 2)
+    (tmp_path / "A" / "job.cache.json").touch()
+
+    timings = asyncio.run(
+        read_timings(PanPath(tmp_path), ["A", "B", "C", "D"], jobs=2)
+    )
+    assert timings == {
+        "A": Timing(3, 25.0),
+        "B": Timing(1, 2.0),
+        "C": Timing(1, 30.0),
+    }
+
+    a = Proc.from_proc(NormalProc, name="A")
+    b = Proc.from_proc(NormalProc, name="B", requires=a)
+    c = Proc.from_proc(NormalProc, name="C", requires=a)
+    d = Proc.from_proc(NormalProc, name="D", requires=[b, c])
+    assert critical_path([a, b, c, d], timings) == ([a, c, d], 55.0)
+    assert critical_path([], timings) == ([], 0.0)
+
+    assert format_duration(1.23) == "1.2s"
+    assert format_duration(185) == "3m05s"
+    assert format_duration(7620) == "2h07m"
+
+
+@pytest.mark.forked
+def test_critical_path(tmp_path):
+    import json
+
+    class Slow(NormalProc):
+        script = "sleep 0.5"
+
+    p1 = Proc.from_proc(NormalProc, name="P1", input_data=[1, 2])
+    p2 = Proc.from_proc(NormalProc, name="P2", requires=p1)
+    p3 = Proc.from_proc(HiddenProc, name="P3", requires=p1)
+    p4 = Proc.from_proc(Slow, name="P4", requires=p3)
+    p5 = Proc.from_proc(NormalProc, name="P5", requires=[p2, p4])
+
+    def run():
+        pipen = Pipen(
+            name="pipeline_timings",
+            cache=False,
+            plugins=[PipenDiagram],
+            plugin_opts={
+                "diagram_timings": True,
+                "diagram_savedot": True,
+                "diagram_stats": True,
+            },
+            outdir=tmp_path / "pipen_timings",
+            workdir=tmp_path / "workdir",
+        )
+        pipen.set_starts(p1).run()
+        return pipen
+
+    pipen = run()
+    # nothing from the first run
+    stats = json.loads((pipen.outdir / "diagram.stats.json").read_text())
+    assert stats["critical_path"]["wall"] == 0
+
+    pipen = run()
+    stats = json.loads((pipen.outdir / "diagram.stats.json").read_text())
+    assert stats["critical_path"]["procs"] == ["P1", "P3", "P4", "P5"]
+    assert stats["critical_path"]["wall"] > 0.5
+
+    dot = (pipen.outdir / "diagram.dot").read_text()
+    assert 'P1 [label="P1\n' in dot
+    assert "s, 2 jobs" in dot
+    # the critical path, with the time of P3 on the dashed edge
+    assert 'P1 -> P4 [label="+' in dot
+    assert 's" color="#ef476f" penwidth=2.5 style=dashed]' in dot
+    assert 'P4 -> P5 [color="#ef476f" penwidth=2.5]' in dot
+    assert "P1 -> P2 [color" not in dot
+
+
+def test_volumes(tmp_path):
+    import asyncio
+    from pipen_diagram.volumes import (
+        Volume,
+        format_size,
+        metric_values,
+        read_volumes,
+    )
+    from pipen_diagram.timings import Timing
+
+    workdir = tmp_path / "workdir"
+    data = tmp_path / "data"
+    data.mkdir()
+    for name, size in (("a.txt", 10), ("b.txt", 100), ("c.txt", 1000)):
+        (data / name).write_text("x" * size)
+
+    signatures = {
+        "A": [
+            ("a.txt", "b.txt"),
+            ("a.txt", "c.txt"),
+        ],
+        "B": [("b.txt", "gone.txt"), None],
+    }
+    for name, jobs in signatures.items():
+        for i, job in enumerate(jobs):
+            jobdir = workdir / name / str(i)
+            jobdir.mkdir(parents=True)
+            if job is None:
+                continue
+            infile, outfile = (str(data / path) for path in job)
+            (jobdir / "job.signature.toml").write_text(
+                "ctime = 1.0\n"
+                '[input.type]\na = "file"\nb = "var"\n'
+                f'[input.data]\na = "{infile}"\nb = "1"\n'
+                '[output.type]\nout = "files"\n'
+                f'[output.data]\nout = ["{outfile}"]\n'
+            )
+
+    volumes = asyncio.run(read_volumes(PanPath(workdir), ["A", "B", "C"], jobs=2))
+    assert volumes == {"A": Volume(2, 10, 1100), "B": Volume(1, 100, 0)}
+
+    assert metric_values("jobs", volumes) == {
+        "A": (2, "2 jobs"),
+        "B": (1, "1 job"),
+    }
+    assert metric_values("output_size", volumes)["A"] == (1100, "out 1.1KB")
+    assert metric_values("input_size", volumes)["B"] == (100, "in 100B")
+    assert metric_values("rate", volumes, {"A": Timing(2, 4.0)}) == {
+        "A": (0.5, "0.5 jobs/s")
+    }
+    with pytest.raises(ValueError, match="Unknown metric"):
+        metric_values("unknown", volumes)
+    assert format_size(3 * 1024**3) == "3.0GB"
+
+
+@pytest.mark.forked
+def test_annotate(tmp_path):
+    class Writer(Proc):
+        input = "a"
+        output = "outfile:file:{{in.a}}.txt"
+        script = "printf '%0{{in.a}}d' 0 > {{out.outfile}}"
+
+    class Reader(Proc):
+        input = "infile:file"
+
+    p1 = Proc.from_proc(Writer, name="P1", input_data=[10, 2000, 30])
+    p2 = Proc.from_proc(Writer, name="P2", input_data=[5])
+    p3 = Proc.from_proc(Reader, name="P3", requires=p1)
+    p4 = Proc.from_proc(Reader, name="P4", requires=p2)
+
+    def run(engine="dot"):
+        pipen = Pipen(
+            name="pipeline_annotate",
+            cache=False,
+            plugins=[PipenDiagram],
+            plugin_opts={
+                "diagram_annotate": "output_size",
+                "diagram_engine": engine,
+                "diagram_savedot": True,
+            },
+            outdir=tmp_path / "pipen_annotate",
+            workdir=tmp_path / "workdir",
+        )
+        pipen.set_starts(p1, p2).run()
+        return pipen
+
+    run()
+    pipen = run()
+    dot = (pipen.outdir / "diagram.dot").read_text()
+    assert 'P1 [label="P1\nout 2.0KB" id=proc_P1 penwidth=5.00' in dot
+    assert 'P2 [label="P2\nout 5B" id=proc_P2 penwidth=1.94' in dot
+    assert 'P3 [label="P3\nout 0B" id=proc_P3 penwidth=1.00' in dot
+    assert 'P1 -> P3 [penwidth=5.00 tooltip="3 items"]' in dot
+    assert 'P2 -> P4 [penwidth=3.00 tooltip="1 item"]' in dot
+
+    pipen = run("builtin")
+    assert 'stroke-width="5"' in (pipen.outdir / "diagram.svg").read_text()
+
+
+CLI_PIPELINE = """
+from pipen import Pipen, Proc
+
+
+class {prefix}A(Proc):
+    \"\"\"Process A\"\"\"
+    input = "a"
+    input_data = [1]
+
+
+class {prefix}B(Proc):
+    \"\"\"Process B\"\"\"
+    requires = {prefix}A
+    input = "b"
+
+
+pipeline = Pipen("{prefix}Pipeline", plugins=["diagram"]).set_start({prefix}A)
+"""
+
+
+@pytest.mark.forked
+def test_cli(tmp_path, capsys, monkeypatch):
+    from pipen_diagram.cli import main
+
+    monkeypatch.chdir(tmp_path)
+
+    for prefix in ("X", "Y"):
+        (tmp_path / f"{prefix}.py").write_text(CLI_PIPELINE.format(prefix=prefix))
+    specs = [f"{tmp_path / prefix}.py:pipeline" for prefix in ("X", "Y")]
+    outdir = tmp_path / "diagrams"
+
+    assert main([*specs, "--outdir", str(outdir), "--opt", "diagram_savedot=true"]) == 0
+    out = capsys.readouterr().out
+    for prefix in ("X", "Y"):
+        assert (outdir / f"{prefix}Pipeline" / "diagram.svg").is_file()
+        dot = (outdir / f"{prefix}Pipeline" / "diagram.dot").read_text()
+        assert f"{prefix}A" in dot and f"{prefix}B" in dot
+        assert f"{prefix}Pipeline{os.sep}diagram.svg\n" in out
+    # not running the pipelines
+    assert not (tmp_path / ".pipen" / "XPipeline" / "XA").exists()
+
+    # unchanged, skipped
+    assert main([*specs, "--outdir", str(outdir), "--opt", "diagram_savedot=true"]) == 0
+    assert capsys.readouterr().out.count("(unchanged)") == 2
+
+    # forced, and with other formats
+    assert main([specs[0], "--outdir", str(outdir), "--force", "--format", "png"]) == 0
+    assert "(unchanged)" not in capsys.readouterr().out
+    assert (outdir / "XPipeline" / "diagram.png").is_file()
+
+    # failed
+    assert main([f"{tmp_path / 'X'}.py:nope", "--outdir", str(outdir)]) == 1
+    assert "failed" in capsys.readouterr().err
+
+
+def test_cli_opts():
+    import argparse
+    from pipen_diagram.cli import _plugin_opts, add_arguments
+
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args(
+        [
+            "x:y",
+            "--theme",
+            "dark",
+            "--opt",
+            "diagram_lod=eager",
+            "--opt",
+            'diagram_collapse_groups=["G"]',
+        ]
+    )
+    assert _plugin_opts(args) == {
+        "diagram_lod": "eager",
+        "diagram_collapse_groups": ["G"],
+        "diagram_theme": "dark",
+        "diagram_live": False,
+        "diagram_background": False,
+    }
+
+    args = parser.parse_args(["x:y", "--opt", "diagram_lod"])
+    with pytest.raises(ValueError, match="KEY=VALUE"):
+        _plugin_opts(args)
+
+
+@pytest.mark.forked
+def test_cli_watch(tmp_path, capsys, monkeypatch):
+    import argparse
+    import asyncio
+    from pipen_diagram.cli import add_arguments, watch
+
+    monkeypatch.chdir(tmp_path)
+
+    source = tmp_path / "W.py"
+    source.write_text(CLI_PIPELINE.format(prefix="W"))
+    outdir = tmp_path / "diagrams"
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args(
+        [f"{source}:pipeline", "--outdir", str(outdir), "--interval", "0.05"]
+    )
+
+    async def _watch():
+        task = asyncio.create_task(watch(args.pipelines, args))
+        await asyncio.sleep(0.2)
+        assert not outdir.exists()
+        source.write_text(CLI_PIPELINE.format(prefix="W") + "\n# changed\n")
+        os.utime(source, (0, 0))
+        for _ in range(100):
+            await asyncio.sleep(0.05)
+            if (outdir / "WPipeline" / "diagram.svg").is_file():
+                break
+        task.cancel()
+
+    asyncio.run(_watch())
+    assert (outdir / "WPipeline" / "diagram.svg").is_file()
+    assert "WPipeline" in capsys.readouterr().out
+
+
+def test_diff(tmp_path, capsys, monkeypatch):
+    import asyncio
+    import json
+    from pipen_diagram import renderer
+    from pipen_diagram.diagram import Diagram
+    from pipen_diagram.diff import (
+        _layout_file,
+        diff_models,
+        diff_source,
+        load_model,
+        main,
+        render_diff,
+    )
+
+    class DiffA(Proc):
+        """Process A"""
+
+    class DiffB(Proc):
+        """Process B"""
+
+    class DiffC(Proc):
+        """Process C"""
+
+    class DiffD(Proc):
+        """Process D"""
+
+    group = MagicMock()
+    group.name = "G"
+
+    def _diagram(name, nodes, edges):
+        diagram = Diagram(
+            name,
+            PanPath(tmp_path / name / "diagram"),
+            savedot=True,
+            formats=["model"],
+        )
+        for node, in_group, role in nodes:
+            diagram.add_node(node, group if in_group else None, role)
+        for node1, node2, in_group, has_hidden in edges:
+            diagram.add_edge(node1, node2, group if in_group else None, has_hidden)
+        diagram.build()
+        asyncio.run(diagram.save())
+        return diagram
+
+    old = _diagram(
+        "old",
+        [(DiffA, False, "start"), (DiffB, True, None), (DiffC, False, "end")],
+        [(DiffA, DiffB, False, False), (DiffB, DiffC, False, False)],
+    )
+    new = _diagram(
+        "new",
+        [
+            (DiffA, False, "start"),
+            (DiffB, True, "end"),
+            (DiffD, True, "end"),
+        ],
+        [(DiffA, DiffB, False, True), (DiffA, DiffD, False, False)],
+    )
+
+    diff = diff_models(load_model(old), load_model(new))
+    assert diff.nodes.added == ["DiffD"]
+    assert diff.nodes.removed == ["DiffC"]
+    assert diff.nodes.changed == ["DiffB"]  # role
+    assert diff.edges.added == [("DiffA", "DiffD")]
+    assert diff.edges.removed == [("DiffB", "DiffC")]
+    assert diff.edges.changed == [("DiffA", "DiffB")]  # has_hidden
+    assert diff.groups.changed == ["G"]
+    assert diff.summary() == "nodes +1 -1 ~1, edges +1 -1 ~1, groups +0 -0 ~1"
+    assert not diff_models(load_model(old), load_model(old))
+
+    # the same from the model files
+    oldmodel = tmp_path / "old" / "diagram.model.json"
+    newmodel = tmp_path / "new" / "diagram.model.json"
+    assert load_model(oldmodel) == load_model(old)
+    assert diff_models(load_model(oldmodel), load_model(newmodel)) == diff
+    # the roles and the hidden processes are not known from the DOT files
+    olddot, newdot = tmp_path / "old" / "diagram.dot", tmp_path / "new" / "diagram.dot"
+    dotdiff = diff_models(load_model(olddot), load_model(newdot))
+    assert dotdiff.nodes == (["DiffD"], ["DiffC"], [])
+    assert dotdiff.edges[:2] == diff.edges[:2]
+    assert load_model(olddot)["groups"] == {"G": {"nodes": {"DiffB"}}}
+
+    outfile = tmp_path / "diagram.diff.svg"
+    assert asyncio.run(render_diff(old, new, outfile)) == diff
+    svg = outfile.read_text()
+    for title in ("DiffA", "DiffB", "DiffC", "DiffD"):
+        assert f"<title>{title}</title>" in svg
+    for color in ("#06d6a0", "#ef476f", "#ffb703"):
+        assert color in svg
+    # nothing pinned, laid out by dot with the group
+    assert "<title>cluster_G</title>" in svg
+
+    assert _layout_file(old) == PanPath(tmp_path / "old" / "diagram.layout.json")
+    for source in ("diagram.dot", "diagram.model.json", "diagram.model.msgpack"):
+        assert _layout_file(tmp_path / source) == PanPath(
+            tmp_path / "diagram.layout.json"
+        )
+    assert _layout_file(tmp_path / "diagram.G1.dot") == PanPath(
+        tmp_path / "diagram.G1.layout.json"
+    )
+
+    # the small diagrams pinned from the saved layout of the old diagram
+    (tmp_path / "old" / "diagram.layout.json").write_text(
+        json.dumps(
+            {
+                "version": 1,
+                "nodes": {
+                    "DiffA": {"group": None, "pos": [27.0, 162.0]},
+                    "DiffB": {"group": "G", "pos": [27.0, 90.0]},
+                    "DiffC": {"group": None, "pos": [27.0, 18.0]},
+                },
+                "edges": [["DiffA", "DiffB"], ["DiffB", "DiffC"]],
+            }
+        )
+    )
+    renders = []
+    render = renderer.RENDERER.render
+
+    async def _render(cmd, source):
+        renders.append((cmd, source))
+        return await render(cmd, source)
+
+    monkeypatch.setattr(renderer.RENDERER, "render", _render)
+    asyncio.run(render_diff(old, new, outfile))
+    cmd, source = renders[-1]
+    assert "-Kneato" in cmd
+    assert 'pos="27.00,162.00!"' in source
+    assert "<title>cluster_G</title>" in outfile.read_text()
+    monkeypatch.undo()
+    (tmp_path / "old" / "diagram.layout.json").unlink()
+
+    # pinned positions
+    source = diff_source(
+        "new",
+        load_model(old),
+        load_model(new),
+        diff,
+        positions={"DiffA": (72, 144), "DiffB": (72, 72)},
+        pinned=["DiffA"],
+    )
+    assert 'pos="72.00,144.00!"' in source
+    assert 'pos="72.00,72.00"' in source
+    assert "(removed)" in source and "(changed: role)" in source
+
+    main([str(olddot), str(newmodel), "-o", str(outfile), "--local-above", "0"])
+    assert capsys.readouterr().out == f"{outfile}: {dotdiff.summary()}\n"
+
+
+def _layout_diagram(tmp_path, nodes, edges, groups=None, **kwargs):
+    """Build a diagram of the processes named, with the edges by the names,
+    and the groups of the processes by the names"""
+    from pipen_diagram.diagram import Diagram
+
+    procs = {
+        name: type(name, (Proc,), {"__doc__": f"Process {name}"})
+        for name in nodes
+    }
+    diagram = Diagram(
+        "layout",
+        PanPath(tmp_path / "diagram"),
+        savedot=True,
+        **kwargs,
+    )
+    groups = groups or {}
+    mocks = {}
+    for group in groups.values():
+        mocks[group] = MagicMock()
+        mocks[group].name = group
+    for name in nodes:
+        diagram.add_node(procs[name], mocks.get(groups.get(name)))
+    for name1, name2 in edges:
+        group = groups.get(name1) if groups.get(name1) == groups.get(name2) else None
+        diagram.add_edge(procs[name1], procs[name2], mocks.get(group))
+    return diagram
+
+
+def test_sorted_emission(tmp_path):
+    from pipen_diagram.model import model_dict
+
+    diagram = _layout_diagram(
+        tmp_path,
+        ["SortC", "SortA", "SortB"],
+        [("SortC", "SortB"), ("SortA", "SortC"), ("SortA", "SortB")],
+    )
+    diagram.build()
+    lines = diagram.graph.source.splitlines()
+    nodes = [line.split()[0] for line in lines if "[id=" in line]
+    edges = [line.split()[:3] for line in lines if " -> " in line]
+    assert nodes == ["SortA", "SortB", "SortC"]
+    assert edges == [
+        ["SortA", "->", "SortB"],
+        ["SortA", "->", "SortC"],
+        ["SortC", "->", "SortB"],
+    ]
+    assert [edge["from"] + edge["to"] for edge in model_dict(diagram)["edges"]] == [
+        "SortASortB",
+        "SortASortC",
+        "SortCSortB",
+    ]
+
+
+def test_pin():
+    from pipen_diagram.layout import pin
+
+    layout = {
+        "nodes": {
+            "A": {"group": None, "pos": [10.0, 200.0]},
+            "B": {"group": None, "pos": [10.0, 128.0]},
+            "C": {"group": None, "pos": [10.0, 56.0]},
+            "D": {"group": None, "pos": [100.0, 56.0]},
+        },
+        "edges": [["A", "B"], ["B", "C"], ["B", "D"]],
+    }
+    nodes = {"A": None, "B": None, "C": None, "D": None}
+    edges = [("A", "B"), ("B", "C"), ("B", "D")]
+    # nothing changed, laid out the same as last time
+    assert pin(layout, nodes, edges) == {}
+    # the others stay where they were
+    assert pin(layout, {"A": None, "B": None, "C": None}, edges[:2]) == {
+        "A": "10.00,200.00!",
+        "B": "10.00,128.00!",
+        "C": "10.00,56.00!",
+    }
+    # a new node below its upstream node, beside the nodes there
+    assert pin(layout, {**nodes, "E": None}, [*edges, ("B", "E")])["E"] == (
+        "226.00,56.00"
+    )
+    # moved to a group
+    assert pin(layout, {**nodes, "C": "G"}, edges)["C"] == "10.00,56.00"
+    # newly connected
+    positions = pin(layout, nodes, [*edges, ("C", "D")])
+    assert positions["C"] == "10.00,56.00" and positions["D"] == "100.00,56.00"
+    assert positions["A"].endswith("!")
+    # too much changed
+    assert pin(layout, {"A": None, "X": None, "Y": None}, [("X", "Y")]) is None
+    # nothing changed since laid out with the pinned nodes, all pinned again
+    assert pin({**layout, "pinned": True}, nodes, edges) == {
+        "A": "10.00,200.00!",
+        "B": "10.00,128.00!",
+        "C": "10.00,56.00!",
+        "D": "100.00,56.00!",
+    }
+
+
+def test_reuse_layout(tmp_path):
+    import asyncio
+    import json
+
+    chain = ["LayA", "LayB", "LayC", "LayD", "LayE"]
+    edges = list(zip(chain, chain[1:]))
+
+    def _save(nodes, edges, **kwargs):
+        diagram = _layout_diagram(tmp_path, nodes, edges, reuse_layout=True, **kwargs)
+
+        async def _run():
+            await diagram.load_layout()
+            diagram.build()
+            await diagram.save()
+
+        asyncio.run(_run())
+        return (
+            diagram,
+            (tmp_path / "diagram.svg").read_bytes(),
+            json.loads((tmp_path / "diagram.layout.json").read_text()),
+        )
+
+    diagram, svg, layout = _save(chain, edges)
+    assert diagram.stats["counts"]["pinned"] == 0
+    assert sorted(layout["nodes"]) == chain
+    assert layout["edges"] == [list(edge) for edge in edges]
+
+    # nothing changed, laid out by dot the same as last time
+    diagram, svg2, layout2 = _save(chain, edges)
+    assert diagram.stats["counts"]["pinned"] == 0
+    assert diagram.graph.engine == "dot"
+    assert 'pos="' not in diagram.graph.source
+    assert svg2 == svg
+    assert layout2 == layout
+
+    # only the new node is laid out
+    diagram, svg, layout = _save([*chain, "LayF"], [*edges, ("LayB", "LayF")])
+    assert diagram.stats["counts"]["pinned"] == 5
+    assert diagram.graph.engine == "neato"
+    assert "<title>LayF</title>" in svg.decode()
+    assert "LayF" in layout["nodes"]
+    assert layout["pinned"] is True
+
+    # nothing changed since, all pinned where they were, byte-stable
+    svgs = []
+    for _ in range(3):
+        diagram, svg, layout2 = _save([*chain, "LayF"], [*edges, ("LayB", "LayF")])
+        assert diagram.stats["counts"]["pinned"] == 6
+        assert diagram.graph.engine == "neato"
+        assert layout2 == layout
+        svgs.append(svg)
+    assert svgs[1] == svgs[0] and svgs[2] == svgs[0]
+
+    # the groups are still drawn as clusters with the pinned positions
+    groups = {"LayC": "G", "LayD": "G"}
+    _save([*chain, "LayF"], [*edges, ("LayB", "LayF")], groups=groups)
+    diagram, svg, _ = _save(
+        [*chain, "LayF", "LayG"],
+        [*edges, ("LayB", "LayF"), ("LayC", "LayG")],
+        groups={**groups, "LayG": "G"},
+    )
+    assert diagram.graph.engine == "neato"
+    assert diagram.stats["counts"]["pinned"] > 0
+    assert b"<title>cluster_G</title>" in svg
+
+    # laid out from scratch
+    diagram, _, _ = _save(["LayX", "LayY"], [("LayX", "LayY")])
+    assert diagram.stats["counts"]["pinned"] == 0
+    assert diagram.graph.engine == "dot"
+
+
+@pytest.mark.forked
+def test_reuse_layout_option(tmp_path):
+    import json
+
+    p1 = Proc.from_proc(NormalProc, input_data=[1])
+    p2 = Proc.from_proc(NormalProc, requires=p1)
+    outdir = tmp_path / "pipen_layout"
+
+    def run():
+        Pipen(
+            name="pipeline_layout",
+            cache=False,
+            plugins=[PipenDiagram],
+            plugin_opts={
+                "diagram_loglevel": "debug",
+                "diagram_reuse_layout": True,
+                "diagram_skip_unchanged": False,
+                "diagram_stats": True,
+            },
+            outdir=outdir,
+        ).set_starts(p1).run()
+        return json.loads((outdir / "diagram.stats.json").read_text())
+
+    assert run()["counts"]["pinned"] == 0
+    layout = (outdir / "diagram.layout.json").read_text()
+    svg = (outdir / "diagram.svg").read_bytes()
+    # a cache hit, and the layout is saved again from the cache
+    (outdir / "diagram.layout.json").unlink()
+    stats = run()
+    assert stats["counts"]["pinned"] == 0
+    assert stats["cache_hits"] == ["svg"]
+    assert (outdir / "diagram.layout.json").read_text() == layout
+    assert (outdir / "diagram.svg").read_bytes() == svg